@@ -0,0 +1,71 @@
+"""
+Microbenchmark del serializador precompilado frente al camino anterior
+(to_dict genérico + json.dumps). Uso:
+
+    python -m benchmarks.bench_serializers --rows 50000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from src.models.reserva import Reserva
+from src.models.guia import Guia
+from src.serializers import JSON_BACKEND, serializer_for
+
+
+def to_dict_anterior(obj):
+    # Copia de la implementación que tenía function_app.py
+    if obj is None:
+        return None
+    dict_obj = {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
+    for key, value in list(dict_obj.items()):
+        if isinstance(value, datetime):
+            dict_obj[key] = value.isoformat()
+        elif value is None:
+            dict_obj[key] = None
+    return dict_obj
+
+
+def filas(modelo, n):
+    inicio = datetime(2025, 1, 1)
+    if modelo is Reserva:
+        return [Reserva(id=i, fecha=inicio + timedelta(hours=i), destino_id=i % 100) for i in range(n)]
+    return [Guia(id=i, nombre=f"Guia {i}", f_nacimiento=inicio, genero_id=1) for i in range(n)]
+
+
+def medir(nombre, fn, datos, repeticiones):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn(datos)
+        mejor = min(mejor, time.perf_counter() - t0)
+    return {"caso": nombre, "filas_por_segundo": round(len(datos) / mejor)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    resultados = []
+    for modelo in (Reserva, Guia):
+        datos = filas(modelo, args.rows)
+        dump = serializer_for(modelo).dumps
+        anterior = medir(
+            f"{modelo.__name__} to_dict + json.dumps",
+            lambda d: json.dumps([to_dict_anterior(x) for x in d], default=str), datos, args.repeat
+        )
+        nuevo = medir(
+            f"{modelo.__name__} serializer ({JSON_BACKEND})",
+            lambda d: "[" + ",".join(dump(x) for x in d) + "]", datos, args.repeat
+        )
+        nuevo["aceleracion"] = round(nuevo["filas_por_segundo"] / anterior["filas_por_segundo"], 2)
+        resultados.extend([anterior, nuevo])
+
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Generador de un conjunto de datos turístico sintético sobre las 14 tablas
+del modelo. Es determinista para una misma semilla, de modo que dos
+ejecuciones de benchmark sobre commits distintos leen los mismos datos. Uso:
+
+    python -m benchmarks.dataset --database sqlite:////tmp/turismo.sqlite --scale 2
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+
+# Filas por tabla con --scale 1, en orden de dependencias de las FK
+VOLUMENES = {
+    "pais": 20,
+    "ciudad": 200,
+    "destino": 1000,
+    "genero": 3,
+    "idioma": 10,
+    "usuario": 1000,
+    "cliente": 500,
+    "guia": 200,
+    "guia_idioma": 400,
+    "reserva": 5000,
+    "reserva_guia": 5000,
+    "reserva_usuario": 5000,
+    "guia_calificacion": 2000,
+    "destino_calificacion": 2000,
+}
+
+# Tamaño de cada INSERT por lotes
+BLOQUE = 5000
+
+_INICIO = datetime(2024, 1, 1)
+_COMENTARIOS = ("Excelente", "Muy bueno", "Correcto", "Mejorable", "Sin comentarios")
+
+
+def volumenes(escala=1.0, **exactos):
+    """Filas por tabla multiplicadas por `escala`; `exactos` fija tablas concretas."""
+    resultado = {tabla: max(1, int(n * escala)) for tabla, n in VOLUMENES.items()}
+    resultado.update(exactos)
+    return resultado
+
+
+def fila(tabla, i, rng, vol):
+    """
+    Fila sintética número `i` (base 0) de `tabla`, sin clave primaria. Las FK
+    apuntan a ids existentes (1..vol[tabla_destino]) y los valores únicos
+    (usuario.usuario, cliente.usuario_id) se derivan de `i`.
+    """
+    def fk(destino):
+        return rng.randint(1, vol[destino])
+
+    if tabla == "pais":
+        return {"nombre": f"Pais {i}"}
+    if tabla == "ciudad":
+        return {"nombre": f"Ciudad {i}", "pais_id": fk("pais")}
+    if tabla == "destino":
+        return {"nombre": f"Destino {i}", "ciudad_id": fk("ciudad"), "descripcion": f"Descripción del destino {i}"}
+    if tabla == "genero":
+        return {"nombre": f"Genero {i}"}
+    if tabla == "idioma":
+        return {"nombre": f"Idioma {i}"}
+    if tabla == "usuario":
+        return {"usuario": f"usuario{i}", "contrasena": f"clave{i}"}
+    if tabla == "cliente":
+        return {"nombre": f"Cliente {i}", "usuario_id": i % vol["usuario"] + 1}
+    if tabla == "guia":
+        return {
+            "nombre": f"Guia {i}",
+            "f_nacimiento": _INICIO - timedelta(days=rng.randint(20 * 365, 60 * 365)),
+            "genero_id": fk("genero"),
+        }
+    if tabla == "guia_idioma":
+        return {"guia_id": fk("guia"), "idioma_id": fk("idioma")}
+    if tabla == "reserva":
+        return {"fecha": _INICIO + timedelta(hours=rng.randint(0, 2 * 365 * 24)), "destino_id": fk("destino")}
+    if tabla == "reserva_guia":
+        return {"reserva_id": fk("reserva"), "guia_id": fk("guia")}
+    if tabla == "reserva_usuario":
+        return {"reserva_id": fk("reserva"), "usuario_id": fk("usuario")}
+    if tabla == "guia_calificacion":
+        return {
+            "comentario": rng.choice(_COMENTARIOS),
+            "calificacion": round(rng.uniform(1, 5), 1),
+            "usuario_id": fk("usuario"),
+            "guia_id": fk("guia"),
+        }
+    if tabla == "destino_calificacion":
+        return {
+            "fecha": _INICIO + timedelta(days=rng.randint(0, 2 * 365)),
+            "comentario": rng.choice(_COMENTARIOS),
+            "calificacion": round(rng.uniform(1, 5), 1),
+            "usuario_id": fk("usuario"),
+            "destino_id": fk("destino"),
+        }
+    raise KeyError(tabla)
+
+
+def sembrar(engine, vol, semilla=0):
+    """
+    Recrea el esquema y carga `vol` filas por tabla con INSERT por lotes.
+    Devuelve los segundos empleados por tabla.
+    """
+    from sqlalchemy.orm import Session
+
+    from src import models
+    from src.models.base import Base
+    from src.ratings import RatingAggregates
+
+    for nombre in models.__all__:
+        getattr(models, nombre)
+    tablas = Base.metadata.tables
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    rng = random.Random(semilla)
+    tiempos = {}
+    with engine.begin() as conexion:
+        for tabla, total in vol.items():
+            inicio = time.perf_counter()
+            for desde in range(0, total, BLOQUE):
+                filas = [
+                    dict(fila(tabla, i, rng, vol), id=i + 1)
+                    for i in range(desde, min(desde + BLOQUE, total))
+                ]
+                conexion.execute(insert(tablas[tabla]), filas)
+            tiempos[tabla] = round(time.perf_counter() - inicio, 4)
+
+        # El resumen de calificaciones se mantiene en cada flush; tras la carga masiva se calcula entero
+        inicio = time.perf_counter()
+        RatingAggregates().recalcular(Session(bind=conexion))
+        tiempos["calificacion_resumen"] = round(time.perf_counter() - inicio, 4)
+    return tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", required=True, help="URL SQLAlchemy de la base a (re)crear")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vol = volumenes(args.scale)
+    tiempos = sembrar(create_engine(args.database), vol, args.seed)
+    print(json.dumps({"filas": vol, "segundos": tiempos}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,524 @@
+"""
+Prueba de carga de todas las rutas de function_app sobre una base local
+sembrada con benchmarks.dataset. Cada handler se llama directamente con
+func.HttpRequest sintéticos (sin host de Functions) y se informa, por
+endpoint y nivel de concurrencia, el throughput, las latencias p50/p95/p99
+y el pico de RSS del proceso, en JSON comparable entre commits. Uso:
+
+    python -m benchmarks.load_test --scale 1 --requests 200 --concurrency 1,8 --output base.json
+    python -m benchmarks.load_test --writes --compare base.json
+
+Con API_ASYNC=1 se miden los handlers async (aiosqlite en local); con
+--accept-encoding y --accept, la compresión y msgpack negociados; con
+--read-database, las lecturas sobre una réplica (una copia del fichero
+SQLite sembrado hace de réplica en local).
+"""
+import argparse
+import asyncio
+import functools
+import gzip
+import inspect
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.engine import make_url
+
+from benchmarks.dataset import fila, sembrar, volumenes
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Filas por petición en los endpoints por lotes
+LOTE = 100
+
+# Cabeceras comunes a todas las peticiones (--accept, --accept-encoding)
+CABECERAS = {}
+
+
+def rss_pico_mb():
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KiB y macOS bytes
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentil(ordenadas, p):
+    if not ordenadas:
+        return None
+    return ordenadas[max(0, math.ceil(p / 100 * len(ordenadas)) - 1)]
+
+
+def _json(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else str(valor)
+
+
+def peticion(method, route, params=None, route_params=None, body=None, ndjson=None):
+    import azure.functions as func
+
+    if ndjson is not None:
+        contenido = "".join(json.dumps(fila, default=_json) + "\n" for fila in ndjson).encode()
+    else:
+        contenido = json.dumps(body, default=_json).encode() if body is not None else b""
+    return func.HttpRequest(
+        method=method,
+        url=f"http://localhost/api/{route}",
+        params=params or {},
+        route_params=route_params or {},
+        body=contenido,
+        headers=CABECERAS,
+    )
+
+
+def peticion_stream(route, params):
+    """
+    GET para un handler de HTTP streams: con la extensión instalada recibe un
+    Request de starlette en lugar de func.HttpRequest.
+    """
+    import function_app
+
+    if not function_app.HTTP_STREAMS:
+        return peticion("GET", route, params=params)
+    from starlette.requests import Request
+
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "scheme": "http",
+        "server": ("localhost", 80),
+        "root_path": "",
+        "path": f"/api/{route}",
+        "query_string": urllib.parse.urlencode(params).encode(),
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in CABECERAS.items()],
+    })
+
+
+def leer(respuesta):
+    """Cuerpo de una respuesta según lo negociado con --accept y --accept-encoding."""
+    cuerpo = respuesta.get_body()
+    codificacion = respuesta.headers.get("Content-Encoding")
+    if codificacion == "gzip":
+        cuerpo = gzip.decompress(cuerpo)
+    elif codificacion == "br":
+        import brotli
+
+        cuerpo = brotli.decompress(cuerpo)
+    if respuesta.mimetype == "application/msgpack":
+        import msgpack
+
+        return msgpack.unpackb(cuerpo)
+    return json.loads(cuerpo)
+
+
+class Escenario:
+    """Una ruta y un generador de peticiones; `construir(n)` crea la tanda a medir."""
+
+    def __init__(self, nombre, funcion, construir, al_responder=None):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.construir = construir
+        self.al_responder = al_responder
+
+
+def escenarios(vol, rng, escrituras):
+    from src.resources import POR_MODELO, RECURSOS
+
+    creados = {recurso.modelo.__tablename__: deque() for recurso in RECURSOS}
+    # cliente.usuario_id es único: cada alta de cliente usa un usuario creado en esta prueba
+    usuarios_libres = deque()
+    contador = Counter()
+
+    def guardar(tabla):
+        def al_responder(respuesta):
+            if respuesta.status_code == 201:
+                id = leer(respuesta)["id"]
+                creados[tabla].append(id)
+                if tabla == "usuario":
+                    usuarios_libres.append(id)
+        return al_responder
+
+    def cuerpo(tabla):
+        contador[tabla] += 1
+        datos = fila(tabla, vol[tabla] + contador[tabla], rng, vol)
+        if tabla == "cliente" and usuarios_libres:
+            datos["usuario_id"] = usuarios_libres.popleft()
+        return datos
+
+    lecturas, altas, cambios, bajas = [], [], [], []
+    for recurso in RECURSOS:
+        tabla = recurso.modelo.__tablename__
+        ruta, parametro, total = recurso.ruta, recurso.parametro, vol[tabla]
+        coleccion, elemento = f"manage_{ruta}", f"manage_{recurso.singular}_by_id"
+
+        def por_id(metodo, ruta=ruta, parametro=parametro, total=total, body=None):
+            def construir(n):
+                ids = [rng.randint(1, total) for _ in range(n)]
+                return [
+                    peticion(metodo, f"{ruta}/{i}", route_params={parametro: str(i)}, body=body(i) if body else None)
+                    for i in ids
+                ]
+            return construir
+
+        lecturas += [
+            Escenario(f"GET /{ruta}?limit=100", coleccion, lambda n, ruta=ruta, total=total: [
+                peticion("GET", ruta, params={"limit": "100", "after": str(rng.randint(0, total))}) for _ in range(n)
+            ]),
+            Escenario(f"GET /{ruta}", coleccion, lambda n, ruta=ruta: [peticion("GET", ruta) for _ in range(n)]),
+            Escenario(f"GET /{ruta}/{{id}}", elemento, por_id("GET")),
+        ]
+        if not escrituras:
+            continue
+
+        altas.append(Escenario(
+            f"POST /{ruta}", coleccion,
+            lambda n, ruta=ruta, tabla=tabla: [peticion("POST", ruta, body=cuerpo(tabla)) for _ in range(n)],
+            guardar(tabla)
+        ))
+        cambios.append(Escenario(
+            f"PUT /{ruta}/{{id}}", elemento,
+            por_id("PUT", body=lambda i, tabla=tabla: fila(tabla, i - 1, rng, vol))
+        ))
+
+        def eliminar(n, ruta=ruta, parametro=parametro, tabla=tabla):
+            # Se eliminan filas creadas por POST; si no quedan, se mide la respuesta 404
+            ids = [creados[tabla].popleft() if creados[tabla] else 10 ** 9 for _ in range(n)]
+            return [peticion("DELETE", f"{ruta}/{i}", route_params={parametro: str(i)}) for i in ids]
+
+        bajas.insert(0, Escenario(f"DELETE /{ruta}/{{id}}", elemento, eliminar))
+
+    for recurso in (POR_MODELO["Guia"], POR_MODELO["Destino"]):
+        ruta, parametro, total = recurso.ruta, recurso.parametro, vol[recurso.modelo.__tablename__]
+
+        def calificaciones(n, ruta=ruta, parametro=parametro, total=total, sufijo="", params=None):
+            ids = [rng.randint(1, total) for _ in range(n)]
+            return [
+                peticion("GET", f"{ruta}/{i}/calificaciones{sufijo}", params=params, route_params={parametro: str(i)})
+                for i in ids
+            ]
+
+        lecturas += [
+            Escenario(
+                f"GET /{ruta}/{{id}}/calificaciones?limit=100", f"manage_calificaciones_{recurso.singular}",
+                functools.partial(calificaciones, params={"limit": "100"})
+            ),
+            Escenario(
+                f"GET /{ruta}/{{id}}/calificaciones/resumen", f"manage_resumen_calificaciones_{recurso.singular}",
+                functools.partial(calificaciones, sufijo="/resumen")
+            ),
+            Escenario(f"GET /{ruta}/top", f"manage_top_{ruta}", lambda n, ruta=ruta: [
+                peticion("GET", f"{ruta}/top", params={"k": "10"}) for _ in range(n)
+            ]),
+        ]
+
+    def disponibles(n):
+        return [
+            peticion("GET", "guias/disponibles", params={
+                "fecha": fila("reserva", 0, rng, vol)["fecha"].date().isoformat(),
+                "idioma_id": str(rng.randint(1, vol["idioma"])),
+            })
+            for _ in range(n)
+        ]
+    lecturas.append(Escenario("GET /guias/disponibles", "manage_guias_disponibles", disponibles))
+
+    def busquedas(n):
+        # Nombre de un destino tecleado a medias, como en el autocompletado
+        consultas = (fila("destino", rng.randint(0, vol["destino"] - 1), rng, vol)["nombre"] for _ in range(n))
+        return [peticion("GET", "destinos/search", params={"q": q[:rng.randint(3, len(q))]}) for q in consultas]
+    lecturas.append(Escenario("GET /destinos/search", "manage_destinos_search", busquedas))
+
+    lecturas += [
+        Escenario("GET /reservas/{id}/detalle", "manage_detalle_reserva", lambda n: [
+            peticion("GET", f"reservas/{i}/detalle", route_params={"reserva_id": str(i)})
+            for i in (rng.randint(1, vol["reserva"]) for _ in range(n))
+        ]),
+        Escenario("GET /reservas/detalle?usuario_id=", "manage_detalle_reservas", lambda n: [
+            peticion("GET", "reservas/detalle", params={"usuario_id": str(rng.randint(1, vol["usuario"])), "limit": "20"})
+            for _ in range(n)
+        ]),
+    ]
+
+    def refrescar_estadisticas():
+        # El resumen se calcula antes de medir, fuera del tiempo de la tanda, como el timer
+        from function_app import estadisticas
+        from src.db import SessionLocal
+
+        session = SessionLocal()
+        try:
+            while estadisticas.refrescar(session):
+                session.commit()
+            session.commit()
+        finally:
+            session.close()
+
+    def estadisticas(n, ruta, grupos):
+        refrescar_estadisticas()
+        return [
+            peticion("GET", ruta, params={"group_by": rng.choice(grupos), "periodo": rng.choice(("mes", "anio"))})
+            for _ in range(n)
+        ]
+    lecturas += [
+        Escenario("GET /stats/reservas", "manage_stats_reservas", functools.partial(
+            estadisticas, ruta="stats/reservas", grupos=("destino", "ciudad", "guia")
+        )),
+        Escenario("GET /stats/calificaciones", "manage_stats_calificaciones", functools.partial(
+            estadisticas, ruta="stats/calificaciones", grupos=("destino",)
+        )),
+    ]
+
+    def exportaciones(n):
+        # Un mes de reservas con sus relaciones; el cuerpo se lee completo dentro de la medición
+        peticiones = []
+        for _ in range(n):
+            desde = fila("reserva", 0, rng, vol)["fecha"].date()
+            peticiones.append(peticion_stream("reservas/export", {
+                "format": rng.choice(("ndjson", "csv")),
+                "desde": desde.isoformat(),
+                "hasta": (desde + timedelta(days=30)).isoformat(),
+                "incluir": "destino,guias,usuarios",
+            }))
+        return peticiones
+    lecturas.append(Escenario("GET /reservas/export", "manage_reservas_export", exportaciones))
+
+    if escrituras:
+        altas.append(Escenario("POST /reservas:batch", "manage_reservas_batch", lambda n: [
+            peticion("POST", "reservas:batch", body=[cuerpo("reserva") for _ in range(LOTE)]) for _ in range(n)
+        ]))
+        cambios.append(Escenario("PUT /destinos:batch", "manage_destinos_batch", lambda n: [
+            peticion("PUT", "destinos:batch", body=[
+                dict(fila("destino", i - 1, rng, vol), id=i)
+                for i in (rng.randint(1, vol["destino"]) for _ in range(LOTE))
+            ]) for _ in range(n)
+        ]))
+
+
+        def importacion(n):
+            # Un país nuevo con sus ciudades y destinos, enlazados por "ref"
+            bundles = []
+            for _ in range(n):
+                pais = {"tabla": "pais", "ref": "p", **cuerpo("pais")}
+                ciudades = [
+                    {"tabla": "ciudad", "ref": f"c{i}", "pais_ref": "p", **cuerpo("ciudad")}
+                    for i in range(LOTE // 10)
+                ]
+                destinos = [
+                    {"tabla": "destino", "ciudad_ref": f"c{i % len(ciudades)}", **cuerpo("destino")}
+                    for i in range(LOTE)
+                ]
+                bundles.append(peticion("POST", "import", ndjson=[pais, *ciudades, *destinos]))
+            return bundles
+        altas.append(Escenario("POST /import", "manage_import", importacion))
+
+        def eliminar_guias(n):
+            # Las guías a eliminar se insertan antes de medir, fuera del tiempo de la tanda
+            from sqlalchemy import insert
+            from src.db import get_engine
+            from src.models import Guia
+
+            with get_engine().begin() as conexion:
+                ids = list(conexion.scalars(
+                    insert(Guia).returning(Guia.id, sort_by_parameter_order=True),
+                    [fila("guia", vol["guia"] + i, rng, vol) for i in range(n * 10)]
+                ))
+            return [
+                peticion("DELETE", "guias:batch", params={"ids": ",".join(map(str, ids[i:i + 10]))})
+                for i in range(0, len(ids), 10)
+            ]
+        bajas.append(Escenario("DELETE /guias:batch", "manage_guias_batch", eliminar_guias))
+
+    return lecturas + altas + cambios + bajas
+
+
+def _medir(handler, req):
+    inicio = time.perf_counter()
+    respuesta = handler(req)
+    return time.perf_counter() - inicio, respuesta
+
+
+async def _medir_async(handler, req, semaforo):
+    async with semaforo:
+        inicio = time.perf_counter()
+        respuesta = await handler(req)
+        if hasattr(respuesta, "body_iterator"):
+            # StreamingResponse: las consultas se ejecutan al recorrer el cuerpo
+            async for _ in respuesta.body_iterator:
+                pass
+        return time.perf_counter() - inicio, respuesta
+
+
+def ejecutar(handler, peticiones, concurrencia):
+    """Devuelve (resultados, segundos) de atender `peticiones` con `concurrencia` en vuelo."""
+    inicio = time.perf_counter()
+    if inspect.iscoroutinefunction(handler):
+        from src.db import get_async_engine
+
+        async def todas():
+            semaforo = asyncio.Semaphore(concurrencia)
+            try:
+                return await asyncio.gather(*(_medir_async(handler, req, semaforo) for req in peticiones))
+            finally:
+                # Las conexiones async quedan ligadas al event loop de asyncio.run
+                await get_async_engine().dispose()
+        resultados = asyncio.run(todas())
+    elif concurrencia == 1:
+        resultados = [_medir(handler, req) for req in peticiones]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            resultados = list(pool.map(lambda req: _medir(handler, req), peticiones))
+    return resultados, time.perf_counter() - inicio
+
+
+def medir(escenario, handler, n, concurrencia):
+    resultados, segundos = ejecutar(handler, escenario.construir(n), concurrencia)
+    latencias = sorted(latencia for latencia, _ in resultados)
+    estados = Counter(respuesta.status_code for _, respuesta in resultados)
+    if escenario.al_responder:
+        for _, respuesta in resultados:
+            escenario.al_responder(respuesta)
+    return {
+        "endpoint": escenario.nombre,
+        "funcion": escenario.funcion,
+        "concurrencia": concurrencia,
+        "peticiones": n,
+        "errores": sum(c for estado, c in estados.items() if estado >= 500),
+        "estados": {str(estado): c for estado, c in sorted(estados.items())},
+        "rps": round(n / segundos, 1),
+        "p50_ms": round(percentil(latencias, 50) * 1000, 3),
+        "p95_ms": round(percentil(latencias, 95) * 1000, 3),
+        "p99_ms": round(percentil(latencias, 99) * 1000, 3),
+        "rss_pico_mb": rss_pico_mb(),
+    }
+
+
+def comparar(actual, anterior):
+    """Cociente de rps y de p95 respecto a un informe anterior, por endpoint y concurrencia."""
+    previos = {(r["endpoint"], r["concurrencia"]): r for r in anterior["resultados"]}
+    comparacion = []
+    for r in actual["resultados"]:
+        previo = previos.get((r["endpoint"], r["concurrencia"]))
+        if previo is None:
+            continue
+        comparacion.append({
+            "endpoint": r["endpoint"],
+            "concurrencia": r["concurrencia"],
+            "rps": round(r["rps"] / previo["rps"], 3) if previo["rps"] else None,
+            "p95": round(r["p95_ms"] / previo["p95_ms"], 3) if previo["p95_ms"] else None,
+        })
+    return comparacion
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--database", default="sqlite:///" + os.path.join(tempfile.gettempdir(), "turismo_bench.sqlite"),
+        help="URL SQLAlchemy de la base local (se recrea salvo con --no-seed)"
+    )
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-seed", action="store_true", help="reutilizar una base ya sembrada")
+    parser.add_argument("--read-database", help="URL SQLAlchemy de la réplica de lectura (DATABASE_READ_URL)")
+    parser.add_argument("--requests", type=int, default=200, help="peticiones por endpoint y nivel de concurrencia")
+    parser.add_argument("--concurrency", default="1,8")
+    parser.add_argument("--writes", action="store_true", help="medir también POST/PUT/DELETE y los lotes")
+    parser.add_argument("--only", help="medir solo los endpoints que contengan este texto")
+    parser.add_argument("--echo", action="store_true", help="mantener el log de SQL del engine")
+    parser.add_argument("--accept", help="cabecera Accept de las peticiones, p. ej. application/msgpack")
+    parser.add_argument("--accept-encoding", help="cabecera Accept-Encoding de las peticiones, p. ej. gzip o br")
+    parser.add_argument("--output", help="fichero JSON de salida (por defecto stdout)")
+    parser.add_argument("--compare", help="informe JSON anterior con el que comparar")
+    args = parser.parse_args()
+
+    if args.accept:
+        CABECERAS["Accept"] = args.accept
+    if args.accept_encoding:
+        CABECERAS["Accept-Encoding"] = args.accept_encoding
+
+    # DATABASE_URL se lee al importar src.db, antes de cargar function_app
+    os.environ["DATABASE_URL"] = args.database
+    if args.read_database:
+        os.environ["DATABASE_READ_URL"] = args.read_database
+    import function_app
+    from src.db import get_engine
+    from src.serializers import JSON_BACKEND
+
+    engine = get_engine()
+    engine.echo = args.echo
+    if function_app.API_ASYNC:
+        from src.db import get_async_engine
+
+        get_async_engine().echo = args.echo
+    vol = volumenes(args.scale)
+    siembra = None if args.no_seed else sembrar(engine, vol, args.seed)
+    if args.read_database and not args.no_seed and engine.url.get_backend_name() == "sqlite":
+        # La réplica local es una copia de la primaria recién sembrada
+        engine.dispose()
+        shutil.copyfile(engine.url.database, make_url(args.read_database).database)
+
+    funciones = {f.get_function_name(): f.get_user_function() for f in function_app.app.get_functions()}
+    niveles = [int(c) for c in args.concurrency.split(",")]
+    rng = random.Random(args.seed)
+
+    resultados = []
+    medidas = set()
+    for escenario in escenarios(vol, rng, args.writes):
+        if args.only and args.only not in escenario.nombre:
+            continue
+        medidas.add(escenario.funcion)
+        for concurrencia in niveles:
+            resultado = medir(escenario, funciones[escenario.funcion], args.requests, concurrencia)
+            resultados.append(resultado)
+            print(
+                f"{resultado['endpoint']:<45} c={concurrencia:<3} {resultado['rps']:>9} rps  "
+                f"p95 {resultado['p95_ms']:>8} ms", file=sys.stderr
+            )
+
+    informe = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "json_backend": JSON_BACKEND,
+        "api_async": function_app.API_ASYNC,
+        "cabeceras": CABECERAS,
+        "database": engine.url.render_as_string(hide_password=True),
+        "read_database": args.read_database and make_url(args.read_database).render_as_string(hide_password=True),
+        "escala": args.scale,
+        "filas": vol,
+        "siembra_s": siembra,
+        "resultados": resultados,
+        "sin_escenario": sorted(set(funciones) - medidas),
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            informe["comparacion"] = comparar(informe, json.load(f))
+
+    salida = json.dumps(informe, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(salida + "\n")
+    else:
+        print(salida)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Informe de arranque en frío: tiempo de importación por módulo y tiempo hasta
+la primera conexión a la base de datos. Uso:
+
+    python -m benchmarks.startup_report [--warm-up N] [--top 15]
+
+Cada medición se hace en un proceso nuevo para que el caché de módulos no
+oculte el coste real de importar function_app.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+_SONDA = """
+import json, time
+t0 = time.perf_counter()
+import function_app
+t1 = time.perf_counter()
+from src.db import get_engine, warm_up
+engine = get_engine()
+t2 = time.perf_counter()
+with engine.connect():
+    pass
+t3 = time.perf_counter()
+abiertas = warm_up({warm_up}, background=False) if {warm_up} else 0
+t4 = time.perf_counter()
+print(json.dumps({{
+    "import_function_app_s": round(t1 - t0, 4),
+    "create_engine_s": round(t2 - t1, 4),
+    "first_connection_s": round(t3 - t2, 4),
+    "warm_up_connections": abiertas,
+    "warm_up_s": round(t4 - t3, 4),
+}}))
+"""
+
+
+def tiempos_de_importacion(top):
+    """Ejecuta `python -X importtime` y devuelve los módulos con mayor tiempo acumulado."""
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import function_app"],
+        capture_output=True, text=True
+    )
+    modulos = []
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:") or "cumulative" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|", 2)
+        modulos.append({
+            "modulo": nombre.strip(),
+            "propio_ms": int(propio) / 1000,
+            "acumulado_ms": int(acumulado) / 1000,
+        })
+
+    propios = [m for m in modulos if m["modulo"].startswith(("src", "function_app"))]
+    mayores = sorted(modulos, key=lambda m: m["acumulado_ms"], reverse=True)[:top]
+    return {"modulos_del_proyecto": propios, "mayores": mayores}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--warm-up", type=int, default=0, help="conexiones a precalentar tras la primera")
+    parser.add_argument("--top", type=int, default=15, help="módulos más lentos a listar")
+    args = parser.parse_args()
+
+    informe = tiempos_de_importacion(args.top)
+
+    proceso = subprocess.run(
+        [sys.executable, "-c", _SONDA.format(warm_up=args.warm_up)],
+        capture_output=True, text=True
+    )
+    if proceso.returncode != 0:
+        informe["conexion"] = {"error": proceso.stderr.strip().splitlines()[-1]}
+    else:
+        informe["conexion"] = json.loads(proceso.stdout.strip().splitlines()[-1])
+
+    print(json.dumps(informe, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,786 +1,1015 @@
+import asyncio
 import azure.functions as func
+import csv
+import inspect
 import logging
 import json
 import os
 import urllib.parse
-from typing import List, Dict, Any
-
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy.exc import SQLAlchemyError
-
-from src.models.usuario import Usuario
-from src.models.destino import Destino
-from src.models.ciudad import Ciudad
-from src.models.guia import Guia
-from src.models.reserva import Reserva
-from src.models.reserva_usuario import ReservaUsuario
-from src.models.reserva_guia import ReservaGuia
-from src.models.genero import Genero
-from src.models.guia_calificacion import GuiaCalificacion
-from src.models.destino_calificacion import DestinoCalificacion
-from src.models.pais import Pais
-from src.models.cliente import Cliente
-from src.models.idioma import Idioma
-from src.models.guia_idioma import GuiaIdioma
+import uuid
 from datetime import datetime
 
-# Database Connection Configuration
-server = os.getenv("SQL_SERVER", "sem6.database.windows.net")
-database = os.getenv("SQL_DATABASE", "db_tourismo")
-username = os.getenv("SQL_USERNAME", "admin2025")
-password = os.getenv("SQL_PASSWORD", "seminario_sesion6_2025")
-encoded_password = urllib.parse.quote_plus(password)
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from src import aio, availability, detail, ingestion, models
+from src.cache import ReferenceCache
+from src.coalescing import SingleFlight
+from src.batch import MAX_BATCH, validar_lote, validar_referencias, insertar_lote, actualizar_lote, eliminar_lote
+from src.changes import ChangeTracker
+from src.db import AsyncReadSessionLocal, AsyncSessionLocal, ReadSessionLocal, SessionLocal, TurismoSession, warm_up
+from src.expand import expansion_for, parse_expand
+from src.export import FORMATOS, consulta, exportar, exportar_async, parse_export_params
+from src.importer import MAX_IMPORT, importar, leer_bundle, validar
+from src.negotiation import JSON, Negociacion, escribir, escribir_filas, negociado
+from src.pagination import MAX_LIMIT, parse_page_params, keyset_page, iter_rows, json_array, json_chunks, json_object
+from src.profiling import perfilable, solicitado
+from src.projection import parse_fields, projection_for
+from src.query_stats import QueryStats
+from src.ratings import RatingAggregates
+from src.replica import de_replica, exige_primaria, leer_lo_escrito
+from src.resources import POR_MODELO, RECURSOS
+from src.search import SearchIndex
+from src.serializers import dumps, to_json
+from src.stats import GRUPOS_CALIFICACIONES, GRUPOS_RESERVAS, LOTE as STATS_BATCH, PERIODOS, MonthlyStats
+from src.timing import fase, medido
+from src.versioning import TableVersions, etag, if_none_match
+
+# HTTP streams de Azure Functions (respuestas enviadas por bloques). Sin la
+# extensión instalada las exportaciones se generan completas antes de enviarse
+try:
+    from azurefunctions.extensions.http.fastapi import JSONResponse, Request, StreamingResponse
+    HTTP_STREAMS = True
+except ImportError:
+    HTTP_STREAMS = False
+
+# Caché por worker de las tablas de referencia, invalidada en cada commit
+cache_referencias = ReferenceCache(
+    ("pais", "genero", "ciudad", "idioma"),
+    maxsize=int(os.getenv("API_CACHE_MAXSIZE", "128")),
+    ttl=float(os.getenv("API_CACHE_TTL", "300"))
+)
+
+# Versiones por tabla (ETag) e invalidación de cachés al confirmar escrituras
+versiones = TableVersions()
+cambios = ChangeTracker()
+cambios.before_commit(versiones.bump)
+cambios.after_commit(lambda modelos: cache_referencias.invalidate(*modelos))
+cambios.bind(TurismoSession)
+
+# Índice de búsqueda de destinos en memoria, al día con los commits de este worker
+# y recargado en segundo plano tras los de otros. Se enlaza después de
+# `cambios` para leer las versiones ya incrementadas
+buscador = SearchIndex(versiones, SessionLocal)
+buscador.bind(TurismoSession)
+
+# GET idénticos concurrentes comparten una sola ejecución del handler. Tras un
+# commit en este worker las lecturas nuevas ya no se unen a las que estaban en
+# curso, para que quien acaba de escribir lea su propio cambio
+COALESCE = os.getenv("API_COALESCE", "1") == "1"
+coalescencia = SingleFlight(
+    espera=float(os.getenv("API_COALESCE_WAIT_S", "5")),
+    max_claves=int(os.getenv("API_COALESCE_MAX_KEYS", "500"))
+)
+cambios.after_commit(lambda modelos: coalescencia.olvidar())
+
+# Resumen de calificaciones por guía y destino, actualizado en cada flush
+calificaciones = RatingAggregates()
+calificaciones.bind(TurismoSession)
+
+# Estadísticas mensuales de reservas y calificaciones: cada commit anota los
+# meses afectados y refrescar_estadisticas recalcula solo esos meses
+estadisticas = MonthlyStats()
+estadisticas.bind(TurismoSession)
+
+# Perfil de consultas por fingerprint; se registran en el log las que superan el umbral
+consultas = QueryStats(
+    umbral_ms=float(os.getenv("API_SLOW_QUERY_MS", "500")),
+    max_fingerprints=int(os.getenv("API_QUERY_STATS_MAX", "500"))
+)
+consultas.bind(Engine)
+
+# Cache-Control por recurso; se sobrescribe con API_CACHE_CONTROL_<TABLA>
+CACHE_CONTROL = {
+    "pais": "private, max-age=300",
+    "genero": "private, max-age=300",
+    "ciudad": "private, max-age=300",
+    "idioma": "private, max-age=300",
+}
+
+# El engine se crea en la primera petición (src/db.py); opcionalmente se
+# precalientan N conexiones del pool en segundo plano al arrancar el worker
+DB_WARMUP_CONNECTIONS = int(os.getenv("DB_WARMUP_CONNECTIONS", "0"))
+if DB_WARMUP_CONNECTIONS > 0:
+    warm_up(DB_WARMUP_CONNECTIONS)
+
+def _proyeccion(modelo, req):
+    """
+    Proyección de ?fields= (lectura Core) o, si se pide ?expand=, lectura ORM
+    con las relaciones precargadas. Devuelve (proyeccion, respuesta_de_error).
+    """
+    try:
+        fields = parse_fields(modelo, req.params.get("fields"))
+    except ValueError as e:
+        error = f"Campo desconocido en 'fields': {e}"
+    else:
+        try:
+            rutas = parse_expand(modelo, req.params.get("expand"))
+        except ValueError as e:
+            error = f"Relación desconocida en 'expand': {e}"
+        else:
+            if rutas:
+                return expansion_for(modelo, fields, rutas), None
+            return projection_for(modelo, fields), None
+
+    return None, func.HttpResponse(
+        json.dumps({"error": error}),
+        mimetype="application/json",
+        status_code=400
+    )
+
+# ETag y Cache-Control del recurso; si el cliente ya tiene esta versión
+# devuelve la respuesta 304 sin leer ninguna fila. `dependencias` son otras
+# tablas que intervienen en la respuesta y cuya versión también cuenta.
+# `leidas` son versiones {tabla: version} ya conocidas (p. ej. las del índice
+# de búsqueda) que sustituyen a la lectura de la base
+def _condicional(session, modelo, req, dependencias=(), leidas=None):
+    if leidas is None:
+        version = versiones.current(session, modelo)
+        otras = sorted(versiones.current_many(session, dependencias).items()) if dependencias else []
+    else:
+        version = leidas.get(modelo.__tablename__, 0)
+        otras = sorted((tabla, v) for tabla, v in leidas.items() if tabla != modelo.__tablename__)
+    headers = {
+        "ETag": etag(modelo, version, sorted(req.params.items()), sorted(req.route_params.items()), otras),
+        "Cache-Control": os.getenv(
+            f"API_CACHE_CONTROL_{modelo.__tablename__.upper()}",
+            CACHE_CONTROL.get(modelo.__tablename__, "private, no-cache")
+        ),
+    }
+    if if_none_match(req.headers.get("If-None-Match"), headers["ETag"]):
+        return headers, func.HttpResponse(status_code=304, headers=headers)
+    return headers, None
+
+def _unir_json(bloques):
+    return "".join(json_chunks(bloques)), JSON
+
+# Cuerpo del listado, su mimetype y cursor de la página siguiente (None si no
+# hay más). `unir` recibe los bloques de filas del listado completo y devuelve
+# (cuerpo, mimetype); por defecto, el arreglo JSON
+def _listado(session, modelo, proyeccion, limit, after, filtros, unir=_unir_json):
+    stmt = proyeccion.select().where(*filtros)
+
+    # Sin parámetros se devuelve la tabla completa leyendo por bloques
+    if limit is None and after is None:
+        return (*unir(iter_rows(session, stmt, modelo.id, proyeccion.to_dict, scalars=proyeccion.orm)), None)
+
+    filas, siguiente = keyset_page(session, stmt, modelo.id, limit or MAX_LIMIT, after, scalars=proyeccion.orm)
+    return json_array(filas, proyeccion.to_dict), JSON, siguiente
+
+# Cursor de la página siguiente en X-Next-Cursor y en un Link rel="next"
+def _siguiente_pagina(req, headers, siguiente):
+    if siguiente is None:
+        return
+    params = dict(req.params)
+    params["after"] = str(siguiente)
+    url = urllib.parse.urlsplit(req.url)._replace(query=urllib.parse.urlencode(params))
+    headers["X-Next-Cursor"] = str(siguiente)
+    headers["Link"] = f'<{urllib.parse.urlunsplit(url)}>; rel="next"'
+
+# Listado paginado por keyset (?limit=&after=) o completo en streaming;
+# `filtros` acota el listado (p. ej. las calificaciones de una guía)
+def listar(session, modelo, req, *filtros, dependencias=()):
+    proyeccion, error = _proyeccion(modelo, req)
+    if error:
+        return error
+
+    try:
+        limit, after = parse_page_params(req.params)
+    except ValueError:
+        return func.HttpResponse(
+            json.dumps({"error": "Parámetros de paginación inválidos"}),
+            mimetype="application/json",
+            status_code=400
+        )
+
+    # Con ?expand= las tablas expandidas también cuentan en el ETag
+    headers, no_modificado = _condicional(session, modelo, req, (*dependencias, *proyeccion.dependencias))
+    if no_modificado:
+        return no_modificado
+
+    if cache_referencias.cached(modelo):
+        # El ETag lleva la versión de la tabla recién leída y la de las
+        # expandidas: si otro worker (o este, en una tabla expandida que no es
+        # la del listado) las modificó, la entrada cargada antes ya no coincide.
+        # Lo leído de la réplica se guarda aparte: puede ir por detrás de la primaria
+        clave = (
+            headers["ETag"], proyeccion.key, limit, after, tuple(sorted(req.route_params.items())),
+            session.info.get("replica", False)
+        )
+        (body, mimetype, siguiente), acierto = cache_referencias.get_or_load(
+            modelo, clave, lambda: _listado(session, modelo, proyeccion, limit, after, filtros)
+        )
+        headers["X-Cache"] = "HIT" if acierto else "MISS"
+    else:
+        # El listado completo se empaqueta (msgpack) y comprime bloque a bloque según lo negociado
+        body, mimetype, siguiente = _listado(
+            session, modelo, proyeccion, limit, after, filtros, lambda bloques: escribir_filas(bloques, headers)
+        )
 
-DB_URL = f"mssql+pyodbc://{username}:{encoded_password}@{server}/{database}?driver=ODBC+Driver+18+for+SQL+Server&Encrypt=yes&TrustServerCertificate=no&Connection Timeout=30"
+    _siguiente_pagina(req, headers, siguiente)
+    return func.HttpResponse(
+        body,
+        mimetype=mimetype,
+        headers=headers
+    )
+
+# Lectura por id (sin hidratar el ORM salvo con ?expand=); devuelve None si no existe
+def obtener(session, modelo, id, req):
+    proyeccion, error = _proyeccion(modelo, req)
+    if error:
+        return error
+
+    headers, no_modificado = _condicional(session, modelo, req, proyeccion.dependencias)
+    if no_modificado:
+        return no_modificado
+
+    resultado = session.execute(proyeccion.select().where(modelo.id == id))
+    with fase("fetch"):
+        fila = resultado.scalars().first() if proyeccion.orm else resultado.first()
+    if fila is None:
+        return None
+    return func.HttpResponse(
+        json_object(fila, proyeccion.to_dict),
+        mimetype="application/json",
+        headers=headers
+    )
+
+# Lee el arreglo JSON de una petición por lotes; devuelve (items, respuesta_de_error)
+def _leer_lote(req):
+    try:
+        items = req.get_json()
+    except ValueError:
+        items = None
+    if not isinstance(items, list) or not items:
+        error = "Se esperaba un arreglo JSON no vacío"
+    elif len(items) > MAX_BATCH:
+        error = f"El lote supera el máximo de {MAX_BATCH} elementos"
+    else:
+        return items, None
+    return None, func.HttpResponse(
+        json.dumps({"error": error}),
+        mimetype="application/json",
+        status_code=400
+    )
+
+
+# Respuesta de error JSON común a los handlers CRUD
+def _error(mensaje, status_code=400):
+    return func.HttpResponse(
+        json.dumps({"error": mensaje}),
+        mimetype="application/json",
+        status_code=status_code
+    )
+
+# Reglas de una escritura que dependen de otras filas: las FK hacia tablas de
+# referencia (validadas contra la caché) y las del recurso, p. ej. una guía
+# reservada dos veces el mismo día. Devuelve (status_code, mensaje) o None
+def _regla_incumplida(session, recurso, datos, actual=None):
+    for columna, destino in recurso.validador.referencias.items():
+        valor = datos.get(columna)
+        if valor is not None and cache_referencias.covers(destino) and not cache_referencias.exists(session, destino, valor):
+            return 400, f"El '{columna}' proporcionado no existe"
+    if recurso.comprobar is not None:
+        mensaje = recurso.comprobar(session, datos, actual)
+        if mensaje:
+            return 409, mensaje
+    return None
+
+# Reglas de cada elemento de un lote: las FK hacia tablas sin caché se
+# comprueban para todo el lote con una consulta IN por columna y el resto
+# con _regla_incumplida, como en una escritura individual. Cada rechazo lleva
+# su status_code: 422 si la FK no existe y 409 si incumple una regla del recurso
+# (p. ej. una guía ya ocupada). Devuelve (validos, errores)
+def _reglas_lote(session, recurso, validos):
+    referencias = {
+        columna: destino for columna, destino in recurso.validador.referencias.items()
+        if not cache_referencias.covers(destino)
+    }
+    validos, errores = validar_referencias(session, referencias, validos)
+    aceptados = []
+    for indice, datos in validos:
+        regla = _regla_incumplida(session, recurso, datos)
+        if regla:
+            status_code = 422 if regla[0] == 400 else regla[0]
+            errores.append({"indice": indice, "status_code": status_code, "error": regla[1]})
+        else:
+            aceptados.append((indice, datos))
+    return aceptados, errores
+
+def _escritura_invalida(session, recurso, datos, actual=None):
+    regla = _regla_incumplida(session, recurso, datos, actual)
+    return _error(regla[1], regla[0]) if regla else None
+
+# CRUD genérico de un recurso registrado en src/resources.py
+def _coleccion(session, req, recurso):
+    if req.method == "GET":
+        return listar(session, recurso.modelo, req)
 
-# Create engine and session
-engine = create_engine(DB_URL, echo=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    try:
+        datos = recurso.validador.crear(req.get_json())
+    except ValueError as e:
+        return _error(str(e))
+    error = _escritura_invalida(session, recurso, datos)
+    if error:
+        return error
+
+    nuevo = recurso.modelo(**datos)
+    session.add(nuevo)
+    session.commit()
+    return func.HttpResponse(
+        to_json(nuevo),
+        mimetype="application/json",
+        status_code=201
+    )
+
+def _elemento(session, req, recurso):
+    try:
+        id = int(req.route_params.get(recurso.parametro))
+    except (TypeError, ValueError):
+        return _error("ID inválido")
+
+    if req.method == "GET":
+        respuesta = obtener(session, recurso.modelo, id, req)
+        return _error(recurso.no_encontrado, 404) if respuesta is None else respuesta
+
+    objeto = session.get(recurso.modelo, id)
+    if objeto is None:
+        return _error(recurso.no_encontrado, 404)
+
+    if req.method == "PUT":
+        try:
+            datos = recurso.validador.actualizar(req.get_json())
+        except ValueError as e:
+            return _error(str(e))
+        error = _escritura_invalida(session, recurso, datos, objeto)
+        if error:
+            return error
+
+        for key, value in datos.items():
+            setattr(objeto, key, value)
+        session.commit()
+        return func.HttpResponse(
+            to_json(objeto),
+            mimetype="application/json"
+        )
 
-# Helper function to convert SQLAlchemy objects to dictionaries
-def to_dict(obj):
-    return {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
+    session.delete(objeto)
+    session.commit()
+    return func.HttpResponse(
+        json.dumps({"message": recurso.eliminado}),
+        mimetype="application/json",
+        status_code=200
+    )
+
+# Los GET se leen de la réplica si está configurada (src/replica.py); las escrituras, de la primaria
+def _sincrono(operacion, recurso):
+    def handler(req: func.HttpRequest) -> func.HttpResponse:
+        session = (ReadSessionLocal if de_replica(req) else SessionLocal)()
+        try:
+            return operacion(session, req, recurso)
+        except SQLAlchemyError as e:
+            logging.error(f"Error de base de datos: {str(e)}")
+            session.rollback()
+            return _error("Error de base de datos", 500)
+        finally:
+            session.close()
+    return handler
+
+# Escrituras diferidas (API_WRITE_QUEUE): POST, PUT y DELETE se validan, se
+# encolan y responden 202 con la URL de su estado; las aplica aplicar_escrituras
+def _aceptar(req, recurso):
+    objeto_id, cuerpo = None, None
+    if req.method != "POST":
+        try:
+            objeto_id = int(req.route_params.get(recurso.parametro))
+        except (TypeError, ValueError):
+            return _error("ID inválido")
+    if req.method != "DELETE":
+        try:
+            cuerpo = req.get_json()
+            (recurso.validador.crear if req.method == "POST" else recurso.validador.actualizar)(cuerpo)
+        except ValueError as e:
+            return _error(str(e))
+
+    try:
+        id = ingestion.encolar(recurso, req.method, objeto_id, cuerpo)
+    except ValueError as e:
+        return _error(str(e), 413)
+    except Exception as e:
+        logging.error(f"Error al encolar la escritura: {str(e)}")
+        return _error("No se pudo encolar la escritura", 503)
+
+    url = urllib.parse.urlsplit(req.url)
+    prefijo = url.path[:url.path.find(f"/{recurso.ruta}")]
+    estado = urllib.parse.urlunsplit((url.scheme, url.netloc, f"{prefijo}/escrituras/{id}", "", ""))
+    return func.HttpResponse(
+        json.dumps({"id": id, "estado": "pendiente", "url": estado}),
+        mimetype="application/json",
+        status_code=202,
+        headers={"Location": estado}
+    )
+
+def _en_cola(handler, recurso):
+    if inspect.iscoroutinefunction(handler):
+        async def envoltorio(req):
+            if req.method == "GET":
+                return await handler(req)
+            # El cliente de la cola es síncrono: se llama fuera del event loop
+            return await asyncio.to_thread(_aceptar, req, recurso)
+    else:
+        def envoltorio(req):
+            return handler(req) if req.method == "GET" else _aceptar(req, recurso)
+    return envoltorio
+
+# Calificaciones de una guía o destino, su resumen y el ranking por media bayesiana
+def _modelo_calificacion(recurso):
+    return POR_MODELO[f"{recurso.nombre_modelo}Calificacion"].modelo
+
+def _entidad(session, req, recurso):
+    """Devuelve (id, respuesta_de_error) comprobando que la guía o destino existe."""
+    try:
+        id = int(req.route_params.get(recurso.parametro))
+    except (TypeError, ValueError):
+        return None, _error("ID inválido")
+    if session.get(recurso.modelo, id) is None:
+        return None, _error(recurso.no_encontrado, 404)
+    return id, None
+
+def _calificaciones(session, req, recurso):
+    id, error = _entidad(session, req, recurso)
+    if error:
+        return error
+    modelo = _modelo_calificacion(recurso)
+    return listar(session, modelo, req, getattr(modelo, recurso.parametro) == id)
+
+def _resumen_calificaciones(session, req, recurso):
+    id, error = _entidad(session, req, recurso)
+    if error:
+        return error
+
+    headers, no_modificado = _condicional(session, _modelo_calificacion(recurso), req)
+    if no_modificado:
+        return no_modificado
+    return func.HttpResponse(
+        json.dumps(calificaciones.resumen(session, recurso.singular, id)),
+        mimetype="application/json",
+        headers=headers
+    )
+
+def _ranking(session, req, recurso):
+    filtros = []
+    try:
+        k = int(req.params.get("k", "10"))
+        if "ciudad_id" in req.params and hasattr(recurso.modelo, "ciudad_id"):
+            filtros.append(recurso.modelo.ciudad_id == int(req.params["ciudad_id"]))
+    except ValueError:
+        k = 0
+    if not 1 <= k <= 100:
+        return _error("'k' debe ser un entero entre 1 y 100 y 'ciudad_id' un entero")
+
+    # El cuerpo incluye el nombre de la entidad y el filtro por ciudad depende
+    # de sus filas: renombrarla o moverla también cambia el ETag
+    headers, no_modificado = _condicional(session, _modelo_calificacion(recurso), req, (recurso.modelo,))
+    if no_modificado:
+        return no_modificado
+    return func.HttpResponse(
+        json.dumps(calificaciones.top(session, recurso.singular, recurso.modelo, k, *filtros)),
+        mimetype="application/json",
+        headers=headers
+    )
+
+# Guías libres en una fecha, opcionalmente por idioma y ciudad
+def _disponibles(session, req, recurso):
+    try:
+        fecha = datetime.fromisoformat(req.params["fecha"])
+        idioma_id = int(req.params["idioma_id"]) if "idioma_id" in req.params else None
+        ciudad_id = int(req.params["ciudad_id"]) if "ciudad_id" in req.params else None
+    except (KeyError, ValueError):
+        return _error("'fecha' es obligatoria en formato ISO e 'idioma_id' y 'ciudad_id' deben ser enteros")
+
+    return listar(
+        session, recurso.modelo, req, *availability.filtros_disponibles(fecha, idioma_id, ciudad_id),
+        dependencias=(models.Reserva, models.ReservaGuia, models.GuiaIdioma, models.Destino)
+    )
+
+# Búsqueda de destinos por texto, ordenada por puntuación
+def _busqueda(session, req, recurso):
+    consulta = req.params.get("q", "").strip()
+    try:
+        limite = int(req.params.get("limit", "20"))
+    except ValueError:
+        limite = 0
+    if not consulta or not 1 <= limite <= MAX_LIMIT:
+        return _error(f"'q' es obligatorio y 'limit' debe ser un entero entre 1 y {MAX_LIMIT}")
+
+    # El ETag sale de las versiones con las que se construyó el índice: mientras
+    # se recarga en segundo plano se responde (y se valida) con el anterior.
+    # Quien acaba de escribir (cookie o header de src/replica.py) espera a la recarga
+    leidas = buscador.preparar(session, consistente=exige_primaria(req))
+    headers, no_modificado = _condicional(session, recurso.modelo, req, leidas=leidas)
+    if no_modificado:
+        return no_modificado
+    return func.HttpResponse(
+        json.dumps(buscador.buscar(consulta, limite)),
+        mimetype="application/json",
+        headers=headers
+    )
+
+# Detalle de reservas: destino, ciudad, país, guías y usuarios en tres consultas
+def _detalle_reserva(session, req, recurso):
+    try:
+        id = int(req.route_params.get(recurso.parametro))
+    except (TypeError, ValueError):
+        return _error("ID inválido")
+
+    headers, no_modificado = _condicional(session, recurso.modelo, req, detail.dependencias())
+    if no_modificado:
+        return no_modificado
+    with fase("fetch"):
+        filas = session.execute(detail.consulta().where(recurso.modelo.id == id)).all()
+    if not filas:
+        return _error(recurso.no_encontrado, 404)
+    detalle, = detail.cargar(session, filas)
+    with fase("json"):
+        body = dumps(detalle)
+    return func.HttpResponse(
+        body,
+        mimetype="application/json",
+        headers=headers
+    )
+
+def _detalle_reservas(session, req, recurso):
+    try:
+        usuario_id = int(req.params["usuario_id"])
+        limit, after = parse_page_params(req.params)
+    except (KeyError, ValueError):
+        return _error("'usuario_id' es obligatorio y, como 'limit' y 'after', debe ser entero")
+
+    headers, no_modificado = _condicional(session, recurso.modelo, req, detail.dependencias())
+    if no_modificado:
+        return no_modificado
+    filas, siguiente = keyset_page(session, detail.consulta(usuario_id), recurso.modelo.id, limit or MAX_LIMIT, after)
+    detalles = detail.cargar(session, filas)
+    with fase("json"):
+        body = "[" + ",".join(dumps(detalle) for detalle in detalles) + "]"
+    _siguiente_pagina(req, headers, siguiente)
+    return func.HttpResponse(
+        body,
+        mimetype="application/json",
+        headers=headers
+    )
+
+# Estadísticas precalculadas: nunca se lee la tabla reserva, solo estadistica_mensual.
+# El ETag cambia con cada refresco que procesa cambios
+def _estadisticas(session, req, grupos, leer):
+    agrupar = req.params.get("group_by", grupos[0])
+    periodo = req.params.get("periodo", "mes")
+    if agrupar not in grupos or periodo not in PERIODOS:
+        return _error(f"'group_by' debe ser uno de {', '.join(grupos)} y 'periodo' uno de {', '.join(PERIODOS)}")
+    fechas = []
+    for campo in ("desde", "hasta"):
+        valor = req.params.get(campo)
+        try:
+            fechas.append(datetime.fromisoformat(valor) if valor else None)
+        except ValueError:
+            return _error(f"Formato de fecha inválido en '{campo}'")
+
+    cambio_id, actualizado = estadisticas.marca(session)
+    actualizado = actualizado.isoformat() if actualizado else None
+    headers = {
+        "ETag": etag(models.EstadisticaMensual, cambio_id, actualizado, leer.__name__, sorted(req.params.items())),
+        "Cache-Control": "private, no-cache",
+    }
+    if if_none_match(req.headers.get("If-None-Match"), headers["ETag"]):
+        return func.HttpResponse(status_code=304, headers=headers)
+    with fase("fetch"):
+        filas = leer(session, agrupar, periodo, *fechas)
+    return func.HttpResponse(
+        json.dumps({"group_by": agrupar, "periodo": periodo, "actualizado": actualizado, "filas": filas}),
+        mimetype="application/json",
+        headers=headers
+    )
+
+def _stats_reservas(session, req, recurso):
+    return _estadisticas(session, req, GRUPOS_RESERVAS, estadisticas.reservas)
+
+def _stats_calificaciones(session, req, recurso):
+    return _estadisticas(session, req, GRUPOS_CALIFICACIONES, estadisticas.calificaciones)
+
+def _asincrono(operacion, recurso):
+    async def handler(req: func.HttpRequest) -> func.HttpResponse:
+        return await aio.ejecutar(operacion, req, recurso)
+    return handler
 
 # Azure Function App
 app = func.FunctionApp(http_auth_level=func.AuthLevel.FUNCTION)
 
-# Usuario Endpoints
-@app.route(route="usuarios", methods=["GET", "POST"])
-def manage_usuarios(req: func.HttpRequest) -> func.HttpResponse:
+# Con API_ASYNC=1 las rutas CRUD se sirven con handlers async sobre AsyncEngine
+API_ASYNC = os.getenv("API_ASYNC", "0") == "1"
+
+def ruta(route, methods, **opciones):
+    """
+    Registra un handler HTTP con Server-Timing y log estructurado por petición,
+    perfilable bajo demanda con el header X-Profile, con formato (JSON o
+    msgpack) y compresión negociados con Accept y Accept-Encoding y, con
+    réplica, con la ventana de lectura en la primaria tras cada escritura.
+    """
+    def decorator(handler):
+        return app.route(route=route, methods=methods, **opciones)(
+            medido(perfilable(negociado(leer_lo_escrito(handler))))
+        )
+    return decorator
+
+# Peticiones equivalentes para la coalescencia: misma ruta, query string,
+# If-None-Match, formato y compresión negociados (un listado completo se
+# comprime al generarse) y base de lectura (quien acaba de escribir no se une
+# a una lectura de la réplica). Las escrituras y las peticiones perfiladas no se coalescen
+def _clave_coalescencia(req):
+    if req.method != "GET" or solicitado(req):
+        return None
+    url = urllib.parse.urlsplit(req.url)
+    query = urllib.parse.urlencode(sorted(req.params.items()))
+    return (
+        f"{url.path}?{query}" if query else url.path, req.headers.get("If-None-Match"),
+        Negociacion(req).variante, de_replica(req)
+    )
+
+def _registrar(nombre, route, methods, operacion, recurso):
+    """Registra la variante síncrona o async del handler con el nombre de función dado."""
+    handler = (_asincrono if API_ASYNC else _sincrono)(operacion, recurso)
+    if ingestion.COLA and operacion in (_coleccion, _elemento):
+        handler = _en_cola(handler, recurso)
+    if COALESCE and "GET" in methods:
+        handler = coalescencia.envolver(handler, _clave_coalescencia)
+    handler.__name__ = handler.__qualname__ = nombre
+    globals()[nombre] = ruta(route, methods)(handler)
+
+# Rutas CRUD de cada recurso: <ruta> (GET, POST) y <ruta>/{<singular>_id} (GET, PUT, DELETE).
+# La restricción :int deja libres rutas literales como guias/top
+for _recurso in RECURSOS:
+    _registrar(f"manage_{_recurso.ruta}", _recurso.ruta, ["GET", "POST"], _coleccion, _recurso)
+    _registrar(
+        f"manage_{_recurso.singular}_by_id", f"{_recurso.ruta}/{{{_recurso.parametro}:int}}",
+        ["GET", "PUT", "DELETE"], _elemento, _recurso
+    )
+
+# Calificaciones: <ruta>/{id}/calificaciones, .../calificaciones/resumen y <ruta>/top
+for _recurso in (POR_MODELO["Guia"], POR_MODELO["Destino"]):
+    _elemento_ruta = f"{_recurso.ruta}/{{{_recurso.parametro}:int}}/calificaciones"
+    _registrar(f"manage_calificaciones_{_recurso.singular}", _elemento_ruta, ["GET"], _calificaciones, _recurso)
+    _registrar(
+        f"manage_resumen_calificaciones_{_recurso.singular}", f"{_elemento_ruta}/resumen",
+        ["GET"], _resumen_calificaciones, _recurso
+    )
+    _registrar(f"manage_top_{_recurso.ruta}", f"{_recurso.ruta}/top", ["GET"], _ranking, _recurso)
+del _recurso, _elemento_ruta
+
+# Búsqueda: destinos/search?q=&limit=
+_registrar("manage_destinos_search", "destinos/search", ["GET"], _busqueda, POR_MODELO["Destino"])
+
+# Detalle de reservas: reservas/{id}/detalle y reservas/detalle?usuario_id=&limit=&after=
+_registrar(
+    "manage_detalle_reserva", f"reservas/{{{POR_MODELO['Reserva'].parametro}:int}}/detalle",
+    ["GET"], _detalle_reserva, POR_MODELO["Reserva"]
+)
+_registrar("manage_detalle_reservas", "reservas/detalle", ["GET"], _detalle_reservas, POR_MODELO["Reserva"])
+
+# Guías libres: guias/disponibles?fecha=&idioma_id=&ciudad_id=
+_registrar("manage_guias_disponibles", "guias/disponibles", ["GET"], _disponibles, POR_MODELO["Guia"])
+
+# Estadísticas: stats/reservas?group_by=destino|ciudad|guia&periodo=mes|anio&desde=&hasta=
+# y stats/calificaciones?group_by=destino&periodo=mes|anio&desde=&hasta=
+_registrar("manage_stats_reservas", "stats/reservas", ["GET"], _stats_reservas, POR_MODELO["Reserva"])
+_registrar(
+    "manage_stats_calificaciones", "stats/calificaciones",
+    ["GET"], _stats_calificaciones, POR_MODELO["DestinoCalificacion"]
+)
+
+# Endpoints por lotes
+@ruta("destinos:batch", ["PUT"])
+def manage_destinos_batch(req: func.HttpRequest) -> func.HttpResponse:
+    items, error = _leer_lote(req)
+    if error:
+        return error
+
+    validador = POR_MODELO["Destino"].validador
+
+    def validar(item):
+        datos = validador.actualizar(item)
+        try:
+            datos["id"] = int(item["id"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("El campo 'id' es obligatorio y debe ser entero")
+        return datos
+
+    validos, errores = validar_lote(items, validar)
     try:
         session = SessionLocal()
-        
-        if req.method == "GET":
-            usuarios = session.query(Usuario).all()
-            return func.HttpResponse(
-                json.dumps([to_dict(usuario) for usuario in usuarios]),
-                mimetype="application/json"
-            )
-        
-        elif req.method == "POST":
-            usuario_data = req.get_json()
-            nuevo_usuario = Usuario(**usuario_data)
-            session.add(nuevo_usuario)
-            session.commit()
-            return func.HttpResponse(
-                json.dumps(to_dict(nuevo_usuario)), 
-                mimetype="application/json", 
-                status_code=201
-            )
-    
-    except SQLAlchemyError as e:
-        logging.error(f"Error de base de datos: {str(e)}")
+        validos, incumplidas = _reglas_lote(session, POR_MODELO["Destino"], validos)
+        actualizados, no_encontrados = actualizar_lote(session, models.Destino, validos)
+        session.commit()
+        errores = sorted(errores + incumplidas + no_encontrados, key=lambda e: e["indice"])
         return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos"}), 
-            mimetype="application/json", 
-            status_code=500
+            json.dumps({"actualizados": actualizados, "errores": errores}),
+            mimetype="application/json",
+            status_code=200 if actualizados else 400
         )
-    finally:
-        session.close()
 
-@app.route(route="usuarios/{usuario_id}", methods=["GET", "PUT", "DELETE"])
-def manage_usuario_by_id(req: func.HttpRequest) -> func.HttpResponse:
-    try:
-        session = SessionLocal()
-        usuario_id = int(req.route_params.get('usuario_id'))
-        
-        if req.method == "GET":
-            usuario = session.query(Usuario).filter(Usuario.id == usuario_id).first()
-            if usuario:
-                return func.HttpResponse(
-                    json.dumps(to_dict(usuario)),
-                    mimetype="application/json"
-                )
-            return func.HttpResponse("Usuario no encontrado", status_code=404)
-        
-        elif req.method == "PUT":
-            usuario = session.query(Usuario).filter(Usuario.id == usuario_id).first()
-            if usuario:
-                usuario_data = req.get_json()
-                for key, value in usuario_data.items():
-                    setattr(usuario, key, value)
-                session.commit()
-                return func.HttpResponse(
-                    json.dumps(to_dict(usuario)), 
-                    mimetype="application/json"
-                )
-            return func.HttpResponse("Usuario no encontrado", status_code=404)
-        
-        elif req.method == "DELETE":
-            usuario = session.query(Usuario).filter(Usuario.id == usuario_id).first()
-            if usuario:
-                session.delete(usuario)
-                session.commit()
-                return func.HttpResponse("Usuario eliminado", status_code=204)
-            return func.HttpResponse("Usuario no encontrado", status_code=404)
-    
+    except IntegrityError as e:
+        # Una fila referenciada se borró (o se creó un duplicado) después de la comprobación
+        logging.error(f"Error de base de datos: {str(e)}")
+        session.rollback()
+        return _error("El lote entra en conflicto con cambios concurrentes; vuelva a intentarlo", 409)
     except SQLAlchemyError as e:
         logging.error(f"Error de base de datos: {str(e)}")
-        return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos"}), 
-            mimetype="application/json", 
-            status_code=500
-        )
+        session.rollback()
+        return _error("Error de base de datos", 500)
     finally:
         session.close()
 
-# Destino Endpoints
-@app.route(route="destinos", methods=["GET", "POST"])
-def manage_destinos(req: func.HttpRequest) -> func.HttpResponse:
+@ruta("reservas:batch", ["POST"])
+def manage_reservas_batch(req: func.HttpRequest) -> func.HttpResponse:
+    items, error = _leer_lote(req)
+    if error:
+        return error
+
+    validos, errores = validar_lote(items, POR_MODELO["Reserva"].validador.crear)
     try:
         session = SessionLocal()
-        
-        if req.method == "GET":
-            destinos = session.query(Destino).all()
-            return func.HttpResponse(
-                json.dumps([to_dict(destino) for destino in destinos]),
-                mimetype="application/json"
-            )
-        
-        elif req.method == "POST":
-            destino_data = req.get_json()
-            nuevo_destino = Destino(**destino_data)
-            session.add(nuevo_destino)
-            session.commit()
-            return func.HttpResponse(
-                json.dumps(to_dict(nuevo_destino)), 
-                mimetype="application/json", 
-                status_code=201
-            )
-    
-    except SQLAlchemyError as e:
-        logging.error(f"Error de base de datos: {str(e)}")
+        validos, incumplidas = _reglas_lote(session, POR_MODELO["Reserva"], validos)
+        ids = insertar_lote(session, models.Reserva, [datos for _, datos in validos])
+        session.commit()
+        creados = [{"indice": indice, "id": id} for (indice, _), id in zip(validos, ids)]
+        errores = sorted(errores + incumplidas, key=lambda e: e["indice"])
         return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos"}), 
-            mimetype="application/json", 
-            status_code=500
+            json.dumps({"creados": creados, "errores": errores}),
+            mimetype="application/json",
+            status_code=201 if creados else 400
         )
-    finally:
-        session.close()
 
-@app.route(route="destinos/{destino_id}", methods=["GET", "PUT", "DELETE"])
-def manage_destino_by_id(req: func.HttpRequest) -> func.HttpResponse:
-    try:
-        session = SessionLocal()
-        destino_id = int(req.route_params.get('destino_id'))
-        
-        if req.method == "GET":
-            destino = session.query(Destino).filter(Destino.id == destino_id).first()
-            if destino:
-                return func.HttpResponse(
-                    json.dumps(to_dict(destino)),
-                    mimetype="application/json"
-                )
-            return func.HttpResponse("Destino no encontrado", status_code=404)
-        
-        elif req.method == "PUT":
-            destino = session.query(Destino).filter(Destino.id == destino_id).first()
-            if destino:
-                destino_data = req.get_json()
-                for key, value in destino_data.items():
-                    setattr(destino, key, value)
-                session.commit()
-                return func.HttpResponse(
-                    json.dumps(to_dict(destino)), 
-                    mimetype="application/json"
-                )
-            return func.HttpResponse("Destino no encontrado", status_code=404)
-        
-        elif req.method == "DELETE":
-            destino = session.query(Destino).filter(Destino.id == destino_id).first()
-            if destino:
-                session.delete(destino)
-                session.commit()
-                return func.HttpResponse(
-                    json.dumps({"message": "Destino eliminado exitosamente"}), 
-                    mimetype="application/json", 
-                    status_code=200
-                )
-            return func.HttpResponse("Destino no encontrado", status_code=404)
-
-    
+    except IntegrityError as e:
+        # Una fila referenciada se borró (o se creó un duplicado) después de la comprobación
+        logging.error(f"Error de base de datos: {str(e)}")
+        session.rollback()
+        return _error("El lote entra en conflicto con cambios concurrentes; vuelva a intentarlo", 409)
     except SQLAlchemyError as e:
         logging.error(f"Error de base de datos: {str(e)}")
-        return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos"}), 
-            mimetype="application/json", 
-            status_code=500
-        )
+        session.rollback()
+        return _error("Error de base de datos", 500)
     finally:
         session.close()
 
-# Reserva Endpoints
-def to_dict(obj):
-    """
-    Convierte un objeto SQLAlchemy a un diccionario, 
-    manejando conversión de fechas, relaciones y objetos datetime
-    """
-    from datetime import datetime
-    
-    # Si el objeto es None, devuelve None
-    if obj is None:
-        return None
-    
-    # Convierte el objeto a un diccionario
-    dict_obj = {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
-    
-    # Convierte datetime a string ISO format
-    for key, value in list(dict_obj.items()):
-        if isinstance(value, datetime):
-            dict_obj[key] = value.isoformat()
-        # Convierte objetos None a null
-        elif value is None:
-            dict_obj[key] = None
-    
-    return dict_obj
-
-@app.route(route="reservas", methods=["GET", "POST"])
-def manage_reservas(req: func.HttpRequest) -> func.HttpResponse:
+@ruta("guias:batch", ["DELETE"])
+def manage_guias_batch(req: func.HttpRequest) -> func.HttpResponse:
     try:
-        session = SessionLocal()
-        
-        if req.method == "GET":
-            reservas = session.query(Reserva).all()
-            return func.HttpResponse(
-                json.dumps([to_dict(reserva) for reserva in reservas]),
-                mimetype="application/json"
-            )
-        
-        elif req.method == "POST":
-            # Obtener datos de la solicitud
-            reserva_data = req.get_json()
-            
-            # Obtener los nombres de columnas del modelo Reserva
-            columnas_validas = [c.name for c in Reserva.__table__.columns]
-            
-            # Filtrar solo los datos válidos
-            datos_filtrados = {
-                key: value for key, value in reserva_data.items() 
-                if key in columnas_validas
-            }
-            
-            # Manejar conversión de fecha si está presente
-            if 'fecha' in datos_filtrados:
-                try:
-                    from datetime import datetime
-                    datos_filtrados['fecha'] = datetime.fromisoformat(datos_filtrados['fecha'])
-                except (ValueError, TypeError):
-                    return func.HttpResponse(
-                        json.dumps({"error": "Formato de fecha inválido"}),
-                        mimetype="application/json",
-                        status_code=400
-                    )
-            
-            # Crear nueva reserva solo con datos válidos
-            nueva_reserva = Reserva(**datos_filtrados)
-            session.add(nueva_reserva)
-            session.commit()
-            
-            return func.HttpResponse(
-                json.dumps(to_dict(nueva_reserva)),
-                mimetype="application/json",
-                status_code=201
-            )
-    
-    except SQLAlchemyError as e:
-        logging.error(f"Error de base de datos: {str(e)}")
+        ids = [int(i) for i in req.params.get("ids", "").split(",") if i.strip()]
+    except ValueError:
+        ids = None
+    if not ids or len(ids) > MAX_BATCH:
         return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos", "detalle": str(e)}),
+            json.dumps({"error": f"'ids' debe ser una lista de hasta {MAX_BATCH} enteros separados por comas"}),
             mimetype="application/json",
-            status_code=500
+            status_code=400
         )
-    finally:
-        session.close()
 
-@app.route(route="reservas/{reserva_id}", methods=["GET", "PUT", "DELETE"])
-def manage_reserva_by_id(req: func.HttpRequest) -> func.HttpResponse:
     try:
         session = SessionLocal()
-        reserva_id = int(req.route_params.get('reserva_id'))
-
-        if req.method == "GET":
-            # Obtener reserva por ID
-            reserva = session.query(Reserva).filter(Reserva.id == reserva_id).first()
-            
-            if reserva:
-                return func.HttpResponse(
-                    json.dumps(to_dict(reserva)),
-                    mimetype="application/json"
-                )
-            
-            return func.HttpResponse(
-                json.dumps({"error": "Reserva no encontrada"}),
-                mimetype="application/json",
-                status_code=404
-            )
-
-        elif req.method == "PUT":
-            # Buscar la reserva existente
-            reserva = session.query(Reserva).filter(Reserva.id == reserva_id).first()
-            
-            if not reserva:
-                return func.HttpResponse(
-                    json.dumps({"error": "Reserva no encontrada"}),
-                    mimetype="application/json",
-                    status_code=404
-                )
-
-            # Obtener datos de la solicitud
-            reserva_data = req.get_json()
-            
-            # Obtener columnas válidas
-            columnas_validas = [c.name for c in Reserva.__table__.columns]
-            
-            # Filtrar datos válidos
-            datos_filtrados = {
-                key: value for key, value in reserva_data.items() 
-                if key in columnas_validas
-            }
-            
-            # Manejar conversión de fecha si está presente
-            if 'fecha' in datos_filtrados:
-                try:
-                    from datetime import datetime
-                    datos_filtrados['fecha'] = datetime.fromisoformat(datos_filtrados['fecha'])
-                except (ValueError, TypeError):
-                    return func.HttpResponse(
-                        json.dumps({"error": "Formato de fecha inválido"}),
-                        mimetype="application/json",
-                        status_code=400
-                    )
-            
-            # Actualizar la reserva
-            for key, value in datos_filtrados.items():
-                setattr(reserva, key, value)
-            
-            session.commit()
-            
-            return func.HttpResponse(
-                json.dumps(to_dict(reserva)),
-                mimetype="application/json"
-            )
-
-        elif req.method == "DELETE":
-            # Buscar la reserva
-            reserva = session.query(Reserva).filter(Reserva.id == reserva_id).first()
-            
-            if not reserva:
-                return func.HttpResponse(
-                    json.dumps({"error": "Reserva no encontrada"}),
-                    mimetype="application/json",
-                    status_code=404
-                )
-            
-            # Eliminar la reserva
-            session.delete(reserva)
-            session.commit()
-            
-            return func.HttpResponse(
-                json.dumps({"message": "Reserva eliminada correctamente"}),
-                mimetype="application/json",
-                status_code=200
-            )
-
-    except ValueError:
+        eliminados, no_encontrados = eliminar_lote(session, models.Guia, ids)
+        session.commit()
         return func.HttpResponse(
-            json.dumps({"error": "ID de reserva inválido"}),
+            json.dumps({"eliminados": eliminados, "no_encontrados": no_encontrados}),
             mimetype="application/json",
-            status_code=400
+            status_code=200 if eliminados else 404
         )
-    
+
+    except IntegrityError as e:
+        # Alguna guía sigue referenciada (reservas, idiomas o calificaciones)
+        logging.error(f"Error de base de datos: {str(e)}")
+        session.rollback()
+        return _error("Alguna de las guías tiene registros relacionados y no se puede eliminar", 409)
     except SQLAlchemyError as e:
         logging.error(f"Error de base de datos: {str(e)}")
         session.rollback()
-        return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos", "detalle": str(e)}),
-            mimetype="application/json",
-            status_code=500
-        )
-    
+        return _error("Error de base de datos", 500)
     finally:
         session.close()
-# Guia Endpoints
-@app.route(route="guias", methods=["GET", "POST"])
-def manage_guias(req: func.HttpRequest) -> func.HttpResponse:
-    try:
-        session = SessionLocal()
-        
-        if req.method == "GET":
-            guias = session.query(Guia).all()
-            return func.HttpResponse(
-                json.dumps([to_dict(guia) for guia in guias], default=str),
-                mimetype="application/json"
-            )
-        
-        elif req.method == "POST":
-            guia_data = req.get_json()
-
-            # Validar que f_nacimiento esté presente y tenga un valor válido
-            if "f_nacimiento" not in guia_data or not guia_data["f_nacimiento"]:
-                return func.HttpResponse(
-                    json.dumps({"error": "El campo 'f_nacimiento' es obligatorio."}),
-                    mimetype="application/json",
-                    status_code=400
-                )
-
-            # Convertir la fecha a un objeto datetime
+
+# Exportación de reservas: reservas/export?format=ndjson|csv&desde=&hasta=&incluir=destino,guias,usuarios
+def _descarga(formato):
+    return {"Content-Disposition": f'attachment; filename="reservas.{formato}"'}
+
+if HTTP_STREAMS:
+    @ruta("reservas/export", ["GET"])
+    async def manage_reservas_export(req: Request) -> StreamingResponse:
+        try:
+            formato, desde, hasta, incluir = parse_export_params(req.query_params)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        stmt = consulta(desde, hasta, incluir)
+
+        async def cuerpo():
+            session = (AsyncReadSessionLocal if de_replica(req) else AsyncSessionLocal)()
             try:
-                guia_data["f_nacimiento"] = datetime.strptime(guia_data["f_nacimiento"], "%Y-%m-%d")
-            except ValueError:
-                return func.HttpResponse(
-                    json.dumps({"error": "Formato de fecha incorrecto. Usa 'YYYY-MM-DD'."}),
-                    mimetype="application/json",
-                    status_code=400
-                )
-
-            nuevo_guia = Guia(**guia_data)
-            session.add(nuevo_guia)
-            session.commit()
-            return func.HttpResponse(
-                json.dumps(to_dict(nuevo_guia), default=str)
-, 
-                mimetype="application/json", 
-                status_code=201
-            )
-    
-    except SQLAlchemyError as e:
-        logging.error(f"Error de base de datos: {str(e)}")
+                async for bloque in exportar_async(session, stmt, formato):
+                    yield bloque.encode()
+            except SQLAlchemyError as e:
+                # El status ya se envió: se registra el error y la respuesta queda cortada
+                logging.error(f"Error de base de datos: {str(e)}")
+                raise
+            finally:
+                await session.close()
+
+        return StreamingResponse(cuerpo(), media_type=FORMATOS[formato], headers=_descarga(formato))
+else:
+    @ruta("reservas/export", ["GET"])
+    def manage_reservas_export(req: func.HttpRequest) -> func.HttpResponse:
+        try:
+            formato, desde, hasta, incluir = parse_export_params(req.params)
+        except ValueError as e:
+            return _error(str(e))
+
+        headers = _descarga(formato)
+        session = (ReadSessionLocal if de_replica(req) else SessionLocal)()
+        try:
+            cuerpo = escribir(exportar(session, consulta(desde, hasta, incluir), formato), headers, FORMATOS[formato])
+        except SQLAlchemyError as e:
+            logging.error(f"Error de base de datos: {str(e)}")
+            return _error("Error de base de datos", 500)
+        finally:
+            session.close()
         return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos"}), 
-            mimetype="application/json", 
-            status_code=500
+            cuerpo,
+            mimetype=FORMATOS[formato],
+            charset="utf-8",
+            headers=headers
         )
-    finally:
-        session.close()
 
-@app.route(route="guias/{guia_id}", methods=["GET", "PUT", "DELETE"])
-def manage_guia_by_id(req: func.HttpRequest) -> func.HttpResponse:
+# Importación masiva de catálogo: bundle NDJSON o CSV con filas de pais, ciudad, destino y guia
+@ruta("import", ["POST"])
+def manage_import(req: func.HttpRequest) -> func.HttpResponse:
+    tipo = (req.headers.get("Content-Type") or "").split(";")[0].strip()
+    formato = req.params.get("format", "csv" if tipo == FORMATOS["csv"] else "ndjson")
+    if formato not in FORMATOS:
+        return _error(f"'format' debe ser uno de {', '.join(FORMATOS)}")
+    try:
+        filas, errores = leer_bundle(req.get_body(), formato)
+    except (UnicodeDecodeError, csv.Error) as e:
+        return _error(f"No se pudo leer el bundle: {str(e)}")
+    if not filas and not errores:
+        return _error("El bundle está vacío")
+    if len(filas) > MAX_IMPORT:
+        return _error(f"El bundle supera el máximo de {MAX_IMPORT} filas")
+
     try:
         session = SessionLocal()
-        guia_id = int(req.route_params.get('guia_id'))
-        
-        if req.method == "GET":
-            guia = session.query(Guia).filter(Guia.id == guia_id).first()
-            if guia:
-                return func.HttpResponse(
-                    json.dumps(to_dict(guia), default=str),
-                    mimetype="application/json"
-                )
-            return func.HttpResponse("Guia no encontrado", status_code=404)
-        
-        elif req.method == "PUT":
-            guia = session.query(Guia).filter(Guia.id == guia_id).first()
-            if guia:
-                guia_data = req.get_json()
-                for key, value in guia_data.items():
-                    setattr(guia, key, value)
-                session.commit()
-                return func.HttpResponse(
-                    json.dumps(to_dict(guia), default=str), 
-                    mimetype="application/json"
-                )
-            return func.HttpResponse("Guia no encontrado", status_code=404)
-        
-        elif req.method == "DELETE":
-            guia = session.query(Guia).filter(Guia.id == guia_id).first()
-            if guia:
-                session.delete(guia)
-                session.commit()
-                return func.HttpResponse("Guia eliminado", status_code=204)
-            return func.HttpResponse("Guia no encontrado", status_code=404)
-    
-    except SQLAlchemyError as e:
-        logging.error(f"Error de base de datos: {str(e)}")
+        planes, invalidas = validar(session, filas)
+        creados = importar(session, planes)
+        session.commit()
+        errores = sorted(errores + invalidas, key=lambda e: e["linea"])
         return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos"}), 
-            mimetype="application/json", 
-            status_code=500
+            json.dumps({"creados": creados, "errores": errores}),
+            mimetype="application/json",
+            status_code=201 if any(creados.values()) else 400
         )
-    finally:
-        session.close()
 
-# Genero Endpoints
-@app.route(route="generos", methods=["GET", "POST"])
-def manage_generos(req: func.HttpRequest) -> func.HttpResponse:
-    try:
-        session = SessionLocal()
-        
-        if req.method == "GET":
-            generos = session.query(Genero).all()
-            return func.HttpResponse(
-                json.dumps([to_dict(genero) for genero in generos]),
-                mimetype="application/json"
-            )
-        
-        elif req.method == "POST":
-            genero_data = req.get_json()
-            nuevo_genero = Genero(**genero_data)
-            session.add(nuevo_genero)
-            session.commit()
-            return func.HttpResponse(
-                json.dumps(to_dict(nuevo_genero)), 
-                mimetype="application/json", 
-                status_code=201
-            )
-    
+    except IntegrityError as e:
+        # Como en los lotes: una fila referenciada se borró (o se creó un duplicado) después de validar
+        logging.error(f"Error de base de datos: {str(e)}")
+        session.rollback()
+        return _error("El bundle entra en conflicto con cambios concurrentes; vuelva a intentarlo", 409)
     except SQLAlchemyError as e:
         logging.error(f"Error de base de datos: {str(e)}")
-        return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos"}), 
-            mimetype="application/json", 
-            status_code=500
-        )
+        session.rollback()
+        return _error("Error de base de datos", 500)
     finally:
         session.close()
 
-@app.route(route="generos/{genero_id}", methods=["GET", "PUT", "DELETE"])
-def manage_genero_by_id(req: func.HttpRequest) -> func.HttpResponse:
-    try:
+if ingestion.COLA:
+    # Estado de una escritura diferida: pendiente hasta que su lote se confirma.
+    # Se lee de la primaria: en la réplica seguiría pendiente durante su retraso
+    @ruta("escrituras/{escritura_id}", ["GET"])
+    def manage_escritura_by_id(req: func.HttpRequest) -> func.HttpResponse:
+        try:
+            id = str(uuid.UUID(req.route_params.get("escritura_id")))
+        except (TypeError, ValueError):
+            return _error("ID inválido")
+
         session = SessionLocal()
-        genero_id = int(req.route_params.get('genero_id'))
-        
-        if req.method == "GET":
-            genero = session.query(Genero).filter(Genero.id == genero_id).first()
-            if genero:
-                return func.HttpResponse(
-                    json.dumps(to_dict(genero)),
-                    mimetype="application/json"
-                )
-            return func.HttpResponse("Genero no encontrado", status_code=404)
-        
-        elif req.method == "PUT":
-            genero = session.query(Genero).filter(Genero.id == genero_id).first()
-            if genero:
-                genero_data = req.get_json()
-                for key, value in genero_data.items():
-                    setattr(genero, key, value)
-                session.commit()
-                return func.HttpResponse(
-                    json.dumps(to_dict(genero)), 
-                    mimetype="application/json"
-                )
-            return func.HttpResponse(
-                json.dumps({"error": "Género no encontrado"}), 
-                mimetype="application/json", 
-                status_code=404
-            )
-        
-        elif req.method == "DELETE":
-            genero = session.query(Genero).filter(Genero.id == genero_id).first()
-            if genero:
-                session.delete(genero)
-                session.commit()
-                return func.HttpResponse(
-                    json.dumps({"message": "Genero eliminado correctamente"}), 
-                    mimetype="application/json", 
-                    status_code=200
-                )
+        try:
+            escritura = ingestion.estado(session, id)
+        except SQLAlchemyError as e:
+            logging.error(f"Error de base de datos: {str(e)}")
+            return _error("Error de base de datos", 500)
+        finally:
+            session.close()
+        if escritura is None:
             return func.HttpResponse(
-                json.dumps({"error": "Genero no encontrado"}), 
-                mimetype="application/json", 
-                status_code=404
+                json.dumps({"id": id, "estado": "pendiente"}),
+                mimetype="application/json",
+                headers={"Retry-After": "1"}
             )
-
-    
-    except SQLAlchemyError as e:
-        logging.error(f"Error de base de datos: {str(e)}")
         return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos"}), 
-            mimetype="application/json", 
-            status_code=500
+            to_json(escritura),
+            mimetype="application/json"
         )
-    finally:
-        session.close()
 
-# Pais Endpoints
-@app.route(route="paises", methods=["GET", "POST"])
-def manage_paises(req: func.HttpRequest) -> func.HttpResponse:
-    try:
+    # Aplica las escrituras encoladas: al mensaje que dispara la función se suman
+    # hasta API_WRITE_BATCH - 1 más leídos de la cola y se confirman en una transacción
+    @app.queue_trigger(arg_name="mensaje", queue_name=ingestion.COLA, connection="AzureWebJobsStorage")
+    def aplicar_escrituras(mensaje: func.QueueMessage) -> None:
+        recibidos = ingestion.recibir(ingestion.LOTE - 1)
         session = SessionLocal()
-        
-        if req.method == "GET":
-            paises = session.query(Pais).all()
-            return func.HttpResponse(
-                json.dumps([to_dict(pais) for pais in paises]),
-                mimetype="application/json"
+        try:
+            resumen = ingestion.aplicar_lote(
+                session, [mensaje.get_json(), *(escritura for _, escritura in recibidos)], _regla_incumplida
             )
-        
-        elif req.method == "POST":
-            pais_data = req.get_json()
-            nuevo_pais = Pais(**pais_data)
-            session.add(nuevo_pais)
             session.commit()
-            return func.HttpResponse(
-                json.dumps(to_dict(nuevo_pais)), 
-                mimetype="application/json", 
-                status_code=201
-            )
-    
+        except SQLAlchemyError as e:
+            # Sin confirmar el lote: el mensaje se reintenta y los leídos vuelven a la cola
+            logging.error(f"Error de base de datos: {str(e)}")
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        ingestion.confirmar(recibidos)
+        logging.info(json.dumps({"funcion": "aplicar_escrituras", **resumen}))
+
+# Refresco incremental de las estadísticas: procesa los cambios anotados en
+# transacciones de API_STATS_BATCH cambios hasta vaciar el registro
+@app.timer_trigger(arg_name="timer", schedule=os.getenv("API_STATS_SCHEDULE", "0 */5 * * * *"), run_on_startup=False)
+def refrescar_estadisticas(timer: func.TimerRequest) -> None:
+    session = SessionLocal()
+    total = 0
+    try:
+        while True:
+            procesados = estadisticas.refrescar(session)
+            session.commit()
+            total += procesados
+            if procesados < STATS_BATCH:
+                break
     except SQLAlchemyError as e:
         logging.error(f"Error de base de datos: {str(e)}")
-        return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos"}), 
-            mimetype="application/json", 
-            status_code=500
-        )
+        session.rollback()
+        raise
     finally:
         session.close()
+    logging.info(json.dumps({"funcion": "refrescar_estadisticas", "cambios": total}))
 
-@app.route(route="paises/{pais_id}", methods=["GET", "PUT", "DELETE"])
-def manage_pais_by_id(req: func.HttpRequest) -> func.HttpResponse:
-    try:
-        session = SessionLocal()
-        pais_id = int(req.route_params.get('pais_id'))
-        
-        if req.method == "GET":
-            pais = session.query(Pais).filter(Pais.id == pais_id).first()
-            if pais:
-                return func.HttpResponse(
-                    json.dumps(to_dict(pais)),
-                    mimetype="application/json"
-                )
-            return func.HttpResponse("Pais no encontrado", status_code=404)
-        
-        elif req.method == "PUT":
-            pais = session.query(Pais).filter(Pais.id == pais_id).first()
-            if pais:
-                pais_data = req.get_json()
-                for key, value in pais_data.items():
-                    setattr(pais, key, value)
-                session.commit()
-                return func.HttpResponse(
-                    json.dumps(to_dict(pais)), 
-                    mimetype="application/json"
-                )
-            return func.HttpResponse("Pais no encontrado", status_code=404)
-        
-        elif req.method == "DELETE":
-            pais = session.query(Pais).filter(Pais.id == pais_id).first()
-            if pais:
-                session.delete(pais)
-                session.commit()
-                return func.HttpResponse("Pais eliminado", status_code=204)
-            return func.HttpResponse("Pais no encontrado", status_code=404)
-    
-    except SQLAlchemyError as e:
-        logging.error(f"Error de base de datos: {str(e)}")
+# Diagnóstico (solo con la clave maestra): lecturas coalescidas por ruta y query string
+@ruta("diagnostico/coalescencia", ["GET", "DELETE"], auth_level=func.AuthLevel.ADMIN)
+def manage_diagnostico_coalescencia(req: func.HttpRequest) -> func.HttpResponse:
+    if req.method == "DELETE":
+        coalescencia.reset()
         return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos"}), 
-            mimetype="application/json", 
-            status_code=500
+            json.dumps({"message": "Estadísticas de coalescencia reiniciadas"}),
+            mimetype="application/json",
+            status_code=200
         )
-    finally:
-        session.close()
 
-# Ciudad Endpoints
-@app.route(route="ciudades", methods=["GET", "POST"])
-def manage_ciudades(req: func.HttpRequest) -> func.HttpResponse:
     try:
-        session = SessionLocal()
-        
-        if req.method == "GET":
-            ciudades = session.query(Ciudad).all()
-            return func.HttpResponse(
-                json.dumps([to_dict(ciudad) for ciudad in ciudades]),
-                mimetype="application/json"
-            )
-        
-        elif req.method == "POST":
-            try:
-                ciudad_data = req.get_json()
-                
-                # Verificar que el JSON incluye 'pais_id'
-                if "pais_id" not in ciudad_data or not ciudad_data["pais_id"]:
-                    return func.HttpResponse(
-                        json.dumps({"error": "El campo 'pais_id' es obligatorio"}), 
-                        mimetype="application/json", 
-                        status_code=400
-                    )
-
-                # Verificar que el 'pais_id' existe en la base de datos
-                pais_existente = session.query(Pais).filter(Pais.id == ciudad_data["pais_id"]).first()
-                if not pais_existente:
-                    return func.HttpResponse(
-                        json.dumps({"error": "El 'pais_id' proporcionado no existe"}), 
-                        mimetype="application/json", 
-                        status_code=400
-                    )
-
-                # Crear la ciudad con los datos validados
-                nueva_ciudad = Ciudad(**ciudad_data)
-                session.add(nueva_ciudad)
-                session.commit()
-
-                return func.HttpResponse(
-                    json.dumps(to_dict(nueva_ciudad)), 
-                    mimetype="application/json", 
-                    status_code=201
-                )
-
-            except SQLAlchemyError as e:
-                session.rollback()  # Revertir cambios si hay error
-                logging.error(f"Error de base de datos: {str(e)}")
-                return func.HttpResponse(
-                    json.dumps({"error": "Error de base de datos"}), 
-                    mimetype="application/json", 
-                    status_code=500
-                )
-
-    
-    except SQLAlchemyError as e:
-        logging.error(f"Error de base de datos: {str(e)}")
+        top = int(req.params.get("top", "20"))
+    except ValueError:
+        top = 0
+    if top < 1:
+        return _error("'top' debe ser un entero positivo")
+
+    return func.HttpResponse(
+        json.dumps({"activa": COALESCE, "espera_s": coalescencia.espera, "claves": coalescencia.top(top)}),
+        mimetype="application/json"
+    )
+
+# Diagnóstico (solo con la clave maestra): consultas más costosas del worker.
+# El host de Functions reserva el prefijo /admin, por eso la ruta es /diagnostico
+@ruta("diagnostico/consultas", ["GET", "DELETE"], auth_level=func.AuthLevel.ADMIN)
+def manage_diagnostico_consultas(req: func.HttpRequest) -> func.HttpResponse:
+    if req.method == "DELETE":
+        consultas.reset()
         return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos"}), 
-            mimetype="application/json", 
-            status_code=500
+            json.dumps({"message": "Estadísticas de consultas reiniciadas"}),
+            mimetype="application/json",
+            status_code=200
         )
-    finally:
-        session.close()
 
-@app.route(route="ciudades/{ciudad_id}", methods=["GET", "PUT", "DELETE"])
-def manage_ciudad_by_id(req: func.HttpRequest) -> func.HttpResponse:
+    orden = req.params.get("orden", "total")
     try:
-        session = SessionLocal()
-        ciudad_id = int(req.route_params.get('ciudad_id'))
-        
-        if req.method == "GET":
-            ciudad = session.query(Ciudad).filter(Ciudad.id == ciudad_id).first()
-            if ciudad:
-                return func.HttpResponse(
-                    json.dumps(to_dict(ciudad)),
-                    mimetype="application/json"
-                )
-            return func.HttpResponse("Ciudad no encontrada", status_code=404)
-        
-        elif req.method == "PUT":
-            ciudad = session.query(Ciudad).filter(Ciudad.id == ciudad_id).first()
-            if ciudad:
-                ciudad_data = req.get_json()
-                for key, value in ciudad_data.items():
-                    setattr(ciudad, key, value)
-                session.commit()
-                return func.HttpResponse(
-                    json.dumps(to_dict(ciudad)), 
-                    mimetype="application/json"
-                )
-            return func.HttpResponse("Ciudad no encontrada", status_code=404)
-        
-        elif req.method == "DELETE":
-            ciudad = session.query(Ciudad).filter(Ciudad.id == ciudad_id).first()
-            if ciudad:
-                session.delete(ciudad)
-                session.commit()
-                return func.HttpResponse("Ciudad eliminada", status_code=204)
-            return func.HttpResponse("Ciudad no encontrada", status_code=404)
-    
-    except SQLAlchemyError as e:
-        logging.error(f"Error de base de datos: {str(e)}")
-        return func.HttpResponse(
-            json.dumps({"error": "Error de base de datos"}), 
-            mimetype="application/json", 
-            status_code=500
-        )
-    finally:
-        session.close()
\ No newline at end of file
+        top = int(req.params.get("top", "20"))
+    except ValueError:
+        top = 0
+    if orden not in ("total", "count", "max", "avg") or top < 1:
+        return _error("'top' debe ser un entero positivo y 'orden' uno de total, count, max, avg")
+
+    return func.HttpResponse(
+        json.dumps({"umbral_ms": consultas.umbral_ms, "consultas": consultas.top(top, orden)}),
+        mimetype="application/json"
+    )
@@ -0,0 +1,30 @@
+import json
+import logging
+
+import azure.functions as func
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.db import AsyncReadSessionLocal, AsyncSessionLocal
+from src.replica import de_replica
+
+
+async def ejecutar(handler, req, *args):
+    """
+    Ejecuta `handler(session, req, *args)` sobre una AsyncSession mediante
+    run_sync: el código de acceso a datos es el mismo que en la variante
+    síncrona, pero cada consulta se espera en el event loop a través del
+    driver async, sin ocupar un hilo del worker mientras la base responde.
+    """
+    session = (AsyncReadSessionLocal if de_replica(req) else AsyncSessionLocal)()
+    try:
+        return await session.run_sync(handler, req, *args)
+    except SQLAlchemyError as e:
+        logging.error(f"Error de base de datos: {str(e)}")
+        await session.rollback()
+        return func.HttpResponse(
+            json.dumps({"error": "Error de base de datos"}),
+            mimetype="application/json",
+            status_code=500
+        )
+    finally:
+        await session.close()
@@ -0,0 +1,108 @@
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import select
+
+from src import models
+
+
+def dia(fecha):
+    """Intervalo [inicio, fin) del día natural de `fecha`."""
+    inicio = datetime.combine(fecha.date(), time.min)
+    return inicio, inicio + timedelta(days=1)
+
+
+def _reservas_del_dia(fecha):
+    # Parte de ix_reserva_fecha (solo las reservas de ese día) y llega a las
+    # guías por ix_reserva_guia_reserva, sin recorrer la tabla de reservas
+    inicio, fin = dia(fecha)
+    reserva, asignacion = models.Reserva, models.ReservaGuia
+    return (
+        select(asignacion.guia_id)
+        .join(reserva, reserva.id == asignacion.reserva_id)
+        .where(reserva.fecha >= inicio, reserva.fecha < fin)
+    )
+
+
+def filtros_disponibles(fecha, idioma_id=None, ciudad_id=None):
+    """
+    Condiciones sobre Guia para listar las guías libres en el día de `fecha`:
+    sin ninguna reserva asignada ese día, que hablen `idioma_id` (por
+    ix_guia_idioma_idioma) y que ya hayan guiado reservas en destinos de
+    `ciudad_id`, ya que las guías no tienen ciudad propia en el modelo.
+    """
+    guia = models.Guia
+    filtros = [guia.id.not_in(_reservas_del_dia(fecha))]
+    if idioma_id is not None:
+        filtros.append(guia.id.in_(
+            select(models.GuiaIdioma.guia_id).where(models.GuiaIdioma.idioma_id == idioma_id)
+        ))
+    if ciudad_id is not None:
+        reserva, asignacion = models.Reserva, models.ReservaGuia
+        filtros.append(guia.id.in_(
+            select(asignacion.guia_id)
+            .join(reserva, reserva.id == asignacion.reserva_id)
+            .join(models.Destino, models.Destino.id == reserva.destino_id)
+            .where(models.Destino.ciudad_id == ciudad_id)
+        ))
+    return filtros
+
+
+def conflicto(session, guia_id, fecha, excluir_asignacion=None, excluir_reserva=None):
+    """
+    Id de otra reserva asignada a `guia_id` el mismo día que `fecha`, o None.
+    Recorre solo las asignaciones de esa guía (ix_reserva_guia_guia).
+    """
+    inicio, fin = dia(fecha)
+    reserva, asignacion = models.Reserva, models.ReservaGuia
+    stmt = (
+        select(reserva.id)
+        .join(asignacion, asignacion.reserva_id == reserva.id)
+        .where(asignacion.guia_id == guia_id, reserva.fecha >= inicio, reserva.fecha < fin)
+        .limit(1)
+    )
+    if excluir_asignacion is not None:
+        stmt = stmt.where(asignacion.id != excluir_asignacion)
+    if excluir_reserva is not None:
+        stmt = stmt.where(reserva.id != excluir_reserva)
+    return session.execute(stmt).scalar()
+
+
+def _bloquear_guia(session, guia_id):
+    # Serializa las asignaciones concurrentes de una misma guía: en SQL Server
+    # se lee con UPDLOCK y la otra transacción espera hasta el commit
+    session.execute(select(models.Guia.id).where(models.Guia.id == guia_id).with_for_update())
+
+
+def _mensaje(guia_id, reserva_id, fecha):
+    return f"La guía {guia_id} ya tiene asignada la reserva {reserva_id} el {fecha:%Y-%m-%d}"
+
+
+def comprobar_asignacion(session, datos, actual=None):
+    """Rechaza crear o mover una fila de reserva_guia si la guía ya está ocupada ese día."""
+    guia_id = datos.get("guia_id", actual.guia_id if actual is not None else None)
+    reserva_id = datos.get("reserva_id", actual.reserva_id if actual is not None else None)
+    if guia_id is None or reserva_id is None:
+        return None
+    reserva = session.get(models.Reserva, reserva_id)
+    if reserva is None:
+        return None
+
+    _bloquear_guia(session, guia_id)
+    otra = conflicto(session, guia_id, reserva.fecha, excluir_asignacion=actual.id if actual is not None else None)
+    return _mensaje(guia_id, otra, reserva.fecha) if otra is not None else None
+
+
+def comprobar_reserva(session, datos, actual=None):
+    """Rechaza cambiar la fecha de una reserva si alguna de sus guías está ocupada el nuevo día."""
+    fecha = datos.get("fecha")
+    if actual is None or fecha is None or fecha.date() == actual.fecha.date():
+        return None
+    guias = session.execute(
+        select(models.ReservaGuia.guia_id).where(models.ReservaGuia.reserva_id == actual.id)
+    ).scalars().all()
+    for guia_id in sorted(set(guias)):
+        _bloquear_guia(session, guia_id)
+        otra = conflicto(session, guia_id, fecha, excluir_reserva=actual.id)
+        if otra is not None:
+            return _mensaje(guia_id, otra, fecha)
+    return None
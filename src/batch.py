@@ -0,0 +1,111 @@
+import os
+
+from sqlalchemy import delete, insert, select, update
+
+from src.timing import contar_filas
+
+# Número máximo de elementos aceptados en una petición por lotes
+MAX_BATCH = int(os.getenv("API_MAX_BATCH", "5000"))
+
+# Valores por consulta IN al precargar claves (SQL Server admite 2100 parámetros)
+BLOQUE_IN = 1000
+
+
+def validar_lote(items, validar):
+    """
+    Aplica `validar(item)` a cada elemento del lote.
+    Devuelve (validos, errores): `validos` son pares (indice, datos) y
+    `errores` una lista de {"indice", "error"} para los elementos rechazados.
+    """
+    validos = []
+    errores = []
+    for indice, item in enumerate(items):
+        if not isinstance(item, dict):
+            errores.append({"indice": indice, "error": "Se esperaba un objeto"})
+            continue
+        try:
+            validos.append((indice, validar(item)))
+        except ValueError as e:
+            errores.append({"indice": indice, "error": str(e)})
+    return validos, errores
+
+
+def claves_existentes(session, columna, valores):
+    """Subconjunto de `valores` que existe en `columna`, con una consulta IN por bloque."""
+    valores = sorted(valores)
+    existentes = set()
+    for i in range(0, len(valores), BLOQUE_IN):
+        existentes.update(session.scalars(select(columna).where(columna.in_(valores[i:i + BLOQUE_IN]))))
+    return existentes
+
+
+def validar_referencias(session, referencias, validos):
+    """
+    Comprueba las FK de todo el lote con una consulta IN por columna en
+    lugar de una por elemento. `referencias` es {columna FK: columna
+    referenciada}. Devuelve (validos, errores) como validar_lote; los
+    errores llevan status_code 422 (el elemento es correcto pero apunta a
+    una fila que no existe).
+    """
+    existentes = {
+        columna: claves_existentes(session, destino, {datos[columna] for _, datos in validos if datos.get(columna) is not None})
+        for columna, destino in referencias.items()
+    }
+    aceptados = []
+    errores = []
+    for indice, datos in validos:
+        faltante = next(
+            (columna for columna in referencias if datos.get(columna) is not None and datos[columna] not in existentes[columna]),
+            None
+        )
+        if faltante is None:
+            aceptados.append((indice, datos))
+        else:
+            errores.append({"indice": indice, "status_code": 422, "error": f"El '{faltante}' proporcionado no existe"})
+    return aceptados, errores
+
+
+def insertar_lote(session, modelo, filas):
+    """
+    Inserta todas las filas con un único INSERT por lotes (insertmanyvalues)
+    y devuelve los ids generados en el mismo orden.
+    """
+    if not filas:
+        return []
+    result = session.execute(insert(modelo).returning(modelo.id, sort_by_parameter_order=True), filas)
+    ids = list(result.scalars())
+    contar_filas(len(ids))
+    return ids
+
+
+def actualizar_lote(session, modelo, validos):
+    """
+    Actualiza por clave primaria con executemany. `validos` son pares
+    (indice, datos) con "id" en los datos. Devuelve (actualizados, errores).
+    """
+    existentes = claves_existentes(session, modelo.id, {datos["id"] for _, datos in validos})
+
+    filas = []
+    actualizados = []
+    errores = []
+    for indice, datos in validos:
+        if datos["id"] in existentes:
+            filas.append(datos)
+            actualizados.append(datos["id"])
+        else:
+            errores.append({"indice": indice, "error": f"No existe el id {datos['id']}"})
+
+    if filas:
+        session.execute(update(modelo), filas)
+    return actualizados, errores
+
+
+def eliminar_lote(session, modelo, ids):
+    """Elimina con un DELETE por bloque de BLOQUE_IN ids. Devuelve (eliminados, no_encontrados)."""
+    ids = list(dict.fromkeys(ids))
+    existentes = claves_existentes(session, modelo.id, ids)
+    ordenados = sorted(existentes)
+    for i in range(0, len(ordenados), BLOQUE_IN):
+        session.execute(delete(modelo).where(modelo.id.in_(ordenados[i:i + BLOQUE_IN])))
+    eliminados = [i for i in ids if i in existentes]
+    return eliminados, [i for i in ids if i not in existentes]
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+
+class TTLCache:
+    """Caché LRU acotada en tamaño con expiración por TTL y contadores de aciertos."""
+
+    def __init__(self, maxsize=128, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+_MISSING = object()
+
+
+class ReferenceCache:
+    """
+    Caché por worker para tablas de referencia (paises, generos, ...).
+    Guarda listados ya serializados y el conjunto de ids de cada tabla; se
+    invalida con `invalidate` cuando se confirman cambios sobre sus modelos.
+    """
+
+    def __init__(self, tables, maxsize=128, ttl=300.0):
+        self._caches = {table: TTLCache(maxsize, ttl) for table in tables}
+
+    def cached(self, model):
+        return model.__tablename__ in self._caches
+
+    def covers(self, column):
+        """Indica si la tabla de `column` (p. ej. el destino de una FK) está en caché."""
+        return column.table.name in self._caches
+
+    def get_or_load(self, model, key, loader):
+        """Devuelve (valor, acierto); en un fallo ejecuta `loader` y guarda el resultado."""
+        return self._get_or_load(model.__tablename__, key, loader)
+
+    def _get_or_load(self, table, key, loader):
+        cache = self._caches[table]
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value, True
+        value = loader()
+        cache.set(key, value)
+        return value, False
+
+    def exists(self, session, column, value):
+        """
+        Comprueba si existe una fila con `column == value` (p. ej. el destino
+        de una FK). Un valor ausente del conjunto en caché se confirma contra
+        la base de datos, por si lo creó otro worker después de cargar la caché.
+        """
+        valores, _ = self._get_or_load(
+            column.table.name, ("valores", column.name),
+            lambda: frozenset(session.scalars(select(column)))
+        )
+        if value in valores:
+            return True
+        return session.scalar(select(column).where(column == value).limit(1)) is not None
+
+    def invalidate(self, *models):
+        for model in models:
+            cache = self._caches.get(model.__tablename__)
+            if cache is not None:
+                cache.clear()
+
+    def stats(self):
+        return {table: cache.stats() for table, cache in self._caches.items()}
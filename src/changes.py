@@ -0,0 +1,68 @@
+from sqlalchemy import event
+
+_CLAVE = "modelos_modificados"
+
+
+class ChangeTracker:
+    """
+    Registra qué modelos modifica cada sesión (flush del ORM o DML masivo) y
+    avisa a los suscriptores antes y después de confirmar la transacción.
+    """
+
+    def __init__(self):
+        self._before_commit = []
+        self._after_commit = []
+
+    def before_commit(self, callback):
+        """`callback(session, modelos)` se ejecuta dentro de la transacción."""
+        self._before_commit.append(callback)
+        return callback
+
+    def after_commit(self, callback):
+        """`callback(modelos)` se ejecuta una vez confirmada la transacción."""
+        self._after_commit.append(callback)
+        return callback
+
+    def bind(self, session_factory):
+        @event.listens_for(session_factory, "after_flush")
+        def _registrar_flush(session, flush_context):
+            modificados = session.info.setdefault(_CLAVE, set())
+            for obj in (*session.new, *session.dirty, *session.deleted):
+                modificados.add(type(obj))
+
+        @event.listens_for(session_factory, "do_orm_execute")
+        def _registrar_dml(orm_execute_state):
+            if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+                mapper = orm_execute_state.bind_mapper
+                if mapper is not None:
+                    orm_execute_state.session.info.setdefault(_CLAVE, set()).add(mapper.class_)
+
+        @event.listens_for(session_factory, "before_commit")
+        def _antes(session):
+            # Los savepoints (begin_nested) también emiten before/after_commit y
+            # after_rollback: solo cuenta el final de la transacción completa
+            if not self._before_commit or session.in_nested_transaction():
+                return
+            # El flush final del commit ocurre después de este evento
+            session.flush()
+            modificados = session.info.get(_CLAVE)
+            if modificados:
+                for callback in self._before_commit:
+                    callback(session, frozenset(modificados))
+
+        @event.listens_for(session_factory, "after_commit")
+        def _despues(session):
+            if session.in_nested_transaction():
+                return
+            modificados = session.info.pop(_CLAVE, None)
+            if modificados:
+                for callback in self._after_commit:
+                    callback(frozenset(modificados))
+
+        @event.listens_for(session_factory, "after_rollback")
+        def _descartar(session):
+            # Deshacer un savepoint (p. ej. una escritura rechazada dentro de un
+            # lote) no descarta lo registrado por el resto de la transacción
+            if session.in_nested_transaction():
+                return
+            session.info.pop(_CLAVE, None)
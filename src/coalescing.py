@@ -0,0 +1,204 @@
+import asyncio
+import functools
+import inspect
+import threading
+
+import azure.functions as func
+
+# Entrada que agrupa las claves nuevas cuando se alcanza max_claves
+OTRAS = "<otras peticiones>"
+
+
+class _Vuelo:
+    """Una ejecución en curso: el resultado (o la excepción) se comparte con quienes esperan."""
+
+    __slots__ = ("hecho", "futuro", "resultado", "error", "esperando")
+
+    def __init__(self, futuro=None):
+        self.hecho = threading.Event() if futuro is None else None
+        self.futuro = futuro
+        self.resultado = None
+        self.error = None
+        self.esperando = 0
+
+
+class _Estadistica:
+    __slots__ = ("peticiones", "ejecuciones", "coalescidas", "agotadas", "max_esperando")
+
+    def __init__(self):
+        self.peticiones = 0
+        self.ejecuciones = 0
+        self.coalescidas = 0
+        self.agotadas = 0
+        self.max_esperando = 0
+
+    def to_dict(self, clave):
+        return {
+            "clave": clave,
+            "peticiones": self.peticiones,
+            "ejecuciones": self.ejecuciones,
+            "coalescidas": self.coalescidas,
+            "agotadas": self.agotadas,
+            "max_esperando": self.max_esperando,
+        }
+
+
+def _instantanea(respuesta):
+    # Lo que se comparte es una copia inmutable de la respuesta: medido() escribe
+    # Server-Timing en los headers de cada una. El cuerpo (bytes) no se copia
+    return (respuesta.get_body(), respuesta.status_code, dict(respuesta.headers), respuesta.mimetype, respuesta.charset)
+
+
+def _respuesta(instantanea, compartida):
+    cuerpo, status_code, headers, mimetype, charset = instantanea
+    headers = dict(headers)
+    if compartida:
+        headers["X-Coalesced"] = "1"
+    return func.HttpResponse(cuerpo, status_code=status_code, headers=headers, mimetype=mimetype, charset=charset)
+
+
+class SingleFlight:
+    """
+    Coalescencia de lecturas idénticas concurrentes en un worker: la primera
+    petición de cada clave ejecuta el handler y las que llegan mientras tanto
+    esperan su respuesta ya serializada (una sola consulta y un solo JSON).
+    La espera está acotada a `espera` segundos; al agotarse, la petición
+    ejecuta el handler por su cuenta. `olvidar()` hace que las peticiones
+    siguientes no se unan a las ejecuciones en curso (p. ej. tras un commit).
+    """
+
+    def __init__(self, espera=5.0, max_claves=500):
+        self.espera = espera
+        self.max_claves = max_claves
+        self._vuelos = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _estadistica(self, clave):
+        stats = self._stats.get(clave)
+        if stats is None:
+            if len(self._stats) >= self.max_claves:
+                clave = OTRAS
+            stats = self._stats.setdefault(clave, _Estadistica())
+        return stats
+
+    def _unirse(self, clave, metrica, crear):
+        """Devuelve (vuelo, lider) y actualiza las métricas de `metrica`."""
+        with self._lock:
+            stats = self._estadistica(metrica)
+            stats.peticiones += 1
+            vuelo = self._vuelos.get(clave)
+            if vuelo is None:
+                vuelo = self._vuelos[clave] = crear()
+                stats.ejecuciones += 1
+                return vuelo, True
+            vuelo.esperando += 1
+            stats.max_esperando = max(stats.max_esperando, vuelo.esperando)
+            return vuelo, False
+
+    def _aterrizar(self, clave, vuelo):
+        with self._lock:
+            if self._vuelos.get(clave) is vuelo:
+                del self._vuelos[clave]
+
+    def _contar(self, metrica, campo):
+        with self._lock:
+            stats = self._estadistica(metrica)
+            setattr(stats, campo, getattr(stats, campo) + 1)
+
+    def ejecutar(self, clave, funcion, metrica=None):
+        """Devuelve (resultado, compartido) ejecutando `funcion()` como mucho una vez por clave en curso."""
+        metrica = metrica or str(clave)
+        vuelo, lider = self._unirse(clave, metrica, _Vuelo)
+        if lider:
+            try:
+                vuelo.resultado = funcion()
+                return vuelo.resultado, False
+            except BaseException as e:
+                vuelo.error = e
+                raise
+            finally:
+                self._aterrizar(clave, vuelo)
+                vuelo.hecho.set()
+
+        if not vuelo.hecho.wait(self.espera):
+            self._contar(metrica, "agotadas")
+            return funcion(), False
+        if vuelo.error is not None:
+            raise vuelo.error
+        self._contar(metrica, "coalescidas")
+        return vuelo.resultado, True
+
+    async def ejecutar_async(self, clave, funcion, metrica=None):
+        """Variante de `ejecutar` para corrutinas: `funcion()` devuelve el awaitable a ejecutar."""
+        metrica = metrica or str(clave)
+        vuelo, lider = self._unirse(clave, metrica, lambda: _Vuelo(asyncio.get_running_loop().create_future()))
+        if lider:
+            try:
+                resultado = await funcion()
+                vuelo.futuro.set_result(resultado)
+                return resultado, False
+            except BaseException as e:
+                vuelo.futuro.set_exception(e)
+                # Se marca como recuperada aunque nadie esté esperando
+                vuelo.futuro.exception()
+                raise
+            finally:
+                self._aterrizar(clave, vuelo)
+
+        try:
+            resultado = await asyncio.wait_for(asyncio.shield(vuelo.futuro), self.espera)
+        except asyncio.TimeoutError:
+            self._contar(metrica, "agotadas")
+            return await funcion(), False
+        self._contar(metrica, "coalescidas")
+        return resultado, True
+
+    def envolver(self, handler, clave):
+        """
+        Envuelve un handler HTTP (síncrono o async). `clave(req)` identifica
+        las peticiones equivalentes o devuelve None si la petición no se
+        coalesce; quienes se unen a una ejecución en curso reciben una copia
+        de su respuesta con el header X-Coalesced.
+        """
+        if inspect.iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def envoltorio(req):
+                k = clave(req)
+                if k is None:
+                    return await handler(req)
+
+                async def ejecutar():
+                    return _instantanea(await handler(req))
+
+                instantanea, compartida = await self.ejecutar_async(k, ejecutar, _metrica(k))
+                return _respuesta(instantanea, compartida)
+        else:
+            @functools.wraps(handler)
+            def envoltorio(req):
+                k = clave(req)
+                if k is None:
+                    return handler(req)
+                instantanea, compartida = self.ejecutar(k, lambda: _instantanea(handler(req)), _metrica(k))
+                return _respuesta(instantanea, compartida)
+
+        return envoltorio
+
+    def olvidar(self):
+        with self._lock:
+            self._vuelos.clear()
+
+    def top(self, n=20):
+        """Las `n` claves con más peticiones coalescidas."""
+        with self._lock:
+            filas = [stats.to_dict(clave) for clave, stats in self._stats.items()]
+        filas.sort(key=lambda fila: (fila["coalescidas"], fila["peticiones"]), reverse=True)
+        return filas[:n]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+def _metrica(clave):
+    return clave[0] if isinstance(clave, tuple) else str(clave)
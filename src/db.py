@@ -0,0 +1,218 @@
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import Session, sessionmaker
+
+# Database Connection Configuration
+server = os.getenv("SQL_SERVER", "sem6.database.windows.net")
+database = os.getenv("SQL_DATABASE", "db_tourismo")
+username = os.getenv("SQL_USERNAME", "admin2025")
+password = os.getenv("SQL_PASSWORD", "seminario_sesion6_2025")
+encoded_password = urllib.parse.quote_plus(password)
+
+# DATABASE_URL permite apuntar a otra base (p. ej. SQLite en local)
+DB_URL = os.getenv(
+    "DATABASE_URL",
+    f"mssql+pyodbc://{username}:{encoded_password}@{server}/{database}?driver=ODBC+Driver+18+for+SQL+Server&Encrypt=yes&TrustServerCertificate=no&Connection Timeout=30"
+)
+
+# Réplica de solo lectura opcional para las peticiones GET: DATABASE_READ_URL
+# o, con DB_READ_ONLY_INTENT=1 en SQL Server, la misma base con
+# ApplicationIntent=ReadOnly (secundaria legible del grupo de disponibilidad).
+# Sin ninguno de los dos todas las lecturas van a la primaria
+DB_READ_URL = os.getenv("DATABASE_READ_URL", "")
+if not DB_READ_URL and os.getenv("DB_READ_ONLY_INTENT", "0") == "1" and DB_URL.startswith("mssql"):
+    DB_READ_URL = DB_URL + ("&" if "?" in DB_URL else "?") + "ApplicationIntent=ReadOnly"
+REPLICA = bool(DB_READ_URL)
+
+# Equivalente async de DB_URL; por defecto se deriva cambiando el driver
+# (aioodbc para SQL Server, aiosqlite para la SQLite local y de los benchmarks)
+ASYNC_DRIVERS = {
+    "mssql+pyodbc": "mssql+aioodbc",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+_engine = None
+_async_engine = None
+_read_engine = None
+_async_read_engine = None
+_engine_lock = threading.Lock()
+
+
+# El log de cada sentencia (echo) queda solo para depuración local; en
+# producción las consultas se perfilan con src/query_stats.py
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+
+
+def _engine_options(url):
+    options = {"echo": DB_ECHO}
+    if url.startswith(("mssql+pyodbc", "mssql+aioodbc")):
+        # fast_executemany: los lotes de UPDATE/INSERT viajan en un solo envío ODBC
+        options["fast_executemany"] = True
+    return options
+
+
+def get_engine():
+    """
+    Devuelve el engine, creándolo en la primera llamada. Así la importación
+    de function_app no carga el driver ODBC ni abre conexiones.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(DB_URL, **_engine_options(DB_URL))
+    return _engine
+
+
+def get_read_engine():
+    """Engine de la réplica (la primaria si no hay réplica configurada), creado en el primer uso."""
+    global _read_engine
+    if not REPLICA:
+        return get_engine()
+    if _read_engine is None:
+        with _engine_lock:
+            if _read_engine is None:
+                _read_engine = create_engine(DB_READ_URL, **_engine_options(DB_READ_URL))
+    return _read_engine
+
+
+def async_database_url(url=DB_URL, variable="ASYNC_DATABASE_URL"):
+    explicit = os.getenv(variable)
+    if explicit:
+        return explicit
+    driver, separador, resto = url.partition("://")
+    return ASYNC_DRIVERS.get(driver, driver) + separador + resto
+
+
+def get_async_engine():
+    """AsyncEngine para los handlers async (API_ASYNC=1), creado en el primer uso."""
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        with _engine_lock:
+            if _async_engine is None:
+                url = async_database_url()
+                _async_engine = create_async_engine(url, **_engine_options(url))
+    return _async_engine
+
+
+def get_async_read_engine():
+    """AsyncEngine de la réplica (ASYNC_DATABASE_READ_URL o derivado de DB_READ_URL)."""
+    global _async_read_engine
+    if not REPLICA:
+        return get_async_engine()
+    if _async_read_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        with _engine_lock:
+            if _async_read_engine is None:
+                url = async_database_url(DB_READ_URL, "ASYNC_DATABASE_READ_URL")
+                _async_read_engine = create_async_engine(url, **_engine_options(url))
+    return _async_read_engine
+
+
+class TurismoSession(Session):
+    """
+    Clase de sesión común a SessionLocal y AsyncSessionLocal; los eventos
+    (invalidación de cachés, versiones por tabla) se registran sobre ella.
+    """
+
+
+class _LazySessionmaker(sessionmaker):
+    """sessionmaker que enlaza el engine la primera vez que se crea una sesión."""
+
+    def __init__(self, engine=get_engine, **kw):
+        super().__init__(**kw)
+        self._obtener_engine = engine
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=self._obtener_engine())
+        return super().__call__(**local_kw)
+
+
+SessionLocal = _LazySessionmaker(class_=TurismoSession, autocommit=False, autoflush=False)
+
+# Sesiones de lectura sobre la réplica; session.info["replica"] permite
+# separar lo que se guarda en cachés a partir de ellas. Sin réplica es SessionLocal
+if REPLICA:
+    ReadSessionLocal = _LazySessionmaker(
+        get_read_engine, class_=TurismoSession, autocommit=False, autoflush=False, info={"replica": True}
+    )
+else:
+    ReadSessionLocal = SessionLocal
+
+_async_sessionmakers = {}
+
+
+def _async_session(replica):
+    fabrica = _async_sessionmakers.get(replica)
+    if fabrica is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        fabrica = _async_sessionmakers[replica] = async_sessionmaker(
+            get_async_read_engine() if replica else get_async_engine(),
+            sync_session_class=TurismoSession, autoflush=False, info={"replica": True} if replica else {}
+        )
+    return fabrica()
+
+
+def AsyncSessionLocal():
+    """Crea una AsyncSession sobre el AsyncEngine (equivalente async de SessionLocal)."""
+    return _async_session(False)
+
+
+def AsyncReadSessionLocal():
+    """AsyncSession sobre la réplica (equivalente async de ReadSessionLocal)."""
+    return _async_session(REPLICA)
+
+
+def tablas_en_replica(session, tablas, crear):
+    """
+    Comprueba que las tablas auxiliares que se crean en el primer uso
+    (versiones, resúmenes) existan ya en la réplica de `session`, que es de
+    solo lectura. Si falta alguna se crean en la primaria con
+    `crear(connection)` sobre una conexión propia y se devuelve False: hasta
+    que se repliquen, quien lee responde como si estuvieran vacías.
+    """
+    inspector = inspect(session.connection())
+    if all(inspector.has_table(tabla.name) for tabla in tablas):
+        return True
+    with get_engine().begin() as connection:
+        crear(connection)
+    return False
+
+
+def warm_up(connections, background=True):
+    """
+    Abre `connections` conexiones del pool a la vez y las devuelve, de modo
+    que las primeras peticiones no paguen la conexión ODBC ni el handshake TLS.
+    """
+    def _abrir():
+        inicio = time.perf_counter()
+        abiertas = []
+        try:
+            # Con réplica se precalientan los dos pools
+            for engine in {get_engine(), get_read_engine()}:
+                for _ in range(connections):
+                    abiertas.append(engine.connect())
+        except Exception as e:
+            logging.warning(f"Precalentamiento del pool incompleto: {str(e)}")
+        finally:
+            for conexion in abiertas:
+                conexion.close()
+        logging.info(f"Pool precalentado con {len(abiertas)} conexiones en {time.perf_counter() - inicio:.3f}s")
+        return len(abiertas)
+
+    if not background:
+        return _abrir()
+    hilo = threading.Thread(target=_abrir, name="db-warm-up", daemon=True)
+    hilo.start()
+    return hilo
@@ -0,0 +1,120 @@
+from functools import lru_cache
+
+from sqlalchemy import select
+
+from src import models
+from src.serializers import row_encoder
+from src.timing import contar_filas, fase
+
+# Columnas de usuario del detalle: nunca se incluye la contraseña
+COLUMNAS_USUARIO = ("id", "usuario")
+
+
+def dependencias():
+    """Tablas, además de reserva, cuya versión interviene en el ETag del detalle."""
+    return (
+        models.Destino, models.Ciudad, models.Pais,
+        models.ReservaGuia, models.Guia, models.ReservaUsuario, models.Usuario,
+    )
+
+
+def _columnas(modelo, nombres=None):
+    return [c for c in modelo.__table__.columns if nombres is None or c.name in nombres]
+
+
+class _Grafo:
+    """
+    SELECT de reserva con destino, ciudad y país en un solo JOIN y los
+    codificadores de cada tramo de la fila. Las columnas de reserva conservan
+    su nombre (fila.id es el cursor del keyset); las demás llevan prefijo.
+    """
+
+    def __init__(self):
+        partes = (
+            (models.Reserva, None),
+            (models.Destino, "destino"),
+            (models.Ciudad, "ciudad"),
+            (models.Pais, "pais"),
+        )
+        columnas, self.tramos = [], []
+        for modelo, prefijo in partes:
+            propias = _columnas(modelo)
+            self.tramos.append((len(columnas), len(columnas) + len(propias), row_encoder(propias, f"<detalle {modelo.__name__}>")))
+            columnas += [c if prefijo is None else c.label(f"{prefijo}_{c.name}") for c in propias]
+
+        reserva, destino, ciudad, pais = (modelo for modelo, _ in partes)
+        self.stmt = (
+            select(*columnas)
+            .join(destino, destino.id == reserva.destino_id)
+            .join(ciudad, ciudad.id == destino.ciudad_id)
+            .join(pais, pais.id == ciudad.pais_id)
+        )
+        self.guias = self._hijos(models.ReservaGuia, models.Guia, models.ReservaGuia.guia_id)
+        self.usuarios = self._hijos(models.ReservaUsuario, models.Usuario, models.ReservaUsuario.usuario_id, COLUMNAS_USUARIO)
+
+    @staticmethod
+    def _hijos(asignacion, modelo, fk, nombres=None):
+        propias = _columnas(modelo, nombres)
+        stmt = (
+            select(asignacion.reserva_id, *propias)
+            .join(asignacion, fk == modelo.id)
+            .order_by(asignacion.reserva_id, modelo.id)
+        )
+        return stmt, asignacion.reserva_id, row_encoder(propias, f"<detalle {modelo.__name__}>")
+
+    def codificar(self, fila):
+        reserva, destino, ciudad, pais = (codificar(fila[inicio:fin]) for inicio, fin, codificar in self.tramos)
+        ciudad["pais"] = pais
+        destino["ciudad"] = ciudad
+        reserva["destino"] = destino
+        return reserva
+
+
+@lru_cache(maxsize=1)
+def _grafo():
+    return _Grafo()
+
+
+def consulta(usuario_id=None):
+    """Reservas con destino, ciudad y país; con `usuario_id`, solo las de ese usuario."""
+    stmt = _grafo().stmt
+    if usuario_id is not None:
+        participante = models.ReservaUsuario
+        stmt = stmt.where(models.Reserva.id.in_(
+            select(participante.reserva_id).where(participante.usuario_id == usuario_id)
+        ))
+    return stmt
+
+
+def _agrupar(session, hijos, ids):
+    stmt, reserva_id, codificar = hijos
+    por_reserva = {id: [] for id in ids}
+    filas = session.execute(stmt.where(reserva_id.in_(ids))).all()
+    with fase("to_dict"):
+        for fila in filas:
+            por_reserva[fila[0]].append(codificar(fila[1:]))
+    return por_reserva
+
+
+def cargar(session, filas):
+    """
+    Completa las filas de `consulta` con sus guías y usuarios: una consulta
+    IN por colección para toda la página, de modo que el detalle cuesta tres
+    consultas sea cual sea el número de reservas.
+    """
+    if not filas:
+        return []
+    grafo = _grafo()
+    ids = [fila.id for fila in filas]
+    guias = _agrupar(session, grafo.guias, ids)
+    usuarios = _agrupar(session, grafo.usuarios, ids)
+
+    contar_filas(len(filas))
+    with fase("to_dict"):
+        detalles = []
+        for fila in filas:
+            detalle = grafo.codificar(fila)
+            detalle["guias"] = guias[fila.id]
+            detalle["usuarios"] = usuarios[fila.id]
+            detalles.append(detalle)
+    return detalles
@@ -0,0 +1,121 @@
+from functools import lru_cache
+
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from src.serializers import dumps, serializer_for
+
+
+def parse_expand(model, raw):
+    """
+    Convierte ?expand=destino.ciudad.pais,otra en una tupla ordenada de rutas,
+    cada una una tupla de nombres de relación. Lanza ValueError con la primera
+    ruta que no corresponde a relaciones del modelo.
+    """
+    if not raw:
+        return None
+
+    rutas = set()
+    for ruta in raw.split(","):
+        ruta = ruta.strip()
+        if not ruta:
+            continue
+        actual = model
+        for nombre in ruta.split("."):
+            relacion = inspect(actual).relationships.get(nombre)
+            if relacion is None:
+                raise ValueError(ruta)
+            actual = relacion.mapper.class_
+        rutas.add(tuple(ruta.split(".")))
+
+    return tuple(sorted(rutas)) or None
+
+
+def _arbol(rutas):
+    arbol = {}
+    for ruta in rutas:
+        nodo = arbol
+        for nombre in ruta:
+            nodo = nodo.setdefault(nombre, {})
+    return arbol
+
+
+def _opciones(model, arbol, padre=None):
+    """
+    joinedload para relaciones a uno (se resuelven en la misma consulta) y
+    selectinload para colecciones (una consulta IN por nivel), de modo que el
+    número de consultas depende de la expansión pedida y no de las filas.
+    """
+    opciones = []
+    for nombre, hijos in arbol.items():
+        relacion = inspect(model).relationships[nombre]
+        atributo = getattr(model, nombre)
+        cargador = selectinload if relacion.uselist else joinedload
+        opcion = cargador(atributo) if padre is None else getattr(padre, cargador.__name__)(atributo)
+        subopciones = _opciones(relacion.mapper.class_, hijos, opcion)
+        opciones.extend(subopciones or [opcion])
+    return opciones
+
+
+def _modelos(model, arbol):
+    """Modelos alcanzados por las relaciones del árbol (sin incluir `model`)."""
+    alcanzados = set()
+    for nombre, hijos in arbol.items():
+        destino = inspect(model).relationships[nombre].mapper.class_
+        alcanzados.add(destino)
+        alcanzados |= _modelos(destino, hijos)
+    return alcanzados
+
+
+def _codificador(model, arbol, fields=None):
+    base = serializer_for(model).to_dict
+    relaciones = [
+        (nombre, inspect(model).relationships[nombre].uselist,
+         _codificador(inspect(model).relationships[nombre].mapper.class_, hijos))
+        for nombre, hijos in arbol.items()
+    ]
+
+    def to_dict(obj):
+        data = base(obj)
+        if fields is not None:
+            data = {key: data[key] for key in fields}
+        for nombre, es_coleccion, codificar in relaciones:
+            valor = getattr(obj, nombre)
+            if es_coleccion:
+                data[nombre] = [codificar(item) for item in valor]
+            else:
+                data[nombre] = None if valor is None else codificar(valor)
+        return data
+
+    return to_dict
+
+
+class Expansion:
+    """
+    Lectura ORM con relaciones precargadas según ?expand=. A diferencia de
+    Projection devuelve instancias, que se codifican con sus relaciones
+    anidadas. `dependencias` son los modelos expandidos: sus versiones
+    forman parte del ETag de la respuesta.
+    """
+
+    orm = True
+    __slots__ = ("model", "key", "options", "to_dict", "dependencias")
+
+    def __init__(self, model, fields, rutas):
+        arbol = _arbol(rutas)
+        self.model = model
+        self.key = (fields, rutas)
+        self.options = tuple(_opciones(model, arbol))
+        self.to_dict = _codificador(model, arbol, fields)
+        self.dependencias = tuple(sorted(_modelos(model, arbol) - {model}, key=lambda m: m.__tablename__))
+
+    def select(self):
+        return select(self.model).options(*self.options)
+
+    def dumps(self, obj):
+        return dumps(self.to_dict(obj))
+
+
+@lru_cache(maxsize=256)
+def expansion_for(model, fields, rutas):
+    return Expansion(model, fields, rutas)
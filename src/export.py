@@ -0,0 +1,133 @@
+import csv
+import io
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from src import models
+from src.pagination import YIELD_PER
+from src.serializers import dumps, row_encoder
+from src.timing import contar_filas, fase
+
+# Formatos de exportación y su Content-Type
+FORMATOS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Columnas relacionadas que se pueden añadir con ?incluir=
+RELACIONES = ("destino", "guias", "usuarios")
+
+
+def parse_export_params(params):
+    """
+    Lee ?format=, ?desde=, ?hasta= e ?incluir= (lista separada por comas).
+    Devuelve (formato, desde, hasta, incluir); lanza ValueError con el mensaje de error.
+    """
+    formato = params.get("format", "ndjson")
+    if formato not in FORMATOS:
+        raise ValueError(f"'format' debe ser uno de {', '.join(FORMATOS)}")
+
+    fechas = []
+    for campo in ("desde", "hasta"):
+        valor = params.get(campo)
+        try:
+            fechas.append(datetime.fromisoformat(valor) if valor else None)
+        except ValueError:
+            raise ValueError(f"Formato de fecha inválido en '{campo}'")
+
+    incluir = tuple(n.strip() for n in params.get("incluir", "").split(",") if n.strip())
+    desconocidas = set(incluir) - set(RELACIONES)
+    if desconocidas:
+        raise ValueError(f"'incluir' admite {', '.join(RELACIONES)}; desconocido: {', '.join(sorted(desconocidas))}")
+    return formato, fechas[0], fechas[1], incluir
+
+
+def consulta(desde=None, hasta=None, incluir=()):
+    """
+    SELECT único de las reservas con fecha en [desde, hasta), ordenado por id.
+    Las guías y usuarios de cada reserva se agregan en una subconsulta
+    correlacionada (nombres separados por comas), de modo que el JOIN con
+    varias tablas hijas no multiplica las filas.
+    """
+    reserva = models.Reserva
+    columnas = [reserva.id, reserva.fecha, reserva.destino_id]
+    if "destino" in incluir:
+        columnas.append(models.Destino.nombre.label("destino"))
+    if "guias" in incluir:
+        guia, asignacion = models.Guia, models.ReservaGuia
+        columnas.append(
+            select(func.aggregate_strings(guia.nombre, ", "))
+            .join(asignacion, asignacion.guia_id == guia.id)
+            .where(asignacion.reserva_id == reserva.id)
+            .scalar_subquery()
+            .label("guias")
+        )
+    if "usuarios" in incluir:
+        usuario, participante = models.Usuario, models.ReservaUsuario
+        columnas.append(
+            select(func.aggregate_strings(usuario.usuario, ", "))
+            .join(participante, participante.usuario_id == usuario.id)
+            .where(participante.reserva_id == reserva.id)
+            .scalar_subquery()
+            .label("usuarios")
+        )
+
+    stmt = select(*columnas)
+    if "destino" in incluir:
+        stmt = stmt.join(models.Destino, models.Destino.id == reserva.destino_id)
+    if desde is not None:
+        stmt = stmt.where(reserva.fecha >= desde)
+    if hasta is not None:
+        stmt = stmt.where(reserva.fecha < hasta)
+    return stmt.order_by(reserva.id)
+
+
+class _Codificador:
+    """Convierte bloques de filas en texto NDJSON o CSV; `cabecera` es la primera línea del CSV."""
+
+    def __init__(self, stmt, formato):
+        self.formato = formato
+        self.to_dict = row_encoder(stmt.selected_columns, "<export>")
+        self.nombres = [columna.name for columna in stmt.selected_columns]
+
+    def cabecera(self):
+        return self._csv([self.nombres]) if self.formato == "csv" else ""
+
+    def bloque(self, filas):
+        contar_filas(len(filas))
+        with fase("json"):
+            valores = [self.to_dict(fila) for fila in filas]
+            if self.formato == "csv":
+                return self._csv(valor.values() for valor in valores)
+            return "".join(dumps(valor) + "\n" for valor in valores)
+
+    def _csv(self, filas):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\r\n").writerows(filas)
+        return buffer.getvalue()
+
+
+def exportar(session, stmt, formato, chunk_size=YIELD_PER):
+    """
+    Genera la exportación por bloques de texto leyendo con un cursor del
+    servidor (yield_per): en memoria solo hay un bloque de filas a la vez.
+    """
+    codificador = _Codificador(stmt, formato)
+    cabecera = codificador.cabecera()
+    if cabecera:
+        yield cabecera
+    result = session.execute(stmt.execution_options(yield_per=chunk_size))
+    for filas in result.partitions():
+        yield codificador.bloque(filas)
+
+
+async def exportar_async(session, stmt, formato, chunk_size=YIELD_PER):
+    """Variante de `exportar` sobre una AsyncSession (AsyncSession.stream)."""
+    codificador = _Codificador(stmt, formato)
+    cabecera = codificador.cabecera()
+    if cabecera:
+        yield cabecera
+    result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+    async for filas in result.partitions():
+        yield codificador.bloque(filas)
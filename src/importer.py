@@ -0,0 +1,182 @@
+import csv
+import io
+import json
+import os
+
+from src.batch import claves_existentes, insertar_lote
+from src.resources import POR_MODELO
+
+# Tablas admitidas en POST /import, en orden de dependencias de sus FK
+TABLAS = {
+    "pais": "Pais",
+    "ciudad": "Ciudad",
+    "destino": "Destino",
+    "guia": "Guia",
+}
+
+# Filas máximas por importación
+MAX_IMPORT = int(os.getenv("API_MAX_IMPORT", "100000"))
+
+
+def leer_bundle(cuerpo, formato):
+    """
+    Lee un bundle NDJSON (un objeto por línea) o CSV (con cabecera) cuyas
+    filas llevan la columna "tabla". Devuelve (filas, errores): `filas` son
+    pares (linea, dict) y `errores` las líneas que no se pudieron leer.
+    """
+    texto = cuerpo.decode("utf-8-sig")
+    filas, errores = [], []
+    if formato == "csv":
+        lector = csv.DictReader(io.StringIO(texto))
+        for fila in lector:
+            # Las celdas vacías equivalen a no enviar el campo
+            filas.append((lector.line_num, {k: v for k, v in fila.items() if k and v not in (None, "")}))
+    else:
+        for linea, contenido in enumerate(texto.splitlines(), start=1):
+            if not contenido.strip():
+                continue
+            try:
+                fila = json.loads(contenido)
+            except ValueError:
+                errores.append({"linea": linea, "error": "JSON inválido"})
+                continue
+            if not isinstance(fila, dict):
+                errores.append({"linea": linea, "error": "Se esperaba un objeto"})
+                continue
+            filas.append((linea, fila))
+    return filas, errores
+
+
+def _campo_ref(columna):
+    # ciudad.pais_id -> pais_ref
+    return columna.removesuffix("_id") + "_ref"
+
+
+def _unicas(modelo):
+    return [c.name for c in modelo.__table__.columns if c.unique and not c.primary_key]
+
+
+class _Plan:
+    """Filas válidas de una tabla, con las FK que apuntan a referencias del propio bundle."""
+
+    __slots__ = ("recurso", "lineas", "refs", "datos", "pendientes", "refs_validas")
+
+    def __init__(self, recurso):
+        self.recurso = recurso
+        self.refs_validas = {}
+        self.lineas = []
+        self.refs = []
+        self.datos = []
+        self.pendientes = []
+
+
+def validar(session, filas):
+    """
+    Valida el bundle completo en memoria. Las FK con valor numérico se
+    comprueban contra las claves existentes, cargadas una vez por tabla
+    referenciada; las FK `<campo>_ref` apuntan a la columna "ref" de otra
+    fila del bundle. También se comprueban las columnas únicas frente a la
+    base y dentro del propio bundle. Devuelve (planes, errores).
+    """
+    errores = []
+    por_tabla = {tabla: [] for tabla in TABLAS}
+    for linea, fila in filas:
+        tabla = fila.get("tabla")
+        if tabla not in TABLAS:
+            errores.append({"linea": linea, "error": f"'tabla' debe ser una de {', '.join(TABLAS)}"})
+            continue
+        por_tabla[tabla].append((linea, fila))
+
+    # Claves referenciadas y valores únicos que hay que comprobar en la base, en una pasada
+    necesarios = {}
+    for tabla, filas_tabla in por_tabla.items():
+        validador = POR_MODELO[TABLAS[tabla]].validador
+        for columna, destino in validador.referencias.items():
+            for _, fila in filas_tabla:
+                if fila.get(columna) is not None and _campo_ref(columna) not in fila:
+                    try:
+                        necesarios.setdefault(destino, set()).add(int(fila[columna]))
+                    except (TypeError, ValueError):
+                        pass
+        for columna in _unicas(validador.model):
+            valores = {fila[columna] for _, fila in filas_tabla if fila.get(columna) is not None}
+            if valores:
+                necesarios.setdefault(validador.model.__table__.c[columna], set()).update(valores)
+    existentes = {columna: claves_existentes(session, columna, valores) for columna, valores in necesarios.items()}
+
+    planes = {}
+    for tabla, filas_tabla in por_tabla.items():
+        recurso = POR_MODELO[TABLAS[tabla]]
+        validador = recurso.validador
+        plan = planes[tabla] = _Plan(recurso)
+        refs_validas = plan.refs_validas
+        vistos = {columna: set() for columna in _unicas(validador.model)}
+
+        for linea, fila in filas_tabla:
+            try:
+                ref = fila.get("ref")
+                if ref is not None and ref in refs_validas:
+                    raise ValueError(f"La referencia '{ref}' está repetida en '{tabla}'")
+
+                crudo = {clave: valor for clave, valor in fila.items() if clave != "id"}
+                pendientes = {}
+                for columna, destino in validador.referencias.items():
+                    campo = _campo_ref(columna)
+                    if campo not in fila:
+                        continue
+                    tabla_destino = destino.table.name
+                    if tabla_destino not in planes:
+                        raise ValueError(f"'{campo}' no es válido: la tabla '{tabla_destino}' no se importa")
+                    indice = planes[tabla_destino].refs_validas.get(fila[campo])
+                    if indice is None:
+                        raise ValueError(f"La referencia '{fila[campo]}' de '{campo}' no existe o no es válida")
+                    pendientes[columna] = indice
+                    # Valor provisional para la validación; se sustituye por el id generado
+                    crudo[columna] = 0
+
+                datos = validador.crear(crudo)
+                for columna, destino in validador.referencias.items():
+                    valor = datos.get(columna)
+                    if columna not in pendientes and valor is not None and valor not in existentes.get(destino, ()):
+                        raise ValueError(f"El '{columna}' proporcionado no existe")
+                for columna, valores in vistos.items():
+                    valor = datos.get(columna)
+                    if valor is not None and (valor in valores or valor in existentes.get(validador.model.__table__.c[columna], ())):
+                        raise ValueError(f"Ya existe un registro con '{columna}' = {valor!r}")
+            except ValueError as e:
+                errores.append({"linea": linea, "tabla": tabla, "error": str(e)})
+                continue
+
+            for columna, valores in vistos.items():
+                if datos.get(columna) is not None:
+                    valores.add(datos[columna])
+            if ref is not None:
+                refs_validas[ref] = len(plan.datos)
+            plan.lineas.append(linea)
+            plan.refs.append(ref)
+            plan.datos.append(datos)
+            plan.pendientes.append(pendientes)
+
+    errores.sort(key=lambda e: e["linea"])
+    return planes, errores
+
+
+def importar(session, planes):
+    """
+    Inserta las filas válidas tabla a tabla en orden de dependencias, con un
+    INSERT por lotes por tabla; las FK `_ref` se resuelven con los ids
+    generados en la tabla anterior. Devuelve {tabla: [{"linea", "ref", "id"}]}.
+    """
+    ids_por_tabla = {}
+    creados = {}
+    for tabla, plan in planes.items():
+        for datos, pendientes in zip(plan.datos, plan.pendientes):
+            for columna, indice in pendientes.items():
+                tabla_destino = plan.recurso.validador.referencias[columna].table.name
+                datos[columna] = ids_por_tabla[tabla_destino][indice]
+        ids = insertar_lote(session, plan.recurso.modelo, plan.datos)
+        ids_por_tabla[tabla] = ids
+        creados[tabla] = [
+            {"linea": linea, "ref": ref, "id": id} for linea, ref, id in zip(plan.lineas, plan.refs, ids)
+        ]
+    return creados
@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import inspect, select
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError
+
+from src import models
+from src.resources import RECURSOS
+
+# Cola de Azure Storage de las escrituras diferidas (AzureWebJobsStorage, que
+# en local apunta a Azurite). Vacía: las escrituras se confirman al responder
+COLA = os.getenv("API_WRITE_QUEUE", "")
+
+# Mensajes que se aplican en cada transacción (la cola entrega hasta 32 por lectura)
+LOTE = min(int(os.getenv("API_WRITE_BATCH", "32")), 32)
+
+# Segundos que los mensajes leídos para completar un lote quedan ocultos; si
+# el lote no se confirma en ese plazo vuelven a la cola y se reintentan
+VISIBILIDAD_S = int(os.getenv("API_WRITE_VISIBILITY_S", "60"))
+
+# Un mensaje admite 64 KiB; en base64 el JSON debe quedarse en 48 KiB
+MAX_MENSAJE = 48 * 1024
+
+_POR_RUTA = {recurso.ruta: recurso for recurso in RECURSOS}
+
+_cliente = None
+_cliente_lock = threading.Lock()
+_tabla_lista = False
+
+
+def _cola():
+    """QueueClient de COLA, creado (junto con la cola si no existe) en el primer uso."""
+    global _cliente
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                from azure.core.exceptions import ResourceExistsError
+                from azure.storage.queue import QueueClient, TextBase64DecodePolicy, TextBase64EncodePolicy
+
+                # El trigger de colas de Functions espera los mensajes en base64
+                cliente = QueueClient.from_connection_string(
+                    os.environ["AzureWebJobsStorage"], COLA,
+                    message_encode_policy=TextBase64EncodePolicy(),
+                    message_decode_policy=TextBase64DecodePolicy()
+                )
+                try:
+                    cliente.create_queue()
+                except ResourceExistsError:
+                    pass
+                _cliente = cliente
+    return _cliente
+
+
+def encolar(recurso, metodo, objeto_id, cuerpo):
+    """Encola una escritura ya validada y devuelve su id; lanza ValueError si no cabe en un mensaje."""
+    mensaje = {
+        "id": str(uuid.uuid4()),
+        "recurso": recurso.ruta,
+        "metodo": metodo,
+        "objeto_id": objeto_id,
+        "cuerpo": cuerpo,
+    }
+    texto = json.dumps(mensaje)
+    if len(texto.encode()) > MAX_MENSAJE:
+        raise ValueError(f"La escritura supera el máximo de {MAX_MENSAJE} bytes de un mensaje")
+    _cola().send_message(texto)
+    return mensaje["id"]
+
+
+def recibir(n):
+    """
+    Lee hasta `n` mensajes más de la cola para aplicarlos junto con el que
+    disparó la función. Devuelve pares (mensaje de la cola, escritura).
+    """
+    if n <= 0:
+        return []
+    mensajes = _cola().receive_messages(messages_per_page=n, max_messages=n, visibility_timeout=VISIBILIDAD_S)
+    return [(mensaje, json.loads(mensaje.content)) for mensaje in mensajes]
+
+
+def confirmar(recibidos):
+    """Borra de la cola los mensajes de `recibir` una vez confirmado su lote."""
+    cola = _cola()
+    for mensaje, _ in recibidos:
+        cola.delete_message(mensaje)
+
+
+def _asegurar_tabla(session):
+    # Igual que en TableVersions: la tabla escritura se crea en el primer uso,
+    # tolerando que otra petición la cree a la vez
+    global _tabla_lista
+    if _tabla_lista:
+        return
+    connection = session.connection()
+    tabla = models.Escritura.__table__
+    try:
+        with connection.begin_nested():
+            tabla.create(connection, checkfirst=True)
+    except DBAPIError:
+        if not inspect(connection).has_table(tabla.name):
+            raise
+    _tabla_lista = True
+
+
+def estado(session, id):
+    """Resultado registrado de la escritura `id`, o None si aún no se ha aplicado."""
+    _asegurar_tabla(session)
+    return session.get(models.Escritura, id)
+
+
+class _Rechazo(Exception):
+    def __init__(self, status_code, mensaje):
+        super().__init__(mensaje)
+        self.status_code = status_code
+
+
+def _aplicar(session, escritura, comprobar):
+    recurso = _POR_RUTA[escritura["recurso"]]
+    metodo = escritura["metodo"]
+    actual = None
+    if metodo != "POST":
+        actual = session.get(recurso.modelo, escritura["objeto_id"])
+        if actual is None:
+            raise _Rechazo(404, recurso.no_encontrado)
+        if metodo == "DELETE":
+            session.delete(actual)
+            session.flush()
+            return actual.id
+
+    try:
+        datos = (recurso.validador.crear if actual is None else recurso.validador.actualizar)(escritura["cuerpo"])
+    except ValueError as e:
+        raise _Rechazo(400, str(e))
+    regla = comprobar(session, recurso, datos, actual)
+    if regla is not None:
+        raise _Rechazo(*regla)
+
+    if actual is None:
+        actual = recurso.modelo(**datos)
+        session.add(actual)
+    else:
+        for key, value in datos.items():
+            setattr(actual, key, value)
+    session.flush()
+    return actual.id
+
+
+def aplicar_lote(session, escrituras, comprobar):
+    """
+    Aplica las escrituras en la transacción de `session` y registra el
+    resultado de cada una en la tabla escritura. Cada escritura va en un
+    SAVEPOINT: una rechazada (404, validación, FK o regla del recurso) no
+    deshace las demás del lote. Las que ya figuran como aplicadas (mensajes
+    entregados de nuevo tras un fallo) se omiten. `comprobar(session,
+    recurso, datos, actual)` devuelve (status_code, mensaje) o None, como la
+    ruta síncrona. Devuelve el número de escrituras aplicadas y rechazadas.
+    """
+    _asegurar_tabla(session)
+    ids = {escritura["id"] for escritura in escrituras}
+    ya_aplicadas = set(session.scalars(select(models.Escritura.id).where(models.Escritura.id.in_(ids))))
+    ahora = datetime.now(timezone.utc).replace(tzinfo=None)
+    resumen = {"aplicada": 0, "rechazada": 0}
+
+    for escritura in escrituras:
+        if escritura["id"] in ya_aplicadas:
+            continue
+        ya_aplicadas.add(escritura["id"])
+        objeto_id, error = escritura.get("objeto_id"), None
+        status_code = 201 if escritura["metodo"] == "POST" else 200
+        try:
+            with session.begin_nested():
+                objeto_id = _aplicar(session, escritura, comprobar)
+        except _Rechazo as e:
+            status_code, error = e.status_code, str(e)
+        except (IntegrityError, DataError) as e:
+            # Errores permanentes de los datos; los de conexión abortan el lote para reintentarlo
+            status_code, error = 409, f"Error de base de datos: {str(e.orig)[:400]}"
+
+        resultado = "rechazada" if error else "aplicada"
+        resumen[resultado] += 1
+        session.add(models.Escritura(
+            id=escritura["id"],
+            recurso=escritura["recurso"],
+            metodo=escritura["metodo"],
+            objeto_id=objeto_id,
+            estado=resultado,
+            status_code=status_code,
+            error=error,
+            aplicada=ahora
+        ))
+    return resumen
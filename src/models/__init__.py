@@ -1,8 +1,52 @@
-from .usuario import Usuario
-from .destino import Destino
-from .guia import Guia
-from .guia_calificacion import GuiaCalificacion
-from .destino_calificacion import DestinoCalificacion
-from .ciudad import Ciudad
-from .reserva import Reserva
-from .reserva_guia import ReservaGuia
\ No newline at end of file
+import importlib
+
+from sqlalchemy import event
+from sqlalchemy.orm import Mapper
+
+# Los modelos se importan al primer acceso (p. ej. models.Reserva) para no
+# pagar la carga de todos ellos durante el arranque de la Function App
+_MODULOS = {
+    "Usuario": "usuario",
+    "Destino": "destino",
+    "Ciudad": "ciudad",
+    "Guia": "guia",
+    "Reserva": "reserva",
+    "ReservaUsuario": "reserva_usuario",
+    "ReservaGuia": "reserva_guia",
+    "Genero": "genero",
+    "GuiaCalificacion": "guia_calificacion",
+    "DestinoCalificacion": "destino_calificacion",
+    "Pais": "pais",
+    "Cliente": "cliente",
+    "Idioma": "idioma",
+    "GuiaIdioma": "guia_idioma",
+    "TablaVersion": "tabla_version",
+    "CalificacionResumen": "calificacion_resumen",
+    "Escritura": "escritura",
+    "EstadisticaMensual": "estadistica_mensual",
+    "EstadisticaCambio": "estadistica_cambio",
+    "EstadisticaMarca": "estadistica_marca",
+}
+
+__all__ = list(_MODULOS)
+
+
+def __getattr__(name):
+    modulo = _MODULOS.get(name)
+    if modulo is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{modulo}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
+
+
+# Antes de configurar el primer mapper se importan todos los modelos, para
+# que las relaciones declaradas por nombre ("Ciudad", "Usuario", ...) resuelvan
+@event.listens_for(Mapper, "before_configured", once=True)
+def _importar_todos():
+    for name in _MODULOS:
+        __getattr__(name)
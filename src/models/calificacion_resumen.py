@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Float, Index, Integer, String
+from src.models.base import Base
+
+class CalificacionResumen(Base):
+    __tablename__ = 'calificacion_resumen'
+
+    tipo = Column(String(20), primary_key=True)
+    entidad_id = Column(Integer, primary_key=True)
+    cantidad = Column(Integer, nullable=False, default=0)
+    suma = Column(Float, nullable=False, default=0)
+    d1 = Column(Integer, nullable=False, default=0)
+    d2 = Column(Integer, nullable=False, default=0)
+    d3 = Column(Integer, nullable=False, default=0)
+    d4 = Column(Integer, nullable=False, default=0)
+    d5 = Column(Integer, nullable=False, default=0)
+    puntuacion = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_calificacion_resumen_ranking', 'tipo', 'puntuacion'),
+    )
@@ -4,7 +4,8 @@ from sqlalchemy import create_engine, Column, Integer, String, DateTime, Foreign
 
 
 from sqlalchemy.orm import sessionmaker, relationship
-Base = declarative_base()
+from src.models.base import Base
+from src.models.usuario import Usuario
 
 class Cliente(Base):
     __tablename__ = 'cliente'
@@ -1,10 +1,12 @@
 from sqlalchemy import create_engine, Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Float
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Float, Index
 
 
 from sqlalchemy.orm import sessionmaker, relationship
-Base = declarative_base()
+from src.models.base import Base
+from src.models.usuario import Usuario
+from src.models.destino import Destino
 
 class DestinoCalificacion(Base):
     __tablename__ = 'destino_calificacion'
@@ -13,4 +15,11 @@ class DestinoCalificacion(Base):
     comentario = Column(String(255), nullable=True)
     calificacion = Column(Float, nullable=True)
     usuario_id = Column(Integer, ForeignKey('usuario.id'))
-    usuario = relationship("Usuario")
\ No newline at end of file
+    destino_id = Column(Integer, ForeignKey('destino.id'))
+    usuario = relationship("Usuario")
+    destino = relationship("Destino")
+
+    # Recalcular las estadísticas de un mes lee solo las calificaciones de ese mes
+    __table_args__ = (
+        Index('ix_destino_calificacion_fecha', 'fecha'),
+    )
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, DateTime, Integer, String
+from src.models.base import Base
+
+class Escritura(Base):
+    __tablename__ = 'escritura'
+
+    id = Column(String(36), primary_key=True)
+    recurso = Column(String(50), nullable=False)
+    metodo = Column(String(10), nullable=False)
+    objeto_id = Column(Integer)
+    estado = Column(String(20), nullable=False)
+    status_code = Column(Integer, nullable=False)
+    error = Column(String(500))
+    aplicada = Column(DateTime, nullable=False)
@@ -0,0 +1,10 @@
+from sqlalchemy import Column, DateTime, Integer, String
+from src.models.base import Base
+
+class EstadisticaCambio(Base):
+    __tablename__ = 'estadistica_cambio'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    fuente = Column(String(30), nullable=False)
+    mes = Column(DateTime)
+    reserva_id = Column(Integer)
@@ -0,0 +1,9 @@
+from sqlalchemy import Column, DateTime, Integer, String
+from src.models.base import Base
+
+class EstadisticaMarca(Base):
+    __tablename__ = 'estadistica_marca'
+
+    nombre = Column(String(30), primary_key=True)
+    cambio_id = Column(Integer, nullable=False, default=0)
+    actualizado = Column(DateTime, nullable=False)
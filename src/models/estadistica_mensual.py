@@ -0,0 +1,15 @@
+from sqlalchemy import Column, DateTime, Float, Index, Integer, String
+from src.models.base import Base
+
+class EstadisticaMensual(Base):
+    __tablename__ = 'estadistica_mensual'
+
+    tipo = Column(String(30), primary_key=True)
+    entidad_id = Column(Integer, primary_key=True)
+    mes = Column(DateTime, primary_key=True)
+    cantidad = Column(Integer, nullable=False, default=0)
+    suma = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_estadistica_mensual_mes', 'tipo', 'mes'),
+    )
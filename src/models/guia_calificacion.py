@@ -3,7 +3,9 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Float
 
 from sqlalchemy.orm import sessionmaker, relationship
-Base = declarative_base()
+from src.models.base import Base
+from src.models.usuario import Usuario
+from src.models.guia import Guia
 
 class GuiaCalificacion(Base):
     __tablename__ = 'guia_calificacion'
@@ -1,13 +1,21 @@
 from sqlalchemy import create_engine, Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Index
 
 from sqlalchemy.orm import sessionmaker, relationship
-Base = declarative_base()
+from src.models.base import Base
+from src.models.guia import Guia
+from src.models.idioma import Idioma
 
 class GuiaIdioma(Base):
     __tablename__ = 'guia_idioma'
 
     id = Column(Integer, primary_key=True, nullable=False)
-    guia_id = Column(Integer, nullable=False)
-    idioma_id = Column(Integer, nullable=False)
\ No newline at end of file
+    guia_id = Column(Integer, ForeignKey('guia.id'), nullable=False)
+    idioma_id = Column(Integer, ForeignKey('idioma.id'), nullable=False)
+    guia = relationship("Guia")
+    idioma = relationship("Idioma")
+
+    __table_args__ = (
+        Index('ix_guia_idioma_idioma', 'idioma_id', 'guia_id'),
+    )
@@ -1,7 +1,7 @@
 from sqlalchemy import create_engine, Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey
-Base = declarative_base()
+from src.models.base import Base
 
 class Idioma(Base):
     __tablename__ = 'idioma'
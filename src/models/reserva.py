@@ -1,6 +1,6 @@
 from sqlalchemy import create_engine, Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Index
 
 from sqlalchemy.orm import sessionmaker, relationship
 from src.models.base import Base
@@ -11,4 +11,8 @@ class Reserva(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     fecha = Column(DateTime, nullable=False)
     destino_id = Column(Integer, ForeignKey('destino.id'), nullable=False)
-    destino = relationship("Destino")
\ No newline at end of file
+    destino = relationship("Destino")
+
+    __table_args__ = (
+        Index('ix_reserva_fecha', 'fecha'),
+    )
@@ -1,9 +1,11 @@
 from sqlalchemy import create_engine, Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Index
 
 from sqlalchemy.orm import sessionmaker, relationship
-Base = declarative_base()
+from src.models.base import Base
+from src.models.reserva import Reserva
+from src.models.guia import Guia
 
 class ReservaGuia(Base):
     __tablename__ = 'reserva_guia'
@@ -12,3 +14,9 @@ class ReservaGuia(Base):
     guia_id = Column(Integer, ForeignKey('guia.id'), nullable=False)
     reserva = relationship("Reserva")
     guia = relationship("Guia")
+
+    # Por guía: conflictos al asignar; por reserva: guías ocupadas en un día
+    __table_args__ = (
+        Index('ix_reserva_guia_guia', 'guia_id', 'reserva_id'),
+        Index('ix_reserva_guia_reserva', 'reserva_id', 'guia_id'),
+    )
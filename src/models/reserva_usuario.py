@@ -1,9 +1,11 @@
 from sqlalchemy import create_engine, Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Float
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Float, Index
 
 from sqlalchemy.orm import sessionmaker, relationship
-Base = declarative_base()
+from src.models.base import Base
+from src.models.reserva import Reserva
+from src.models.usuario import Usuario
 
 class ReservaUsuario(Base):
     __tablename__ = 'reserva_usuario'
@@ -11,4 +13,8 @@ class ReservaUsuario(Base):
     reserva_id = Column(Integer, ForeignKey('reserva.id'), nullable=False)
     usuario_id = Column(Integer, ForeignKey('usuario.id'), nullable=False)
     reserva = relationship("Reserva")
-    usuario = relationship("Usuario")
\ No newline at end of file
+    usuario = relationship("Usuario")
+
+    __table_args__ = (
+        Index('ix_reserva_usuario_reserva', 'reserva_id', 'usuario_id'),
+    )
@@ -0,0 +1,8 @@
+from sqlalchemy import Column, Integer, String
+from src.models.base import Base
+
+class TablaVersion(Base):
+    __tablename__ = 'tabla_version'
+
+    tabla = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -3,7 +3,7 @@ from sqlalchemy import create_engine, Column, Integer, String
 
 from sqlalchemy.ext.declarative import declarative_base
 
-Base = declarative_base()
+from src.models.base import Base
 
 class Usuario(Base):
     __tablename__ = 'usuario'
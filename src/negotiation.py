@@ -0,0 +1,285 @@
+import functools
+import inspect
+import json
+import os
+import zlib
+from contextvars import ContextVar
+
+import azure.functions as func
+
+from src.pagination import json_chunks
+from src.timing import fase
+
+# Dependencias opcionales: sin brotli solo se ofrece gzip y sin msgpack se responde siempre JSON
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Por debajo de este tamaño el cuerpo se envía sin comprimir: la cabecera y
+# el coste de CPU superan al ahorro
+MIN_BYTES = int(os.getenv("API_COMPRESS_MIN_BYTES", "1024"))
+
+GZIP_LEVEL = int(os.getenv("API_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("API_BROTLI_QUALITY", "5"))
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+# Codificaciones ofrecidas, en orden de preferencia del servidor
+CODIFICACIONES = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Tipos que merece la pena comprimir (las exportaciones incluidas)
+_COMPRIMIBLES = (JSON, MSGPACK, "application/x-ndjson", "text/")
+
+_actual = ContextVar("negociacion", default=None)
+
+
+def _calidades(header):
+    """{valor: q} de una cabecera Accept o Accept-Encoding."""
+    calidades = {}
+    for parte in (header or "").split(","):
+        valor, _, parametros = parte.partition(";")
+        valor = valor.strip().lower()
+        if not valor:
+            continue
+        q = 1.0
+        for parametro in parametros.split(";"):
+            nombre, _, numero = parametro.strip().partition("=")
+            if nombre == "q":
+                try:
+                    q = float(numero)
+                except ValueError:
+                    q = 0.0
+        calidades[valor] = max(q, calidades.get(valor, 0.0))
+    return calidades
+
+
+def codificacion(accept_encoding):
+    """Codificación de contenido a usar según Accept-Encoding, o None (identity)."""
+    calidades = _calidades(accept_encoding)
+    elegida, mejor = None, 0.0
+    for candidata in CODIFICACIONES:
+        q = calidades.get(candidata, calidades.get("*", 0.0))
+        if q > mejor:
+            elegida, mejor = candidata, q
+    return elegida
+
+
+def formato(accept):
+    """MSGPACK si el cliente lo pide explícitamente y no prefiere JSON; si no, JSON."""
+    if msgpack is None:
+        return JSON
+    calidades = _calidades(accept)
+    q = max(calidades.get(MSGPACK, 0.0), calidades.get("application/x-msgpack", 0.0))
+    return MSGPACK if q > 0 and q >= calidades.get(JSON, 0.0) else JSON
+
+
+class _Compresor:
+    __slots__ = ("_comprimir", "_terminar")
+
+    def __init__(self, codificacion):
+        if codificacion == "br":
+            objeto = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._comprimir, self._terminar = objeto.process, objeto.finish
+        else:
+            # wbits=31: formato gzip (cabecera y CRC) en lugar de zlib
+            objeto = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._comprimir, self._terminar = objeto.compress, objeto.flush
+
+    def comprimir(self, datos):
+        with fase("compress"):
+            return self._comprimir(datos)
+
+    def terminar(self):
+        with fase("compress"):
+            return self._terminar()
+
+
+def _comprimible(mimetype):
+    return bool(mimetype) and mimetype.startswith(_COMPRIMIBLES)
+
+
+def _vary(headers):
+    actual = headers.get("Vary")
+    headers["Vary"] = f"{actual}, Accept, Accept-Encoding" if actual else "Accept, Accept-Encoding"
+
+
+class Negociacion:
+    """Formato (JSON o msgpack) y codificación de contenido acordados para una petición."""
+
+    __slots__ = ("formato", "codificacion")
+
+    def __init__(self, req):
+        self.formato = formato(req.headers.get("Accept"))
+        self.codificacion = codificacion(req.headers.get("Accept-Encoding"))
+
+    @property
+    def variante(self):
+        return self.formato, self.codificacion
+
+    def escribir(self, bloques, headers, mimetype=JSON):
+        """
+        Une un cuerpo producido por bloques (p. ej. un listado completo leído
+        con yield_per). Si hay que comprimirlo, cada bloque pasa por el
+        compresor a medida que se genera, así que el texto completo sin
+        comprimir nunca llega a existir; en ese caso añade Content-Encoding
+        a `headers`. Si el JSON se va a convertir a msgpack se une sin más.
+        """
+        if self.codificacion is None or (self.formato == MSGPACK and mimetype == JSON):
+            return "".join(bloques)
+
+        pendientes, tamano, compresor, partes = [], 0, None, []
+        for bloque in bloques:
+            datos = bloque.encode() if isinstance(bloque, str) else bloque
+            if compresor is not None:
+                partes.append(compresor.comprimir(datos))
+                continue
+            pendientes.append(datos)
+            tamano += len(datos)
+            if tamano >= MIN_BYTES:
+                compresor = _Compresor(self.codificacion)
+                partes.append(compresor.comprimir(b"".join(pendientes)))
+                pendientes = None
+        if compresor is None:
+            return b"".join(pendientes)
+        partes.append(compresor.terminar())
+        headers["Content-Encoding"] = self.codificacion
+        return b"".join(partes)
+
+    def escribir_msgpack(self, bloques, headers):
+        """
+        Empaqueta en msgpack un listado producido por bloques de filas: cada
+        bloque se empaqueta al leerse, sin pasar por el texto JSON, y solo se
+        guardan sus bytes. La cabecera del arreglo necesita el total de filas,
+        así que va delante al terminar; después se comprime como en `escribir`.
+        """
+        packer = msgpack.Packer(use_bin_type=True)
+        partes, total = [], 0
+        for filas in bloques:
+            with fase("json"):
+                partes.append(b"".join(packer.pack(fila) for fila in filas))
+            total += len(filas)
+        partes.insert(0, packer.pack_array_header(total))
+        if self.codificacion is None:
+            return b"".join(partes)
+        return self.escribir(partes, headers, MSGPACK)
+
+    def aplicar(self, respuesta):
+        """Convierte y comprime la respuesta del handler según lo negociado."""
+        if isinstance(respuesta, func.HttpResponse):
+            return self._http(respuesta)
+        if hasattr(respuesta, "body_iterator"):
+            return self._streaming(respuesta)
+        return respuesta
+
+    def _http(self, respuesta):
+        headers = respuesta.headers
+        _vary(headers)
+        if self.variante != (JSON, None) and headers.get("ETag", "").startswith('"'):
+            # Misma versión, otra representación: el ETag pasa a débil (If-None-Match compara en débil)
+            headers["ETag"] = "W/" + headers["ETag"]
+        if headers.get("Content-Encoding") or respuesta.status_code in (204, 304):
+            return respuesta
+
+        cuerpo, mimetype = respuesta.get_body(), respuesta.mimetype
+        cambiado = False
+        # Aquí llegan cuerpos acotados (páginas de hasta MAX_LIMIT filas,
+        # objetos, resúmenes): el listado completo ya llega empaquetado por
+        # bloques desde escribir_filas y no pasa otra vez por json.loads
+        if self.formato == MSGPACK and mimetype == JSON and cuerpo:
+            with fase("json"):
+                cuerpo = msgpack.packb(json.loads(cuerpo), use_bin_type=True)
+            mimetype, cambiado = MSGPACK, True
+        if self.codificacion is not None and len(cuerpo) >= MIN_BYTES and _comprimible(mimetype):
+            compresor = _Compresor(self.codificacion)
+            cuerpo = compresor.comprimir(cuerpo) + compresor.terminar()
+            headers["Content-Encoding"] = self.codificacion
+            cambiado = True
+        if not cambiado:
+            return respuesta
+        return func.HttpResponse(
+            cuerpo,
+            status_code=respuesta.status_code,
+            headers=dict(headers),
+            mimetype=mimetype,
+            charset=respuesta.charset
+        )
+
+    def _streaming(self, respuesta):
+        # StreamingResponse de las HTTP streams: se comprime bloque a bloque
+        # mientras se envía; el tamaño no se conoce, así que no hay umbral
+        _vary(respuesta.headers)
+        tipo = respuesta.headers.get("content-type", "").split(";")[0]
+        if self.codificacion is None or "content-encoding" in respuesta.headers or not _comprimible(tipo):
+            return respuesta
+        compresor = _Compresor(self.codificacion)
+        original = respuesta.body_iterator
+
+        async def comprimido():
+            async for bloque in original:
+                datos = compresor.comprimir(bloque.encode() if isinstance(bloque, str) else bloque)
+                if datos:
+                    yield datos
+            yield compresor.terminar()
+
+        respuesta.body_iterator = comprimido()
+        respuesta.headers["Content-Encoding"] = self.codificacion
+        if "content-length" in respuesta.headers:
+            del respuesta.headers["content-length"]
+        return respuesta
+
+
+def escribir(bloques, headers, mimetype=JSON):
+    """`Negociacion.escribir` de la petición en curso; fuera de un handler negociado solo une los bloques."""
+    negociacion = _actual.get()
+    if negociacion is None:
+        return "".join(bloques)
+    return negociacion.escribir(bloques, headers, mimetype)
+
+
+def escribir_filas(bloques, headers):
+    """
+    Cuerpo de un listado completo a partir de bloques de filas (listas de
+    diccionarios, p. ej. de iter_rows). Devuelve (cuerpo, mimetype): msgpack
+    empaquetado por bloques si se negoció; si no, el arreglo JSON de `escribir`.
+    """
+    negociacion = _actual.get()
+    if negociacion is None or negociacion.formato != MSGPACK:
+        return escribir(json_chunks(bloques), headers), JSON
+    return negociacion.escribir_msgpack(bloques, headers), MSGPACK
+
+
+def negociado(handler):
+    """
+    Envuelve un handler HTTP (síncrono o async): negocia con Accept y
+    Accept-Encoding el formato (JSON o msgpack) y la compresión (br, gzip)
+    de la respuesta y los aplica al cuerpo que devuelve el handler.
+    """
+    if inspect.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def envoltorio(req):
+            negociacion = Negociacion(req)
+            token = _actual.set(negociacion)
+            try:
+                respuesta = await handler(req)
+            finally:
+                _actual.reset(token)
+            return negociacion.aplicar(respuesta)
+    else:
+        @functools.wraps(handler)
+        def envoltorio(req):
+            negociacion = Negociacion(req)
+            token = _actual.set(negociacion)
+            try:
+                respuesta = handler(req)
+            finally:
+                _actual.reset(token)
+            return negociacion.aplicar(respuesta)
+
+    return envoltorio
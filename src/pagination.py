@@ -0,0 +1,127 @@
+import os
+
+from src.serializers import dumps
+from src.timing import contar_filas, fase
+
+# Tamaño máximo de página aceptado en ?limit=
+MAX_LIMIT = int(os.getenv("API_MAX_PAGE_SIZE", "1000"))
+
+# Filas que se piden al cursor del servidor en cada viaje
+YIELD_PER = int(os.getenv("API_YIELD_PER", "500"))
+
+
+def parse_page_params(params):
+    """
+    Lee ?limit= y ?after= de los parámetros de la petición.
+    Devuelve (limit, after); cualquiera puede ser None.
+    Lanza ValueError si alguno no es un entero válido.
+    """
+    limit = params.get("limit")
+    after = params.get("after")
+
+    if limit is not None:
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError("limit")
+        limit = min(limit, MAX_LIMIT)
+
+    if after is not None:
+        after = int(after)
+
+    return limit, after
+
+
+def keyset_page(session, stmt, id_column, limit, after=None, scalars=False):
+    """
+    Obtiene una página ordenada por id a partir del cursor `after`.
+    Devuelve (filas, siguiente_cursor); el cursor es None en la última página.
+    Con scalars=True se devuelven instancias ORM en lugar de tuplas.
+    """
+    if after is not None:
+        stmt = stmt.where(id_column > after)
+
+    result = session.execute(stmt.order_by(id_column).limit(limit + 1))
+    with fase("fetch"):
+        rows = result.scalars().all() if scalars else result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+
+    return rows, next_cursor
+
+
+def iter_rows(session, stmt, id_column, to_dict, chunk_size=YIELD_PER, scalars=False):
+    """
+    Recorre la consulta con un cursor del servidor (yield_per) y genera las
+    filas por bloques, como listas de diccionarios, sin mantener en memoria
+    todas las filas.
+    Con scalars=True (instancias ORM con relaciones precargadas) se avanza por
+    páginas keyset y se vacía la sesión tras cada bloque, ya que selectinload
+    no admite yield_per sobre colecciones.
+    """
+    if scalars:
+        after = None
+        while True:
+            rows, after = keyset_page(session, stmt, id_column, chunk_size, after, scalars=True)
+            values = _to_dicts(rows, to_dict)
+            session.expunge_all()
+            if values:
+                yield values
+            if after is None:
+                break
+    else:
+        result = session.execute(stmt.order_by(id_column).execution_options(yield_per=chunk_size))
+        chunks = result.partitions()
+        while True:
+            with fase("fetch"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            values = _to_dicts(chunk, to_dict)
+            if values:
+                yield values
+
+
+def json_chunks(blocks):
+    """Escribe como arreglo JSON, bloque a bloque, los bloques de diccionarios de iter_rows."""
+    yield "["
+    first = True
+    for values in blocks:
+        with fase("json"):
+            chunk = ",".join(dumps(value) for value in values)
+        yield chunk if first else "," + chunk
+        first = False
+    yield "]"
+
+
+def iter_json_array(session, stmt, id_column, to_dict, chunk_size=YIELD_PER, scalars=False):
+    """El listado de iter_rows como arreglo JSON generado por bloques."""
+    return json_chunks(iter_rows(session, stmt, id_column, to_dict, chunk_size, scalars))
+
+
+def json_array(rows, to_dict):
+    """Escribe una página ya cargada como arreglo JSON."""
+    return "[" + ",".join(_encode(rows, to_dict)) + "]"
+
+
+def json_object(row, to_dict):
+    """Codifica una sola fila como objeto JSON."""
+    contar_filas(1)
+    with fase("to_dict"):
+        value = to_dict(row)
+    with fase("json"):
+        return dumps(value)
+
+
+def _to_dicts(rows, to_dict):
+    contar_filas(len(rows))
+    with fase("to_dict"):
+        return [to_dict(row) for row in rows]
+
+
+def _encode(rows, to_dict):
+    values = _to_dicts(rows, to_dict)
+    with fase("json"):
+        return [dumps(value) for value in values]
@@ -0,0 +1,192 @@
+import asyncio
+import functools
+import hmac
+import inspect
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+# Token que debe traer el header X-Profile; sin él la función está desactivada
+PROFILE_TOKEN = os.getenv("API_PROFILE_TOKEN", "")
+
+# Máximo de peticiones perfiladas por minuto y worker
+PROFILE_PER_MINUTE = int(os.getenv("API_PROFILE_PER_MINUTE", "2"))
+
+# Intervalo entre muestras de la pila
+PROFILE_INTERVAL_MS = float(os.getenv("API_PROFILE_INTERVAL_MS", "5"))
+
+# Destino: contenedor de blobs si API_PROFILE_CONTAINER está definido
+# (AzureWebJobsStorage, que en local apunta a Azurite) o un directorio local
+PROFILE_CONTAINER = os.getenv("API_PROFILE_CONTAINER", "")
+PROFILE_DIR = os.getenv("API_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "turismo-profiles"))
+
+
+_activos = 0
+_activos_lock = threading.Lock()
+_switch_interval = sys.getswitchinterval()
+
+
+def _ajustar_switch_interval(delta, interval):
+    # El hilo muestreador necesita el GIL: mientras haya perfiles en curso el
+    # intérprete cambia de hilo al menos con la frecuencia de muestreo
+    global _activos, _switch_interval
+    with _activos_lock:
+        if _activos == 0 and delta > 0:
+            _switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(_switch_interval, interval / 2))
+        _activos += delta
+        if _activos == 0:
+            sys.setswitchinterval(_switch_interval)
+
+
+class SamplingProfiler:
+    """
+    Profiler por muestreo de un hilo: otro hilo lee su pila cada `interval`
+    segundos y acumula las pilas en formato "folded" (una línea por pila con
+    su número de muestras), el que aceptan flamegraph.pl, inferno y speedscope.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL_MS / 1000, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.samples = Counter()
+        self._labels = {}
+        self._stop = threading.Event()
+        self._hilo = None
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _muestrear(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if self._stop.is_set():
+                break
+            pila = []
+            while frame is not None:
+                pila.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if pila:
+                self.samples[";".join(reversed(pila))] += 1
+
+    def __enter__(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        _ajustar_switch_interval(1, self.interval)
+        self._hilo = threading.Thread(target=self._muestrear, name="profiler", daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._hilo.join()
+        _ajustar_switch_interval(-1, self.interval)
+
+    def folded(self):
+        return "\n".join(f"{pila} {n}" for pila, n in self.samples.most_common()) + "\n"
+
+
+class Presupuesto:
+    """Ventana deslizante de un minuto: como máximo `por_minuto` perfiles."""
+
+    def __init__(self, por_minuto):
+        self.por_minuto = por_minuto
+        self._usos = deque()
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        ahora = time.monotonic()
+        with self._lock:
+            while self._usos and ahora - self._usos[0] >= 60:
+                self._usos.popleft()
+            if len(self._usos) >= self.por_minuto:
+                return False
+            self._usos.append(ahora)
+            return True
+
+
+presupuesto = Presupuesto(PROFILE_PER_MINUTE)
+
+
+def solicitado(req):
+    """True si la petición trae X-Profile con el token configurado."""
+    valor = req.headers.get("X-Profile")
+    return bool(PROFILE_TOKEN and valor) and hmac.compare_digest(valor, PROFILE_TOKEN)
+
+
+def guardar(nombre, contenido):
+    """Escribe el perfil en blob storage (o Azurite) o en PROFILE_DIR; devuelve su ubicación."""
+    if PROFILE_CONTAINER:
+        try:
+            from azure.core.exceptions import ResourceExistsError
+            from azure.storage.blob import BlobServiceClient
+
+            servicio = BlobServiceClient.from_connection_string(os.environ["AzureWebJobsStorage"])
+            contenedor = servicio.get_container_client(PROFILE_CONTAINER)
+            try:
+                contenedor.create_container()
+            except ResourceExistsError:
+                pass
+            blob = contenedor.upload_blob(nombre, contenido.encode(), overwrite=True)
+            return blob.url
+        except Exception as e:
+            logging.warning(f"No se pudo subir el perfil a blob storage, se guarda en local: {str(e)}")
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    ruta = os.path.join(PROFILE_DIR, nombre)
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write(contenido)
+    return ruta
+
+
+def _nombre(funcion):
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{funcion}-{uuid.uuid4().hex[:8]}.folded"
+
+
+def perfilable(handler):
+    """
+    Envuelve un handler HTTP para que, con `X-Profile: <API_PROFILE_TOKEN>` y
+    dentro del presupuesto por minuto, esa invocación se ejecute bajo el
+    profiler. La ubicación del perfil se devuelve en el header X-Profile-Output.
+    En los handlers async se muestrea el hilo del event loop, que puede estar
+    atendiendo a la vez otras peticiones.
+    """
+    nombre = handler.__name__
+
+    def _rechazado(respuesta):
+        respuesta.headers["X-Profile-Output"] = "limite-excedido"
+        return respuesta
+
+    if inspect.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def envoltorio(req):
+            if not solicitado(req):
+                return await handler(req)
+            if not presupuesto.permitir():
+                return _rechazado(await handler(req))
+            with SamplingProfiler() as profiler:
+                respuesta = await handler(req)
+            respuesta.headers["X-Profile-Output"] = await asyncio.to_thread(guardar, _nombre(nombre), profiler.folded())
+            return respuesta
+    else:
+        @functools.wraps(handler)
+        def envoltorio(req):
+            if not solicitado(req):
+                return handler(req)
+            if not presupuesto.permitir():
+                return _rechazado(handler(req))
+            with SamplingProfiler() as profiler:
+                respuesta = handler(req)
+            respuesta.headers["X-Profile-Output"] = guardar(_nombre(nombre), profiler.folded())
+            return respuesta
+
+    return envoltorio
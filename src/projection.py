@@ -0,0 +1,64 @@
+from functools import lru_cache
+
+from sqlalchemy import select
+
+from src.serializers import dumps, row_encoder
+
+
+class Projection:
+    """
+    Consulta de solo lectura sobre un subconjunto de columnas de un modelo.
+    Las filas se leen con Core (tuplas) y se codifican por posición, sin
+    hidratar instancias ORM ni pasar por el identity map de la sesión.
+    """
+
+    orm = False
+    dependencias = ()
+    __slots__ = ("model", "fields", "key", "columns", "to_dict")
+
+    def __init__(self, model, fields):
+        table = model.__table__
+        self.model = model
+        self.fields = fields
+        self.key = (fields,)
+        salida = [table.columns[name] for name in fields]
+
+        # La clave primaria se lee siempre: la necesita el cursor de paginación
+        extra = [c for c in table.primary_key.columns if c.name not in fields]
+        self.columns = tuple(salida + extra)
+        self.to_dict = row_encoder(salida, f"<projection {model.__name__}>")
+
+    def select(self):
+        return select(*self.columns)
+
+    def dumps(self, row):
+        return dumps(self.to_dict(row))
+
+
+def parse_fields(model, raw):
+    """
+    Convierte ?fields=id,nombre en una tupla de nombres de columna.
+    Devuelve None si no se pidió proyección; lanza ValueError con el nombre
+    del primer campo desconocido.
+    """
+    if not raw:
+        return None
+
+    columnas = model.__table__.columns
+    fields = []
+    for name in raw.split(","):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in columnas:
+            raise ValueError(name)
+        fields.append(name)
+
+    return tuple(fields) or None
+
+
+@lru_cache(maxsize=256)
+def projection_for(model, fields=None):
+    if fields is None:
+        fields = tuple(c.name for c in model.__table__.columns)
+    return Projection(model, fields)
@@ -0,0 +1,121 @@
+import bisect
+import logging
+import re
+import threading
+import time
+from functools import lru_cache
+
+from sqlalchemy import event
+
+# Límites superiores (ms) de los cubos del histograma de latencias
+BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+# Entrada que agrupa las sentencias nuevas cuando se alcanza max_fingerprints
+OTRAS = "<otras sentencias>"
+
+_LITERAL = re.compile(r"N?'(?:[^']|'')*'")
+_NUMERO = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_PARAMETRO = re.compile(r"\?|:\w+|%\(\w+\)s|@P\d+")
+_LISTA_IN = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_FILAS_VALUES = re.compile(r"(\(\?(?:, \?)*\))(?:, \(\?(?:, \?)*\))+")
+_ESPACIOS = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement):
+    """
+    Normaliza una sentencia SQL para agrupar ejecuciones equivalentes: los
+    literales y parámetros pasan a ?, las listas IN (...) y las filas de un
+    INSERT por lotes (insertmanyvalues) se reducen a una sola.
+    """
+    sql = _ESPACIOS.sub(" ", statement).strip()
+    sql = _LITERAL.sub("?", sql)
+    sql = _NUMERO.sub("?", sql)
+    sql = _PARAMETRO.sub("?", sql)
+    sql = _LISTA_IN.sub("IN (?)", sql)
+    return _FILAS_VALUES.sub(r"\1", sql)
+
+
+class _Estadistica:
+    __slots__ = ("count", "total", "max", "histograma")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histograma = [0] * (len(BUCKETS_MS) + 1)
+
+    def registrar(self, ms):
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+        self.histograma[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+    def to_dict(self, fingerprint):
+        etiquetas = [f"<={limite}ms" for limite in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        return {
+            "fingerprint": fingerprint,
+            "count": self.count,
+            "total_ms": round(self.total, 3),
+            "avg_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max, 3),
+            "histograma": dict(zip(etiquetas, self.histograma)),
+        }
+
+
+class QueryStats:
+    """
+    Perfil de consultas por worker a partir de los eventos del engine: agrega
+    por fingerprint el número de ejecuciones, el tiempo total, el máximo y un
+    histograma, y registra en el log solo las sentencias que superan
+    `umbral_ms`. Sustituye a echo=True, que registraba cada sentencia.
+    """
+
+    def __init__(self, umbral_ms=500.0, max_fingerprints=500):
+        self.umbral_ms = umbral_ms
+        self.max_fingerprints = max_fingerprints
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, statement, ms):
+        sentencia = fingerprint(statement)
+        clave = sentencia
+        with self._lock:
+            stats = self._stats.get(clave)
+            if stats is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    clave = OTRAS
+                stats = self._stats.setdefault(clave, _Estadistica())
+            stats.registrar(ms)
+        if ms >= self.umbral_ms:
+            # La sentencia normalizada aunque se haya agregado en OTRAS, y sin
+            # parámetros: pueden contener datos personales o contraseñas
+            logging.warning(f"Consulta lenta ({ms:.1f} ms): {sentencia}")
+
+    def top(self, n=20, orden="total"):
+        """Las `n` fingerprints con mayor `orden` (total, count, max o avg)."""
+        with self._lock:
+            filas = [stats.to_dict(clave) for clave, stats in self._stats.items()]
+        filas.sort(key=lambda fila: fila[f"{orden}_ms" if orden != "count" else "count"], reverse=True)
+        return filas[:n]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def bind(self, target):
+        @event.listens_for(target, "before_cursor_execute")
+        def _inicio(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_stats_inicio", []).append(time.perf_counter())
+
+        @event.listens_for(target, "after_cursor_execute")
+        def _fin(conn, cursor, statement, parameters, context, executemany):
+            inicio = conn.info["query_stats_inicio"].pop()
+            self.registrar(statement, (time.perf_counter() - inicio) * 1000)
+
+        @event.listens_for(target, "handle_error")
+        def _error(exception_context):
+            conn = exception_context.connection
+            if conn is not None and conn.info.get("query_stats_inicio"):
+                conn.info["query_stats_inicio"].pop()
@@ -0,0 +1,228 @@
+import os
+from collections import defaultdict
+
+from sqlalchemy import case, event, func, insert, inspect, select, update
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+from src.db import tablas_en_replica
+from src.models.calificacion_resumen import CalificacionResumen
+
+# Media bayesiana: (PRIOR_WEIGHT * PRIOR_MEAN + suma) / (PRIOR_WEIGHT + cantidad).
+# Con una media a priori fija la puntuación de cada entidad depende solo de sus
+# propias calificaciones, así que se guarda ya calculada e indexada para el ranking
+PRIOR_MEAN = float(os.getenv("API_RATING_PRIOR_MEAN", "3"))
+PRIOR_WEIGHT = float(os.getenv("API_RATING_PRIOR_WEIGHT", "5"))
+
+# Tabla de calificaciones -> (tipo en el resumen, columna de la entidad calificada)
+TIPOS = {
+    "guia_calificacion": ("guia", "guia_id"),
+    "destino_calificacion": ("destino", "destino_id"),
+}
+
+_tabla = CalificacionResumen.__table__
+_CUBOS = ("d1", "d2", "d3", "d4", "d5")
+
+
+def cubo(valor):
+    """Estrellas (1-5) de una calificación, redondeando al entero más cercano."""
+    if valor < 1.5:
+        return 1
+    if valor < 2.5:
+        return 2
+    if valor < 3.5:
+        return 3
+    if valor < 4.5:
+        return 4
+    return 5
+
+
+def puntuacion(cantidad, suma):
+    return (PRIOR_WEIGHT * PRIOR_MEAN + suma) / (PRIOR_WEIGHT + cantidad)
+
+
+def _anterior(estado, atributo):
+    # Valor confirmado en la base antes de los cambios pendientes de este flush
+    historia = estado.attrs[atributo].history
+    if historia.deleted:
+        return historia.deleted[0]
+    if historia.unchanged:
+        return historia.unchanged[0]
+    return None
+
+
+class RatingAggregates:
+    """
+    Resumen por guía y destino (cantidad, suma, distribución por estrellas y
+    media bayesiana) en `calificacion_resumen`, mantenido de forma incremental
+    en el mismo flush que inserta, modifica o elimina calificaciones.
+    Las escrituras masivas que no pasan por la unidad de trabajo del ORM deben
+    llamar después a `recalcular`.
+    """
+
+    def __init__(self):
+        self._lista = False
+        self._en_replica = False
+
+    def _asegurar_tabla(self, connection):
+        # Igual que en TableVersions: sin lock de hilo y tolerando que otra
+        # petición cree la tabla a la vez. Al crearla se calcula desde cero
+        if self._lista:
+            return
+        if not inspect(connection).has_table(_tabla.name):
+            try:
+                with connection.begin_nested():
+                    _tabla.create(connection)
+                    self._recalcular(connection)
+            except DBAPIError:
+                if not inspect(connection).has_table(_tabla.name):
+                    raise
+        self._lista = True
+
+    def _recalcular(self, connection):
+        from src import models
+
+        connection.execute(_tabla.delete())
+        for modelo in (models.GuiaCalificacion, models.DestinoCalificacion):
+            calificaciones = modelo.__table__
+            tipo, columna = TIPOS[calificaciones.name]
+            entidad = calificaciones.c[columna]
+            valor = calificaciones.c.calificacion
+            estrellas = case(
+                (valor < 1.5, 1), (valor < 2.5, 2), (valor < 3.5, 3), (valor < 4.5, 4), else_=5
+            )
+            filas = connection.execute(
+                select(
+                    entidad, func.count(valor), func.sum(valor),
+                    *(func.sum(case((estrellas == n, 1), else_=0)) for n in range(1, 6))
+                )
+                .where(entidad.is_not(None), valor.is_not(None))
+                .group_by(entidad)
+            ).all()
+            if filas:
+                connection.execute(insert(_tabla), [
+                    dict(
+                        tipo=tipo, entidad_id=fila[0], cantidad=fila[1], suma=fila[2],
+                        puntuacion=puntuacion(fila[1], fila[2]), **dict(zip(_CUBOS, fila[3:]))
+                    )
+                    for fila in filas
+                ])
+
+    def _legible(self, session):
+        # Como en TableVersions: en la réplica no se ejecuta DDL y sin la tabla el resumen está vacío
+        if not session.info.get("replica"):
+            self._asegurar_tabla(session.connection())
+            return True
+        if not self._en_replica:
+            self._en_replica = tablas_en_replica(session, (_tabla,), self._asegurar_tabla)
+        return self._en_replica
+
+    def recalcular(self, session):
+        """Reconstruye el resumen completo a partir de las calificaciones."""
+        connection = session.connection()
+        self._asegurar_tabla(connection)
+        self._recalcular(connection)
+
+    def _aplicar(self, connection, deltas):
+        self._asegurar_tabla(connection)
+        for (tipo, entidad_id), (cantidad, suma, cubos) in sorted(deltas.items()):
+            if not cantidad and not suma and not any(cubos):
+                continue
+            c = _tabla.c
+            acumular = (
+                update(_tabla)
+                .where(c.tipo == tipo, c.entidad_id == entidad_id)
+                .values(
+                    cantidad=c.cantidad + cantidad,
+                    suma=c.suma + suma,
+                    puntuacion=(PRIOR_WEIGHT * PRIOR_MEAN + c.suma + suma) / (PRIOR_WEIGHT + c.cantidad + cantidad),
+                    **{nombre: c[nombre] + n for nombre, n in zip(_CUBOS, cubos)}
+                )
+            )
+            if connection.execute(acumular).rowcount:
+                continue
+            # Primera calificación de la entidad: si otra transacción crea la
+            # fila a la vez, el INSERT falla dentro de su savepoint y se repite
+            # el UPDATE sobre la fila ya existente
+            try:
+                with connection.begin_nested():
+                    connection.execute(insert(_tabla).values(
+                        tipo=tipo, entidad_id=entidad_id, cantidad=cantidad, suma=suma,
+                        puntuacion=puntuacion(cantidad, suma), **dict(zip(_CUBOS, cubos))
+                    ))
+            except IntegrityError:
+                connection.execute(acumular)
+
+    def bind(self, session_factory):
+        @event.listens_for(session_factory, "before_flush")
+        def _actualizar(session, flush_context, instances):
+            deltas = defaultdict(lambda: [0, 0.0, [0] * 5])
+
+            def sumar(tipo, entidad_id, valor, signo):
+                if entidad_id is None or valor is None:
+                    return
+                delta = deltas[(tipo, entidad_id)]
+                delta[0] += signo
+                delta[1] += signo * valor
+                delta[2][cubo(valor) - 1] += signo
+
+            for obj in session.new:
+                tipo = TIPOS.get(getattr(obj, "__tablename__", None))
+                if tipo:
+                    sumar(tipo[0], getattr(obj, tipo[1]), obj.calificacion, 1)
+
+            for obj in session.dirty:
+                tipo = TIPOS.get(getattr(obj, "__tablename__", None))
+                if tipo and session.is_modified(obj):
+                    estado = inspect(obj)
+                    sumar(tipo[0], _anterior(estado, tipo[1]), _anterior(estado, "calificacion"), -1)
+                    sumar(tipo[0], getattr(obj, tipo[1]), obj.calificacion, 1)
+
+            for obj in session.deleted:
+                tipo = TIPOS.get(getattr(obj, "__tablename__", None))
+                if tipo:
+                    estado = inspect(obj)
+                    sumar(tipo[0], _anterior(estado, tipo[1]), _anterior(estado, "calificacion"), -1)
+
+            if deltas:
+                # Por la conexión, como TableVersions, para no disparar eventos de la sesión
+                self._aplicar(session.connection(), deltas)
+
+    def resumen(self, session, tipo, entidad_id):
+        if not self._legible(session):
+            return _formatear(entidad_id, 0, 0.0, [0] * 5)
+        fila = session.connection().execute(
+            select(_tabla).where(_tabla.c.tipo == tipo, _tabla.c.entidad_id == entidad_id)
+        ).first()
+        if fila is None:
+            return _formatear(entidad_id, 0, 0.0, [0] * 5)
+        return _formatear(entidad_id, fila.cantidad, fila.suma, [getattr(fila, n) for n in _CUBOS])
+
+    def top(self, session, tipo, entidad, k, *filtros):
+        """
+        Las `k` entidades con mayor media bayesiana. Se recorre el índice
+        (tipo, puntuacion) de mayor a menor, de modo que sin filtros solo se leen k filas.
+        """
+        if not self._legible(session):
+            return []
+        c = _tabla.c
+        filas = session.connection().execute(
+            select(entidad.id, entidad.nombre, c.cantidad, c.suma, *(c[n] for n in _CUBOS))
+            .join(entidad, entidad.id == c.entidad_id)
+            .where(c.tipo == tipo, c.cantidad > 0, *filtros)
+            .order_by(c.puntuacion.desc(), c.entidad_id)
+            .limit(k)
+        ).all()
+        return [
+            dict(_formatear(fila[0], fila[2], fila[3], list(fila[4:])), nombre=fila[1])
+            for fila in filas
+        ]
+
+
+def _formatear(entidad_id, cantidad, suma, cubos):
+    return {
+        "id": entidad_id,
+        "cantidad": cantidad,
+        "promedio": round(suma / cantidad, 3) if cantidad else None,
+        "bayesiano": round(puntuacion(cantidad, suma), 3),
+        "distribucion": {str(n): cubos[n - 1] for n in range(1, 6)},
+    }
@@ -0,0 +1,72 @@
+import functools
+import inspect
+import os
+from http.cookies import CookieError, SimpleCookie
+
+from src.db import REPLICA
+
+# Segundos que, tras una escritura, las lecturas del mismo cliente van a la
+# primaria (cookie con Max-Age): cubren el retraso habitual de la réplica
+STICKY_S = int(os.getenv("API_REPLICA_STICKY_S", "5"))
+
+# Cookie de la ventana tras una escritura y header para forzar la primaria
+COOKIE = "turismo_primaria"
+HEADER = "X-Read-Consistency"
+
+
+def _cookie(req):
+    try:
+        cookies = SimpleCookie(req.headers.get("Cookie") or "")
+    except CookieError:
+        return False
+    return COOKIE in cookies
+
+
+def de_replica(req):
+    """
+    Indica si la petición se puede servir desde la réplica: solo los GET,
+    salvo que pidan "X-Read-Consistency: strong" o lleguen dentro de la
+    ventana posterior a una escritura del mismo cliente.
+    """
+    if not REPLICA or req.method != "GET":
+        return False
+    if (req.headers.get(HEADER) or "").strip().lower() == "strong":
+        return False
+    return not _cookie(req)
+
+
+def exige_primaria(req):
+    """
+    Con réplica, indica si un GET va a la primaria para ver las escrituras
+    recientes del cliente (cookie o header); sin réplica siempre es False.
+    """
+    return REPLICA and req.method == "GET" and not de_replica(req)
+
+
+def _marcar(req, respuesta):
+    # Solo las escrituras confirmadas; las encoladas (202) aún no se han aplicado
+    if req.method == "GET" or respuesta.status_code not in (200, 201, 204):
+        return respuesta
+    respuesta.headers["Set-Cookie"] = f"{COOKIE}=1; Max-Age={STICKY_S}; Path=/; HttpOnly; SameSite=Lax"
+    return respuesta
+
+
+def leer_lo_escrito(handler):
+    """
+    Envuelve un handler HTTP (síncrono o async): con réplica configurada, las
+    escrituras correctas devuelven la cookie que lleva a la primaria las
+    lecturas del cliente durante STICKY_S segundos (read-your-writes).
+    """
+    if not REPLICA:
+        return handler
+
+    if inspect.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def envoltorio(req):
+            return _marcar(req, await handler(req))
+    else:
+        @functools.wraps(handler)
+        def envoltorio(req):
+            return _marcar(req, handler(req))
+
+    return envoltorio
@@ -0,0 +1,52 @@
+import re
+from functools import cached_property
+
+from src import availability, models
+from src.validation import Validator
+
+
+class Recurso:
+    """
+    Declaración de un recurso REST sobre un modelo de src/models. A partir de
+    ella se generan las rutas `<ruta>` y `<ruta>/{<singular>_id}`. El modelo y
+    su validador se resuelven una vez, en el primer uso, y quedan en caché.
+    `comprobar(session, datos, actual)` valida reglas que dependen de otras
+    filas antes del INSERT/UPDATE y devuelve el mensaje del conflicto o None.
+    """
+
+    def __init__(self, modelo, ruta, femenino=False, comprobar=None):
+        self.nombre_modelo = modelo
+        self.ruta = ruta
+        self.singular = re.sub(r"(?<!^)(?=[A-Z])", "_", modelo).lower()
+        self.parametro = f"{self.singular}_id"
+        self.no_encontrado = f"{modelo} no encontrad{'a' if femenino else 'o'}"
+        self.eliminado = f"{modelo} eliminad{'a' if femenino else 'o'} correctamente"
+        self.comprobar = comprobar
+
+    @cached_property
+    def modelo(self):
+        return getattr(models, self.nombre_modelo)
+
+    @cached_property
+    def validador(self):
+        return Validator(self.modelo)
+
+
+RECURSOS = (
+    Recurso("Usuario", "usuarios"),
+    Recurso("Cliente", "clientes"),
+    Recurso("Pais", "paises"),
+    Recurso("Ciudad", "ciudades", femenino=True),
+    Recurso("Destino", "destinos"),
+    Recurso("Reserva", "reservas", femenino=True, comprobar=availability.comprobar_reserva),
+    Recurso("Genero", "generos"),
+    Recurso("Guia", "guias"),
+    Recurso("Idioma", "idiomas"),
+    Recurso("GuiaIdioma", "guia_idiomas"),
+    Recurso("ReservaGuia", "reserva_guias", femenino=True, comprobar=availability.comprobar_asignacion),
+    Recurso("ReservaUsuario", "reserva_usuarios", femenino=True),
+    Recurso("GuiaCalificacion", "guia_calificaciones", femenino=True),
+    Recurso("DestinoCalificacion", "destino_calificaciones", femenino=True),
+)
+
+POR_MODELO = {recurso.nombre_modelo: recurso for recurso in RECURSOS}
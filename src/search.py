@@ -0,0 +1,453 @@
+import bisect
+import heapq
+import logging
+import operator
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from itertools import compress
+
+from sqlalchemy import event, select
+
+from src import models
+
+# Peso de cada campo en la puntuación; una coincidencia por prefijo vale PESO_PREFIJO veces la exacta
+PESOS = {"nombre": 4.0, "ciudad": 2.0, "pais": 1.5, "descripcion": 1.0}
+PESO_PREFIJO = 0.5
+
+# Bonificación si el nombre del destino empieza por la consulta completa
+BONUS_NOMBRE = 2.0
+
+# Términos del vocabulario que se consideran como máximo al expandir un prefijo
+MAX_EXPANSION = int(os.getenv("API_SEARCH_MAX_EXPANSION", "64"))
+
+# Con cambios hechos por otros workers, segundos mínimos entre recargas completas
+SEARCH_REFRESH_S = float(os.getenv("API_SEARCH_REFRESH_S", "2"))
+
+# Palabras vacías que no se indexan en la descripción
+_VACIAS = frozenset({
+    "a", "al", "con", "de", "del", "el", "en", "la", "las", "los", "o", "para", "por", "un", "una", "y",
+})
+
+_TOKEN = re.compile(r"\w+")
+_MAXIMO = chr(0x10FFFF)
+_DIACRITICOS = re.compile("[\u0300-\u036f]")
+_TABLAS = ("destino", "ciudad", "pais")
+_CAMBIOS = "busqueda_cambios"
+_DML = "busqueda_dml"
+_VERSIONES = "busqueda_versiones"
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes ni diacríticos: "Bogotá" -> "bogota"."""
+    if texto.isascii():
+        return texto.lower()
+    return _DIACRITICOS.sub("", unicodedata.normalize("NFKD", texto.casefold()))
+
+
+def tokens(texto):
+    return _TOKEN.findall(normalizar(texto)) if texto else []
+
+
+class _Indice:
+    """
+    Índice invertido de destinos, ciudades y países. Los términos de ciudad y
+    país apuntan a sus propias filas y se expanden a destinos al consultar,
+    de modo que renombrar una ciudad solo toca las entradas de esa ciudad.
+    """
+
+    def __init__(self):
+        self.destinos = {}
+        self.ciudades = {}
+        self.paises = {}
+        self.por_ciudad = defaultdict(set)
+        self.por_pais = defaultdict(set)
+        self.ciudad_de = {}
+        self.terminos = {campo: defaultdict(set) for campo in PESOS}
+        # Nombres normalizados ordenados y sus ids en paralelo, para la bonificación por prefijo
+        self.nombres = []
+        self.nombres_ids = []
+        self.vocabulario = []
+        self._usos = Counter()
+        # Durante la carga inicial las listas se rellenan sin orden y se ordenan al final
+        self._masivo = False
+
+    def _poner(self, campo, id, terminos):
+        indice, usos = self.terminos[campo], self._usos
+        for termino in terminos:
+            indice[termino].add(id)
+            n = usos.get(termino, 0)
+            if n == 0:
+                if self._masivo:
+                    self.vocabulario.append(termino)
+                else:
+                    bisect.insort(self.vocabulario, termino)
+            usos[termino] = n + 1
+
+    def _quitar(self, campo, id, terminos):
+        for termino in terminos:
+            ids = self.terminos[campo][termino]
+            ids.discard(id)
+            if not ids:
+                del self.terminos[campo][termino]
+            self._usos[termino] -= 1
+            if self._usos[termino] <= 0:
+                del self._usos[termino]
+                self.vocabulario.pop(bisect.bisect_left(self.vocabulario, termino))
+
+    def poner_destino(self, id, nombre, descripcion, ciudad_id):
+        self.quitar_destino(id)
+        terminos = tokens(nombre)
+        del_nombre = frozenset(terminos)
+        de_descripcion = frozenset(tokens(descripcion)) - _VACIAS - del_nombre
+        self._poner("nombre", id, del_nombre)
+        self._poner("descripcion", id, de_descripcion)
+        clave = (" ".join(terminos), id)
+        posicion = len(self.nombres) if self._masivo else bisect.bisect_left(self.nombres, clave)
+        self.nombres.insert(posicion, clave)
+        self.nombres_ids.insert(posicion, id)
+        self.destinos[id] = (nombre, descripcion, ciudad_id, del_nombre, de_descripcion, clave)
+        self.por_ciudad[ciudad_id].add(id)
+        self.ciudad_de[id] = ciudad_id
+
+    def quitar_destino(self, id):
+        anterior = self.destinos.pop(id, None)
+        if anterior is None:
+            return
+        _, _, ciudad_id, del_nombre, de_descripcion, clave = anterior
+        self._quitar("nombre", id, del_nombre)
+        self._quitar("descripcion", id, de_descripcion)
+        posicion = bisect.bisect_left(self.nombres, clave)
+        del self.nombres[posicion], self.nombres_ids[posicion]
+        self.por_ciudad[ciudad_id].discard(id)
+        del self.ciudad_de[id]
+
+    def poner_ciudad(self, id, nombre, pais_id):
+        self.quitar_ciudad(id)
+        terminos = frozenset(tokens(nombre))
+        self._poner("ciudad", id, terminos)
+        self.ciudades[id] = (nombre, pais_id, terminos)
+        self.por_pais[pais_id].add(id)
+
+    def quitar_ciudad(self, id):
+        anterior = self.ciudades.pop(id, None)
+        if anterior is None:
+            return
+        self._quitar("ciudad", id, anterior[2])
+        self.por_pais[anterior[1]].discard(id)
+
+    def poner_pais(self, id, nombre):
+        self.quitar_pais(id)
+        terminos = frozenset(tokens(nombre))
+        self._poner("pais", id, terminos)
+        self.paises[id] = (nombre, terminos)
+
+    def quitar_pais(self, id):
+        anterior = self.paises.pop(id, None)
+        if anterior is not None:
+            self._quitar("pais", id, anterior[1])
+
+    def cargar(self, paises, ciudades, destinos):
+        """Carga inicial a partir de filas (id, nombre), (id, nombre, pais_id) y (id, nombre, descripcion, ciudad_id)."""
+        self._masivo = True
+        for fila in paises:
+            self.poner_pais(*fila)
+        for fila in ciudades:
+            self.poner_ciudad(*fila)
+        for fila in destinos:
+            self.poner_destino(*fila)
+        self._masivo = False
+        self.vocabulario.sort()
+        self.nombres.sort()
+        self.nombres_ids = [id for _, id in self.nombres]
+
+    def aplicar(self, cambios):
+        """Cambios (tabla, id, valores) en orden; valores None significa borrado."""
+        for tabla, id, valores in cambios:
+            if valores is None:
+                getattr(self, f"quitar_{tabla}")(id)
+            else:
+                getattr(self, f"poner_{tabla}")(id, *valores)
+
+    def _expandir(self, prefijo):
+        inicio = bisect.bisect_left(self.vocabulario, prefijo)
+        for termino in self.vocabulario[inicio:inicio + MAX_EXPANSION]:
+            if not termino.startswith(prefijo):
+                break
+            yield termino, 1.0 if termino == prefijo else PESO_PREFIJO
+
+    def _coincidencias(self, prefijo):
+        """
+        Tríos (peso, ids, por_ciudad) de un término de la consulta. Si
+        `por_ciudad` es True los ids son de ciudades y no se expanden a
+        destinos hasta saber si hace falta.
+        """
+        coincidencias = []
+        for termino, factor in self._expandir(prefijo):
+            for campo in ("nombre", "descripcion"):
+                ids = self.terminos[campo].get(termino)
+                if ids:
+                    coincidencias.append((PESOS[campo] * factor, ids, False))
+            ciudades = self.terminos["ciudad"].get(termino)
+            if ciudades:
+                coincidencias.append((PESOS["ciudad"] * factor, ciudades, True))
+            paises = self.terminos["pais"].get(termino)
+            if paises:
+                coincidencias.append((PESOS["pais"] * factor, set().union(*map(self.por_pais.__getitem__, paises)), True))
+        return coincidencias
+
+    def _estimar(self, coincidencias):
+        destinos_por_ciudad = len(self.destinos) / max(len(self.ciudades), 1)
+        return sum(len(ids) * (destinos_por_ciudad if por_ciudad else 1) for _, ids, por_ciudad in coincidencias)
+
+    def buscar(self, consulta, limite):
+        terminos = list(dict.fromkeys(tokens(consulta)))
+        if not terminos:
+            return []
+
+        # Todos los términos deben coincidir: se parte del más selectivo y los
+        # demás solo se evalúan sobre los candidatos que quedan. Con consultas
+        # poco selectivas hay decenas de miles de candidatos, así que las
+        # sumas y filtros se hacen con map/compress, sin bucles en Python
+        total = None
+        for grupo in sorted(map(self._coincidencias, terminos), key=self._estimar):
+            puntos = {}
+            # De menor a mayor peso: cada destino se queda con su mejor coincidencia
+            for peso, ids, por_ciudad in sorted(grupo, key=lambda c: c[0]):
+                if total is None:
+                    if por_ciudad:
+                        ids = set().union(*map(self.por_ciudad.__getitem__, ids))
+                elif por_ciudad:
+                    ids = compress(total, map(ids.__contains__, map(self.ciudad_de.__getitem__, total)))
+                else:
+                    ids = ids & total.keys()
+                puntos.update(dict.fromkeys(ids, peso))
+            if total is not None:
+                puntos = dict(zip(puntos, map(operator.add, map(total.__getitem__, puntos), puntos.values())))
+            total = puntos
+            if not total:
+                return []
+
+        frase = " ".join(terminos)
+        inicio = bisect.bisect_left(self.nombres, (frase,))
+        fin = bisect.bisect_left(self.nombres, (frase + _MAXIMO,), inicio)
+        bonificados = total.keys() & self.nombres_ids[inicio:fin]
+        total.update(zip(bonificados, map(BONUS_NOMBRE.__add__, map(total.__getitem__, bonificados))))
+
+        # Por puntuación descendente y, a igual puntuación, por id
+        mejores = []
+        for nivel in sorted(set(total.values()), reverse=True):
+            ids = compress(total, map(nivel.__eq__, total.values()))
+            mejores += heapq.nsmallest(limite - len(mejores), ids)
+            if len(mejores) >= limite:
+                break
+        return [self._resultado(destino_id, total[destino_id]) for destino_id in mejores]
+
+    def _resultado(self, destino_id, puntuacion):
+        nombre, descripcion, ciudad_id = self.destinos[destino_id][:3]
+        ciudad = self.ciudades.get(ciudad_id)
+        pais = self.paises.get(ciudad[1]) if ciudad else None
+        return {
+            "id": destino_id,
+            "nombre": nombre,
+            "descripcion": descripcion,
+            "ciudad_id": ciudad_id,
+            "ciudad": ciudad[0] if ciudad else None,
+            "pais": pais[0] if pais else None,
+            "puntuacion": round(puntuacion, 3),
+        }
+
+
+def _valores(obj):
+    tabla = obj.__tablename__
+    if tabla == "destino":
+        return obj.nombre, obj.descripcion, obj.ciudad_id
+    if tabla == "ciudad":
+        return obj.nombre, obj.pais_id
+    return (obj.nombre,)
+
+
+class SearchIndex:
+    """
+    Búsqueda de destinos por nombre, descripción, ciudad y país, sin tildes,
+    por términos y prefijos y ordenada por puntuación, servida desde un índice
+    en memoria por worker. Las escrituras de este worker se aplican al índice
+    al confirmarse; las de otros se detectan por las versiones de tabla
+    (TableVersions) y provocan una recarga completa en segundo plano, con una
+    sesión de `fabrica` (la primaria) y como mucho cada SEARCH_REFRESH_S
+    segundos. Mientras tanto se sigue respondiendo con el índice anterior.
+    """
+
+    def __init__(self, versiones, fabrica):
+        self.versiones = versiones
+        self.fabrica = fabrica
+        self._indice = None
+        self._versiones = {}
+        self._obsoleto = False
+        self._cargado = 0.0
+        self._diarios = []
+        self._lock = threading.Lock()
+        self._carga_lock = threading.Lock()
+
+    def _modelos(self):
+        return models.Destino, models.Ciudad, models.Pais
+
+    def cargar(self, session, versiones=None):
+        if versiones is None:
+            versiones = self.versiones.current_many(session, self._modelos())
+        diario = []
+        with self._lock:
+            self._diarios.append(diario)
+            self._obsoleto = False
+        try:
+            destino = models.Destino
+            indice = _Indice()
+            indice.cargar(
+                session.execute(select(models.Pais.id, models.Pais.nombre)).all(),
+                session.execute(select(models.Ciudad.id, models.Ciudad.nombre, models.Ciudad.pais_id)).all(),
+                session.execute(select(destino.id, destino.nombre, destino.descripcion, destino.ciudad_id)),
+            )
+        finally:
+            with self._lock:
+                self._diarios.remove(diario)
+        with self._lock:
+            # Los commits de este worker confirmados durante la lectura se vuelven a aplicar
+            self._versiones = dict(versiones)
+            for cambios, nuevas in diario:
+                indice.aplicar(cambios)
+                self._avanzar(nuevas)
+            self._indice = indice
+            self._cargado = time.monotonic()
+
+    def _recargar(self):
+        # Recarga completa en un hilo con su propia sesión; si ya hay una en curso no se lanza otra
+        if not self._carga_lock.acquire(blocking=False):
+            return
+
+        def recargar():
+            try:
+                session = self.fabrica()
+                try:
+                    self.cargar(session)
+                finally:
+                    session.close()
+            except Exception as e:
+                logging.warning(f"No se pudo recargar el índice de búsqueda: {str(e)}")
+            finally:
+                self._carga_lock.release()
+
+        threading.Thread(target=recargar, name="search-refresh", daemon=True).start()
+
+    def preparar(self, session, consistente=False):
+        """
+        Garantiza que hay índice y, si otro worker cambió las tablas, lanza su
+        recarga en segundo plano. Con `consistente` (lecturas que deben ver
+        las escrituras recientes del cliente) un índice atrasado se recarga en
+        la petición. Devuelve las versiones {tabla: version} con las que está
+        construido el índice que responderá a la búsqueda.
+        """
+        actuales = self.versiones.current_many(session, self._modelos())
+        with self._lock:
+            if self._indice is not None:
+                # Solo cuentan las versiones más nuevas: una réplica atrasada no hace retroceder el índice
+                atrasado = self._obsoleto or any(v > self._versiones.get(t, 0) for t, v in actuales.items())
+                if not (consistente and atrasado):
+                    if self._obsoleto or (atrasado and time.monotonic() - self._cargado >= SEARCH_REFRESH_S):
+                        self._recargar()
+                    return dict(self._versiones)
+        # Sin índice (o atrasado con `consistente`) la carga se hace en la
+        # petición. No se espera a otra en curso: con AsyncSession bloquearía el event loop
+        if self._carga_lock.acquire(blocking=False):
+            try:
+                self._cargar_de_primaria(session, actuales)
+            finally:
+                self._carga_lock.release()
+        else:
+            self._cargar_de_primaria(session, actuales)
+        with self._lock:
+            return dict(self._versiones)
+
+    def _cargar_de_primaria(self, session, actuales):
+        # El índice es compartido por todas las peticiones del worker: se
+        # construye siempre desde la primaria, aunque la petición lea de la réplica
+        if not session.info.get("replica"):
+            self.cargar(session, actuales)
+            return
+        primaria = self.fabrica()
+        try:
+            self.cargar(primaria)
+        finally:
+            primaria.close()
+
+    def buscar(self, consulta, limite=20):
+        """Busca en el índice actual; requiere una llamada previa a `preparar`."""
+        with self._lock:
+            return self._indice.buscar(consulta, limite)
+
+    def _avanzar(self, nuevas):
+        # Solo si no hay hueco: un salto de versión indica commits de otro worker
+        for tabla, version in nuevas.items():
+            if self._versiones.get(tabla) == version - 1:
+                self._versiones[tabla] = version
+
+    def bind(self, session_factory):
+        """
+        Debe llamarse después de ChangeTracker.bind, para leer en before_commit
+        las versiones ya incrementadas por TableVersions.bump.
+        """
+        @event.listens_for(session_factory, "after_flush")
+        def _registrar(session, flush_context):
+            cambios = None
+            for obj in (*session.new, *session.dirty):
+                if getattr(obj, "__tablename__", None) in _TABLAS:
+                    cambios = session.info.setdefault(_CAMBIOS, [])
+                    cambios.append((obj.__tablename__, obj.id, _valores(obj)))
+            for obj in session.deleted:
+                if getattr(obj, "__tablename__", None) in _TABLAS:
+                    session.info.setdefault(_CAMBIOS, []).append((obj.__tablename__, obj.id, None))
+
+        @event.listens_for(session_factory, "do_orm_execute")
+        def _registrar_dml(orm_execute_state):
+            # Las escrituras masivas no pasan por el flush: se recarga el índice completo
+            if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+                mapper = orm_execute_state.bind_mapper
+                if mapper is not None and mapper.local_table.name in _TABLAS:
+                    orm_execute_state.session.info[_DML] = True
+
+        @event.listens_for(session_factory, "before_commit")
+        def _antes(session):
+            # Como en ChangeTracker, se ignoran los savepoints
+            if session.in_nested_transaction():
+                return
+            cambios = session.info.get(_CAMBIOS)
+            if cambios:
+                tablas = {tabla for tabla, _, _ in cambios}
+                modelos = [m for m in self._modelos() if m.__tablename__ in tablas]
+                session.info[_VERSIONES] = self.versiones.current_many(session, modelos)
+
+        @event.listens_for(session_factory, "after_commit")
+        def _despues(session):
+            if session.in_nested_transaction():
+                return
+            cambios = session.info.pop(_CAMBIOS, None)
+            nuevas = session.info.pop(_VERSIONES, {})
+            with self._lock:
+                if session.info.pop(_DML, False):
+                    self._obsoleto = True
+                if not cambios:
+                    return
+                for diario in self._diarios:
+                    diario.append((cambios, nuevas))
+                if self._indice is not None:
+                    self._indice.aplicar(cambios)
+                    self._avanzar(nuevas)
+
+        @event.listens_for(session_factory, "after_rollback")
+        def _descartar(session):
+            if session.in_nested_transaction():
+                return
+            for clave in (_CAMBIOS, _VERSIONES, _DML):
+                session.info.pop(clave, None)
@@ -0,0 +1,118 @@
+import json
+import os
+
+from sqlalchemy import Date, DateTime, Numeric
+
+from src.timing import fase
+
+# Backend JSON opcional: orjson si está instalado y no se desactiva por configuración
+_backend = os.getenv("API_JSON_BACKEND", "auto")
+try:
+    if _backend == "json":
+        raise ImportError
+    import orjson
+
+    def dumps(value):
+        return orjson.dumps(value).decode()
+
+    JSON_BACKEND = "orjson"
+except ImportError:
+    _encoder = json.JSONEncoder(ensure_ascii=True, separators=(", ", ": "))
+    dumps = _encoder.encode
+    JSON_BACKEND = "json"
+
+
+def _iso(value):
+    return None if value is None else value.isoformat()
+
+
+def _decimal(value):
+    return None if value is None else float(value)
+
+
+def _converter(column):
+    """Conversión necesaria para que el valor de la columna sea serializable."""
+    if isinstance(column.type, (DateTime, Date)):
+        return "_iso"
+    if isinstance(column.type, Numeric) and getattr(column.type, "asdecimal", False):
+        return "_decimal"
+    return None
+
+
+def _compile(campos, filename):
+    source = "def to_dict(obj):\n    return {" + ", ".join(campos) + "}\n"
+    namespace = {"_iso": _iso, "_decimal": _decimal}
+    exec(compile(source, filename, "exec"), namespace)
+    return namespace["to_dict"]
+
+
+def row_encoder(columns, filename="<row encoder>"):
+    """
+    Genera una función que convierte una fila de Core (tupla) en diccionario,
+    leyendo cada columna por posición en el orden de `columns`.
+    """
+    campos = []
+    for index, column in enumerate(columns):
+        conv = _converter(column)
+        campos.append(f"{column.name!r}: {conv}(obj[{index}])" if conv else f"{column.name!r}: obj[{index}]")
+    return _compile(campos, filename)
+
+
+class ModelSerializer:
+    """
+    Codificador especializado para un modelo: la lista de columnas y sus
+    conversiones se resuelven una sola vez y se genera la función to_dict.
+    """
+
+    __slots__ = ("model", "columns", "to_dict")
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = tuple(c.name for c in model.__table__.columns)
+
+        campos = []
+        for column in model.__table__.columns:
+            conv = _converter(column)
+            attr = f"obj.{column.key}" if column.key.isidentifier() else f"getattr(obj, {column.key!r})"
+            campos.append(f"{column.name!r}: {conv}({attr})" if conv else f"{column.name!r}: {attr}")
+
+        self.to_dict = _compile(campos, f"<serializer {model.__name__}>")
+
+    def dumps(self, obj):
+        return dumps(self.to_dict(obj))
+
+    def write(self, buffer, obj):
+        buffer.write(dumps(self.to_dict(obj)))
+
+
+_registry = {}
+
+
+def register(*models):
+    for model in models:
+        _registry[model] = ModelSerializer(model)
+
+
+def serializer_for(model):
+    serializer = _registry.get(model)
+    if serializer is None:
+        serializer = _registry[model] = ModelSerializer(model)
+    return serializer
+
+
+def to_dict(obj):
+    """Convierte una instancia de cualquier modelo registrado en un diccionario."""
+    if obj is None:
+        return None
+    return serializer_for(type(obj)).to_dict(obj)
+
+
+def to_json(obj):
+    """Serializa una instancia de modelo directamente a texto JSON."""
+    if obj is None:
+        return "null"
+    with fase("to_dict"):
+        value = serializer_for(type(obj)).to_dict(obj)
+    with fase("json"):
+        return dumps(value)
+
@@ -0,0 +1,385 @@
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, event, extract, func, inspect, insert, select, update
+from sqlalchemy.exc import DBAPIError
+
+from src.batch import BLOQUE_IN
+from src.db import tablas_en_replica
+from src.models.estadistica_cambio import EstadisticaCambio
+from src.models.estadistica_marca import EstadisticaMarca
+from src.models.estadistica_mensual import EstadisticaMensual
+
+# Cambios del registro que se procesan en cada refresco
+LOTE = int(os.getenv("API_STATS_BATCH", "5000"))
+
+# Agrupaciones de /stats/reservas y /stats/calificaciones, y periodos admitidos
+GRUPOS_RESERVAS = ("destino", "ciudad", "guia")
+GRUPOS_CALIFICACIONES = ("destino",)
+PERIODOS = ("mes", "anio")
+
+# Tabla de origen -> fuente del registro de cambios. Cada fuente agrupa los
+# tipos de la tabla resumen que se recalculan cuando cambia uno de sus meses
+_FUENTES = {
+    "reserva": "reserva",
+    "reserva_guia": "reserva",
+    "destino_calificacion": "calificacion",
+}
+_TIPOS = {
+    "reserva": ("reserva_destino", "reserva_guia"),
+    "calificacion": ("calificacion_destino",),
+}
+
+_CLAVE = "estadisticas_cambios"
+_MARCA = "cambios"
+
+_resumen = EstadisticaMensual.__table__
+_cambios = EstadisticaCambio.__table__
+_marca = EstadisticaMarca.__table__
+
+
+def mes(fecha):
+    """Primer instante del mes de `fecha` (None si no hay fecha)."""
+    return None if fecha is None else datetime(fecha.year, fecha.month, 1)
+
+
+def _siguiente(inicio):
+    return datetime(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+
+
+def _anterior(estado, atributo):
+    # Valor confirmado en la base antes de los cambios pendientes de este flush
+    historia = estado.attrs[atributo].history
+    if historia.deleted:
+        return historia.deleted[0]
+    if historia.unchanged:
+        return historia.unchanged[0]
+    return None
+
+
+def _ahora():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class MonthlyStats:
+    """
+    Estadísticas mensuales de reservas (por destino y por guía) y de
+    calificaciones de destinos, precalculadas en `estadistica_mensual`.
+    Cada transacción que modifica reservas, asignaciones de guías o
+    calificaciones anota en `estadistica_cambio` los meses afectados; el
+    refresco procesa los cambios pendientes del registro, recalcula esos
+    meses, los borra y actualiza la marca de `estadistica_marca`. Las
+    consultas de los dashboards leen únicamente la tabla resumen.
+    """
+
+    def __init__(self):
+        self._listas = False
+        self._en_replica = False
+
+    def _asegurar_tablas(self, connection):
+        # Igual que en TableVersions: sin lock de hilo y tolerando que otra
+        # petición cree las tablas a la vez
+        if self._listas:
+            return
+        for tabla in (_resumen, _cambios, _marca):
+            try:
+                with connection.begin_nested():
+                    tabla.create(connection, checkfirst=True)
+            except DBAPIError:
+                if not inspect(connection).has_table(tabla.name):
+                    raise
+        self._listas = True
+
+    def _legibles(self, session):
+        # Como en TableVersions: en la réplica no se ejecuta DDL y sin las tablas no hay estadísticas
+        if not session.info.get("replica"):
+            self._asegurar_tablas(session.connection())
+            return True
+        if not self._en_replica:
+            self._en_replica = tablas_en_replica(session, (_resumen, _cambios, _marca), self._asegurar_tablas)
+        return self._en_replica
+
+    # Registro de cambios
+
+    def bind(self, session_factory):
+        @event.listens_for(session_factory, "before_flush")
+        def _registrar(session, flush_context, instances):
+            pendientes = None
+            for obj, anterior, nuevo in (
+                *((obj, False, True) for obj in session.new),
+                *((obj, True, True) for obj in session.dirty if session.is_modified(obj)),
+                *((obj, True, False) for obj in session.deleted),
+            ):
+                fuente = _FUENTES.get(getattr(obj, "__tablename__", None))
+                if fuente is None:
+                    continue
+                if pendientes is None:
+                    pendientes = session.info.setdefault(_CLAVE, set())
+                estado = inspect(obj)
+                if obj.__tablename__ == "reserva_guia":
+                    # El mes es el de la reserva: se anota su id y se resuelve al
+                    # refrescar, salvo si la reserva es nueva y aún no tiene id
+                    valores = []
+                    if anterior:
+                        valores.append((None, _anterior(estado, "reserva_id")))
+                    if nuevo:
+                        reserva = obj.reserva if obj.reserva_id is None else None
+                        valores.append((mes(reserva.fecha), None) if reserva is not None else (None, obj.reserva_id))
+                else:
+                    # Las calificaciones sin fecha no cuentan en ningún mes
+                    valores = []
+                    if anterior:
+                        valores.append((mes(_anterior(estado, "fecha")), None))
+                    if nuevo:
+                        valores.append((mes(obj.fecha), None))
+                for inicio, reserva_id in valores:
+                    if inicio is not None or reserva_id is not None:
+                        pendientes.add((fuente, inicio, reserva_id))
+
+        @event.listens_for(session_factory, "do_orm_execute")
+        def _registrar_dml(orm_execute_state):
+            # Escrituras masivas: los INSERT con la fecha (o la reserva) en los
+            # parámetros anotan sus meses; el resto obliga a recalcular la fuente
+            if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+                return
+            mapper = orm_execute_state.bind_mapper
+            fuente = _FUENTES.get(mapper.local_table.name) if mapper is not None else None
+            if fuente is None:
+                return
+            pendientes = orm_execute_state.session.info.setdefault(_CLAVE, set())
+            filas = orm_execute_state.parameters
+            filas = filas if isinstance(filas, list) else [filas] if filas else []
+            campo = "reserva_id" if mapper.local_table.name == "reserva_guia" else "fecha"
+            if orm_execute_state.is_insert and filas and all(campo in fila for fila in filas):
+                for fila in filas:
+                    if fila[campo] is None:
+                        continue
+                    if campo == "fecha":
+                        pendientes.add((fuente, mes(fila["fecha"]), None))
+                    else:
+                        pendientes.add((fuente, None, fila["reserva_id"]))
+            else:
+                pendientes.add((fuente, None, None))
+
+        @event.listens_for(session_factory, "before_commit")
+        def _guardar(session):
+            # Como en ChangeTracker, los savepoints no cuentan
+            if session.in_nested_transaction():
+                return
+            session.flush()
+            pendientes = session.info.pop(_CLAVE, None)
+            if pendientes:
+                # Por la conexión, como TableVersions, para no disparar eventos de la sesión
+                connection = session.connection()
+                self._asegurar_tablas(connection)
+                connection.execute(insert(_cambios), [
+                    {"fuente": fuente, "mes": inicio, "reserva_id": reserva_id}
+                    for fuente, inicio, reserva_id in sorted(pendientes, key=repr)
+                ])
+
+        @event.listens_for(session_factory, "after_rollback")
+        def _descartar(session):
+            if session.in_nested_transaction():
+                return
+            session.info.pop(_CLAVE, None)
+
+    # Refresco incremental
+
+    def refrescar(self, session, lote=LOTE):
+        """
+        Procesa hasta `lote` cambios del registro: recalcula los meses
+        afectados de cada fuente, borra esos cambios y actualiza la marca,
+        todo en la transacción de `session`. La primera vez (sin marca)
+        calcula el resumen completo. Devuelve el número de cambios procesados.
+
+        No se filtra por id > marca: los ids se asignan al insertar y una
+        transacción con un id menor puede confirmarse después de que se
+        procese uno mayor. Como se borran exactamente los cambios procesados,
+        el registro solo contiene los pendientes, lleguen en el orden que lleguen.
+        """
+        from src import models
+
+        connection = session.connection()
+        self._asegurar_tablas(connection)
+        marca = connection.execute(select(_marca.c.cambio_id).where(_marca.c.nombre == _MARCA)).scalar()
+
+        if marca is None:
+            # Los cambios ya anotados se quedan en el registro: procesarlos
+            # después solo repite el cálculo de sus meses
+            ultimo = connection.execute(select(func.max(_cambios.c.id))).scalar() or 0
+            for fuente in _TIPOS:
+                self._recalcular(connection, fuente, None)
+            connection.execute(insert(_marca).values(nombre=_MARCA, cambio_id=ultimo, actualizado=_ahora()))
+            return 0
+
+        filas = connection.execute(
+            select(_cambios.c.id, _cambios.c.fuente, _cambios.c.mes, _cambios.c.reserva_id)
+            .order_by(_cambios.c.id)
+            .limit(lote)
+        ).all()
+        if not filas:
+            connection.execute(update(_marca).where(_marca.c.nombre == _MARCA).values(actualizado=_ahora()))
+            return 0
+
+        meses = defaultdict(set)
+        completas = set()
+        reservas = set()
+        for _, fuente, inicio, reserva_id in filas:
+            if inicio is not None:
+                meses[fuente].add(inicio)
+            elif reserva_id is not None:
+                reservas.add(reserva_id)
+            else:
+                completas.add(fuente)
+        if reservas:
+            reserva = models.Reserva
+            fechas = connection.execute(select(reserva.fecha).where(reserva.id.in_(sorted(reservas)))).scalars()
+            meses["reserva"].update(mes(fecha) for fecha in fechas)
+
+        for fuente in _TIPOS:
+            if fuente in completas:
+                self._recalcular(connection, fuente, None)
+            else:
+                for inicio in sorted(meses.get(fuente, ())):
+                    self._recalcular(connection, fuente, inicio)
+
+        # La marca solo distingue versiones del resumen (ETag): nunca retrocede
+        ids = [fila[0] for fila in filas]
+        connection.execute(
+            update(_marca).where(_marca.c.nombre == _MARCA)
+            .values(cambio_id=max(marca, ids[-1]), actualizado=_ahora())
+        )
+        self._purgar(connection, ids)
+        return len(filas)
+
+    def _purgar(self, connection, ids):
+        # Por ids exactos y no por rango: un DELETE por rango esperaría a un
+        # cambio aún sin confirmar dentro del rango y lo borraría sin procesarlo
+        for i in range(0, len(ids), BLOQUE_IN):
+            connection.execute(delete(_cambios).where(_cambios.c.id.in_(ids[i:i + BLOQUE_IN])))
+
+    def _recalcular(self, connection, fuente, inicio):
+        """Recalcula los tipos de `fuente` en el mes que empieza en `inicio` (None: todos los meses)."""
+        from src import models
+
+        condicion = _resumen.c.tipo.in_(_TIPOS[fuente])
+        if inicio is not None:
+            condicion = condicion & (_resumen.c.mes == inicio)
+        connection.execute(delete(_resumen).where(condicion))
+
+        if fuente == "reserva":
+            reserva, asignacion = models.Reserva.__table__, models.ReservaGuia.__table__
+            consultas = [
+                ("reserva_destino", reserva.c.fecha, reserva.c.destino_id, (func.count(),), reserva, ()),
+                ("reserva_guia", reserva.c.fecha, asignacion.c.guia_id, (func.count(),),
+                 asignacion.join(reserva, reserva.c.id == asignacion.c.reserva_id), ()),
+            ]
+        else:
+            calificacion = models.DestinoCalificacion.__table__
+            valor = calificacion.c.calificacion
+            consultas = [
+                ("calificacion_destino", calificacion.c.fecha, calificacion.c.destino_id,
+                 (func.count(valor), func.sum(valor)), calificacion,
+                 (valor.is_not(None), calificacion.c.destino_id.is_not(None))),
+            ]
+
+        for tipo, fecha, entidad, agregados, origen, filtros in consultas:
+            # Se agrupa por año y mes en SQL: extract() se traduce a DATEPART en
+            # SQL Server y a STRFTIME en SQLite. Con `inicio` la consulta lee
+            # solo ese mes por el índice de la fecha
+            anio, numero = extract("year", fecha), extract("month", fecha)
+            stmt = select(entidad, anio, numero, *agregados).select_from(origen).where(*filtros)
+            if inicio is not None:
+                stmt = stmt.where(fecha >= inicio, fecha < _siguiente(inicio))
+            else:
+                stmt = stmt.where(fecha.is_not(None))
+            stmt = stmt.group_by(entidad, anio, numero)
+
+            filas = [
+                {
+                    "tipo": tipo, "entidad_id": fila[0], "mes": datetime(int(fila[1]), int(fila[2]), 1),
+                    "cantidad": fila[3], "suma": (fila[4] or 0.0) if len(fila) > 4 else 0.0,
+                }
+                for fila in connection.execute(stmt)
+            ]
+            if filas:
+                connection.execute(insert(_resumen), sorted(filas, key=lambda f: (f["entidad_id"], f["mes"])))
+
+    # Consultas
+
+    def marca(self, session):
+        """(id del último cambio procesado, fecha del último refresco); (0, None) si aún no se ha refrescado."""
+        if not self._legibles(session):
+            return 0, None
+        fila = session.connection().execute(
+            select(_marca.c.cambio_id, _marca.c.actualizado).where(_marca.c.nombre == _MARCA)
+        ).first()
+        return (fila[0], fila[1]) if fila is not None else (0, None)
+
+    def _leer(self, session, tipo, agrupar, periodo, desde, hasta):
+        """
+        Filas (periodo, id, nombre, cantidad, suma) de la tabla resumen. La
+        ciudad se obtiene uniendo el resumen por destino con destino (una fila
+        por destino y mes, nunca las reservas); el año se agrega aquí.
+        """
+        from src import models
+
+        c = _resumen.c
+        if agrupar == "guia":
+            entidad = models.Guia
+            stmt = select(entidad.id, entidad.nombre).join_from(_resumen, entidad, entidad.id == c.entidad_id)
+        elif agrupar == "destino":
+            entidad = models.Destino
+            stmt = select(entidad.id, entidad.nombre).join_from(_resumen, entidad, entidad.id == c.entidad_id)
+        else:
+            destino, entidad = models.Destino, models.Ciudad
+            stmt = (
+                select(entidad.id, entidad.nombre)
+                .join_from(_resumen, destino, destino.id == c.entidad_id)
+                .join(entidad, entidad.id == destino.ciudad_id)
+            )
+        stmt = (
+            stmt.add_columns(c.mes, func.sum(c.cantidad), func.sum(c.suma))
+            .where(c.tipo == tipo)
+            .group_by(c.mes, entidad.id, entidad.nombre)
+            .order_by(c.mes, entidad.id)
+        )
+        if desde is not None:
+            stmt = stmt.where(c.mes >= mes(desde))
+        if hasta is not None:
+            stmt = stmt.where(c.mes <= mes(hasta))
+
+        formato = "%Y-%m" if periodo == "mes" else "%Y"
+        acumulado = {}
+        for id, nombre, inicio, cantidad, suma in session.connection().execute(stmt):
+            clave = (inicio.strftime(formato), id)
+            if clave in acumulado:
+                acumulado[clave][3] += cantidad
+                acumulado[clave][4] += suma
+            else:
+                acumulado[clave] = [clave[0], id, nombre, cantidad, suma]
+        return sorted(acumulado.values(), key=lambda fila: (fila[0], fila[1]))
+
+    def reservas(self, session, agrupar, periodo, desde=None, hasta=None):
+        """Reservas por destino, ciudad o guía en cada mes o año entre `desde` y `hasta` (incluidos)."""
+        if not self._legibles(session):
+            return []
+        tipo = "reserva_guia" if agrupar == "guia" else "reserva_destino"
+        return [
+            {"periodo": periodo_, "id": id, "nombre": nombre, "reservas": cantidad}
+            for periodo_, id, nombre, cantidad, _ in self._leer(session, tipo, agrupar, periodo, desde, hasta)
+        ]
+
+    def calificaciones(self, session, agrupar, periodo, desde=None, hasta=None):
+        """Cantidad y media de las calificaciones por destino en cada mes o año."""
+        if not self._legibles(session):
+            return []
+        return [
+            {
+                "periodo": periodo_, "id": id, "nombre": nombre, "cantidad": cantidad,
+                "promedio": round(suma / cantidad, 3) if cantidad else None,
+            }
+            for periodo_, id, nombre, cantidad, suma
+            in self._leer(session, "calificacion_destino", agrupar, periodo, desde, hasta)
+        ]
@@ -0,0 +1,221 @@
+import functools
+import inspect
+import json
+import logging
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+# Logger de la línea estructurada por petición; en Application Insights se
+# consulta con parse_json(message) sobre la tabla traces
+logger = logging.getLogger("turismo.peticiones")
+
+# Fases que se informan, en el orden del header Server-Timing. El tiempo que
+# no cae en ninguna otra fase se atribuye a "app" (validación, lógica, caché)
+FASES = ("conn", "db", "fetch", "to_dict", "json", "compress", "app")
+
+_DESCRIPCIONES = {
+    "conn": "apertura de conexiones",
+    "db": "ejecución SQL",
+    "fetch": "lectura de filas e hidratación ORM",
+    "to_dict": "conversión a dict",
+    "json": "codificación JSON o msgpack",
+    "compress": "compresión de la respuesta",
+    "app": "resto del handler",
+}
+
+_actual = ContextVar("medicion", default=None)
+
+
+class Medicion:
+    """
+    Tiempos exclusivos por fase de una petición: al entrar en una fase se
+    detiene la que estaba activa, de modo que las fases anidadas (p. ej. SQL
+    lanzado por selectinload mientras se leen filas) no se cuentan dos veces.
+    """
+
+    __slots__ = ("fases", "pila", "marca", "inicio", "sentencias", "filas")
+
+    def __init__(self):
+        self.fases = dict.fromkeys(FASES, 0.0)
+        self.pila = ["app"]
+        self.inicio = self.marca = time.perf_counter()
+        self.sentencias = 0
+        self.filas = 0
+
+    def entrar(self, nombre):
+        ahora = time.perf_counter()
+        self.fases[self.pila[-1]] += ahora - self.marca
+        self.pila.append(nombre)
+        self.marca = ahora
+
+    def salir(self, nombre):
+        if len(self.pila) < 2 or self.pila[-1] != nombre:
+            return
+        ahora = time.perf_counter()
+        self.fases[self.pila.pop()] += ahora - self.marca
+        self.marca = ahora
+
+    def terminar(self):
+        while len(self.pila) > 1:
+            self.salir(self.pila[-1])
+        ahora = time.perf_counter()
+        self.fases["app"] += ahora - self.marca
+        self.marca = ahora
+        return ahora - self.inicio
+
+    def server_timing(self, total):
+        metricas = [
+            f'{nombre};dur={segundos * 1000:.2f};desc="{_DESCRIPCIONES[nombre]}"'
+            for nombre, segundos in self.fases.items() if segundos
+        ]
+        metricas.append(f'sql;desc="{self.sentencias} sentencias"')
+        metricas.append(f'filas;desc="{self.filas}"')
+        metricas.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(metricas)
+
+
+class fase:
+    """Context manager que atribuye el tiempo del bloque a `nombre` si hay una medición activa."""
+
+    __slots__ = ("nombre", "medicion")
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.medicion = _actual.get()
+
+    def __enter__(self):
+        if self.medicion is not None:
+            self.medicion.entrar(self.nombre)
+        return self
+
+    def __exit__(self, *exc):
+        if self.medicion is not None:
+            self.medicion.salir(self.nombre)
+
+
+def contar_filas(n):
+    medicion = _actual.get()
+    if medicion is not None:
+        medicion.filas += n
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    medicion = _actual.get()
+    if medicion is not None:
+        medicion.sentencias += 1
+        medicion.entrar("db")
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _despues_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    medicion = _actual.get()
+    if medicion is not None:
+        medicion.salir("db")
+        # Filas afectadas por DML; con RETURNING el rowcount no es fiable y se cuentan las filas devueltas
+        if cursor.description is None and context is not None and (context.isinsert or context.isupdate or context.isdelete):
+            medicion.filas += max(cursor.rowcount, 0)
+
+
+@event.listens_for(Engine, "handle_error")
+def _error_de_ejecucion(exception_context):
+    medicion = _actual.get()
+    if medicion is not None:
+        medicion.salir("db")
+        medicion.salir("conn")
+
+
+# Solo se mide la apertura de conexiones nuevas (driver ODBC, TLS, login); el
+# checkout de una conexión ya abierta del pool queda dentro de "app"
+@event.listens_for(Engine, "do_connect")
+def _antes_de_conectar(dialect, conn_rec, cargs, cparams):
+    medicion = _actual.get()
+    if medicion is not None:
+        medicion.entrar("conn")
+
+
+@event.listens_for(Pool, "connect")
+def _conectado(dbapi_connection, connection_record):
+    medicion = _actual.get()
+    if medicion is not None:
+        medicion.salir("conn")
+
+
+def _log(nombre, req, status, medicion, total):
+    logger.info(json.dumps({
+        "funcion": nombre,
+        "metodo": req.method,
+        "url": str(req.url),
+        "status": status,
+        "total_ms": round(total * 1000, 3),
+        **{f"{clave}_ms": round(segundos * 1000, 3) for clave, segundos in medicion.fases.items()},
+        "sentencias": medicion.sentencias,
+        "filas": medicion.filas,
+    }))
+
+
+def _registrar(nombre, req, respuesta, medicion, total):
+    respuesta.headers["Server-Timing"] = medicion.server_timing(total)
+    _log(nombre, req, respuesta.status_code, medicion, total)
+
+
+async def _medir_cuerpo(nombre, req, respuesta, cuerpo, medicion):
+    # El cuerpo de una StreamingResponse (y sus consultas) se genera después de
+    # volver del handler: cada bloque se produce con la medición activa y la
+    # línea de log se emite al terminar. Las cabeceras ya se enviaron, así
+    # que estas respuestas no llevan Server-Timing
+    iterador = cuerpo.__aiter__()
+    try:
+        while True:
+            token = _actual.set(medicion)
+            try:
+                bloque = await iterador.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                _actual.reset(token)
+            yield bloque
+    finally:
+        _log(nombre, req, respuesta.status_code, medicion, medicion.terminar())
+
+
+def medido(handler):
+    """
+    Envuelve un handler HTTP (síncrono o async): mide sus fases, añade el
+    header Server-Timing a la respuesta y emite una línea de log JSON. En las
+    respuestas en streaming la medición incluye la generación del cuerpo y
+    solo se registra en el log.
+    """
+    nombre = handler.__name__
+
+    if inspect.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def envoltorio(req):
+            medicion = Medicion()
+            token = _actual.set(medicion)
+            try:
+                respuesta = await handler(req)
+            finally:
+                _actual.reset(token)
+            if hasattr(respuesta, "body_iterator"):
+                respuesta.body_iterator = _medir_cuerpo(nombre, req, respuesta, respuesta.body_iterator, medicion)
+                return respuesta
+            _registrar(nombre, req, respuesta, medicion, medicion.terminar())
+            return respuesta
+    else:
+        @functools.wraps(handler)
+        def envoltorio(req):
+            medicion = Medicion()
+            token = _actual.set(medicion)
+            try:
+                respuesta = handler(req)
+            finally:
+                _actual.reset(token)
+            _registrar(nombre, req, respuesta, medicion, medicion.terminar())
+            return respuesta
+
+    return envoltorio
@@ -0,0 +1,114 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, Integer, Numeric, String
+
+
+def _fecha(campo, value):
+    try:
+        return datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise ValueError(f"Formato de fecha inválido en '{campo}'")
+
+
+def _entero(campo, value):
+    if isinstance(value, bool):
+        raise ValueError(f"El campo '{campo}' debe ser un entero")
+    if isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        raise ValueError(f"El campo '{campo}' debe ser un entero")
+
+
+def _numero(campo, value):
+    if isinstance(value, bool):
+        raise ValueError(f"El campo '{campo}' debe ser numérico")
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        raise ValueError(f"El campo '{campo}' debe ser numérico")
+
+
+def _texto(longitud):
+    def coerce(campo, value):
+        if not isinstance(value, str):
+            raise ValueError(f"El campo '{campo}' debe ser texto")
+        if longitud is not None and len(value) > longitud:
+            raise ValueError(f"El campo '{campo}' supera los {longitud} caracteres")
+        return value
+    return coerce
+
+
+def _coercer(column):
+    tipo = column.type
+    if isinstance(tipo, DateTime):
+        return _fecha
+    if isinstance(tipo, Integer):
+        return _entero
+    if isinstance(tipo, (Float, Numeric)):
+        return _numero
+    if isinstance(tipo, String):
+        return _texto(tipo.length)
+    return None
+
+
+def _requerido(column):
+    if column.nullable or column.default is not None or column.server_default is not None:
+        return False
+    # Las claves primarias enteras simples las genera la base de datos
+    return not (column.primary_key and column.autoincrement in (True, "auto") and isinstance(column.type, Integer))
+
+
+class Validator:
+    """
+    Validación precompilada de un modelo: los conjuntos de columnas, los
+    campos obligatorios y la conversión de cada tipo se calculan una sola vez,
+    de modo que validar un cuerpo JSON cuesta O(campos recibidos).
+    """
+
+    __slots__ = ("model", "columnas", "actualizables", "requeridos", "coercers", "referencias")
+
+    def __init__(self, model):
+        table = model.__table__
+        self.model = model
+        self.columnas = frozenset(c.name for c in table.columns)
+        self.actualizables = self.columnas - frozenset(c.name for c in table.primary_key.columns)
+        self.requeridos = frozenset(c.name for c in table.columns if _requerido(c))
+        self.coercers = {c.name: _coercer(c) for c in table.columns if _coercer(c) is not None}
+        # Columna FK -> columna referenciada, para validar existencia antes del INSERT
+        self.referencias = {
+            c.name: next(iter(c.foreign_keys)).column
+            for c in table.columns if len(c.foreign_keys) == 1
+        }
+
+    def crear(self, data):
+        """Valida un alta: descarta claves desconocidas y exige los campos obligatorios."""
+        return self._validar(data, self.columnas, completo=True)
+
+    def actualizar(self, data):
+        """Valida una actualización parcial; la clave primaria no se puede modificar."""
+        return self._validar(data, self.actualizables, completo=False)
+
+    def _validar(self, data, permitidos, completo):
+        if not isinstance(data, dict):
+            raise ValueError("Se esperaba un objeto JSON")
+
+        coercers = self.coercers
+        datos = {}
+        for key, value in data.items():
+            if key not in permitidos:
+                continue
+            if value is None:
+                if key in self.requeridos:
+                    raise ValueError(f"El campo '{key}' es obligatorio")
+                datos[key] = None
+                continue
+            coerce = coercers.get(key)
+            datos[key] = coerce(key, value) if coerce else value
+
+        if completo and not self.requeridos <= datos.keys():
+            faltante = min(self.requeridos - datos.keys())
+            raise ValueError(f"El campo '{faltante}' es obligatorio")
+
+        return datos
@@ -0,0 +1,100 @@
+import hashlib
+
+from sqlalchemy import inspect, insert, select, update
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+from src.db import tablas_en_replica
+from src.models.tabla_version import TablaVersion
+
+_tabla = TablaVersion.__table__
+
+
+class TableVersions:
+    """
+    Marcador de versión por tabla, guardado en `tabla_version` e incrementado
+    en la misma transacción que modifica la tabla. Leerlo es una búsqueda por
+    clave primaria, mucho más barata que serializar y hashear el listado.
+    """
+
+    def __init__(self):
+        self._lista = False
+        self._en_replica = False
+
+    def _asegurar_tabla(self, connection):
+        # Sin lock de hilo: con AsyncSession la consulta cede el event loop y el
+        # lock bloquearía a las demás corrutinas. Si dos peticiones la crean a
+        # la vez, la segunda falla dentro de su savepoint y se ignora.
+        if self._lista:
+            return
+        try:
+            with connection.begin_nested():
+                _tabla.create(connection, checkfirst=True)
+        except DBAPIError:
+            if not inspect(connection).has_table(_tabla.name):
+                raise
+        self._lista = True
+
+    def _legible(self, session):
+        # En la réplica no se ejecuta DDL; sin la tabla todas las versiones son 0
+        if not session.info.get("replica"):
+            self._asegurar_tabla(session.connection())
+            return True
+        if not self._en_replica:
+            self._en_replica = tablas_en_replica(session, (_tabla,), self._asegurar_tabla)
+        return self._en_replica
+
+    def current(self, session, model):
+        if not self._legible(session):
+            return 0
+        version = session.connection().execute(
+            select(_tabla.c.version).where(_tabla.c.tabla == model.__tablename__)
+        ).scalar()
+        return version or 0
+
+    def current_many(self, session, models):
+        """Versiones de varias tablas en una sola consulta: {tabla: version}."""
+        nombres = sorted({m.__tablename__ for m in models})
+        if not self._legible(session):
+            return dict.fromkeys(nombres, 0)
+        filas = dict(session.connection().execute(
+            select(_tabla.c.tabla, _tabla.c.version).where(_tabla.c.tabla.in_(nombres))
+        ).all())
+        return {nombre: filas.get(nombre) or 0 for nombre in nombres}
+
+    def bump(self, session, models):
+        # Se usa la conexión directamente para no disparar los eventos de la
+        # sesión. Se ejecuta en before_commit, así que el bloqueo de cada fila
+        # se mantiene solo durante la confirmación; el orden fijo evita interbloqueos
+        connection = session.connection()
+        self._asegurar_tabla(connection)
+        for nombre in sorted({m.__tablename__ for m in models}):
+            self._incrementar(connection, nombre)
+
+    def _incrementar(self, connection, nombre):
+        incremento = update(_tabla).where(_tabla.c.tabla == nombre).values(version=_tabla.c.version + 1)
+        if connection.execute(incremento).rowcount:
+            return
+        # Primera escritura de la tabla: si otra transacción inserta la fila a
+        # la vez, este INSERT falla por la clave duplicada dentro de su
+        # savepoint y se repite el UPDATE sobre la fila que ya existe
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(_tabla).values(tabla=nombre, version=1))
+        except IntegrityError:
+            connection.execute(incremento)
+
+def etag(model, version, *variantes):
+    """ETag fuerte a partir de la tabla, su versión y lo que distingue a la representación."""
+    huella = hashlib.blake2b(repr(variantes).encode(), digest_size=8).hexdigest()
+    return f'"{model.__tablename__}-{version}-{huella}"'
+
+
+def if_none_match(header, valor):
+    """Comprueba si `valor` aparece en la cabecera If-None-Match (comparación débil)."""
+    if not header:
+        return False
+    for candidato in header.split(","):
+        candidato = candidato.strip()
+        if candidato == "*" or candidato.removeprefix("W/") == valor:
+            return True
+    return False